@@ -169,7 +169,7 @@ def add_phase_errors_and_noise(noiseless_vis,noisy_vis,outputvis,amp,velocity,Mo
                 
                 # and now get the phase calibration, if requested
                 if Mock_cal ==True:
-                    Pcor1 , Pcor2 = Mock_phase_calibration(antennaphases,ant1,ant2,pwv_mean,proportional_error)
+                    Pcor1 , Pcor2 = Mock_phase_calibration(antennaphases,ant1,ant2,pwv_mean,proportional_error,randseed)
                 
             # Before applying the phase errors, lets subtract the noiseless visibilities from the noisy ones to get the noise
             ms.open(noisy_vis)
@@ -212,104 +212,12 @@ def ms_to_bin(MeasurementSet,outputdir):
     This code takes a measurement set, goes through its contents, and spits the 
     result out into the correct Ripples files in the location specified by filename_prefix
     
-    It also calculates and applies the noise scaling, 
+    It also calculates and applies the noise scaling.  Each spw is read once, and
+    the channels are streamed to the output files (see stream_ms_to_bin).
     '''
     
-    # link to metadata (gives us spw and channel information)
-    msmd.open(MeasurementSet)
-    
-    # get number of spw
-    NSPW      = msmd.nspw()
-    
-    # have to count channels in a weird way, just in case
-    channel = 0
-    
-    for i in range(NSPW):  # Iterate over spectral windows.
-        
-        NCHAN = msmd.nchan(i)
-        chan_freqs = msmd.chanfreqs(i)
-        
-        for j in range(NCHAN):  # Iterate over channels.
-        
-            ms.open(MeasurementSet)
-            ms.msselect({'spw':str(i)})
-            
-            # get desired data
-            freqij = chan_freqs[j]
-            uij    = ms.getdata("UVW")["uvw"][0] * freqij / (3.*10**8)
-            vij    = ms.getdata("UVW")["uvw"][1] * freqij / (3.*10**8)
-            visij  = ms.getdata("data")["data"][:,j,:]
-            sigmaij= ms.getdata("sigma")["sigma"]
-            ant1ij = ms.getdata("antenna1")["antenna1"]
-            ant2ij = ms.getdata("antenna2")["antenna2"]
-            timeij = ms.getdata("time")["time"]
-            
-            ms.close()
-            
-            # average the polarizations (weighted by noise to tease out the signal a bit better)
-            visij   = np.average(visij,weights = sigmaij**-2.,axis=0) 
-            sigmaij = np.sum(sigmaij**-2.,axis=0)**-0.5
-            
-            
-            
-            # scale the noise
-            sigmaij /= get_sigma_scaling(uij/(freqij / (3.*10**8)),vij/(freqij / (3.*10**8)),visij,sigmaij) 
-            
-            # Build dOdp if need be (might not even use it)
-            # Build_dOdp(ant1,ant2,time,NUM_PHASE_PARS)  # function not written yet
-            
-            # build up the full data files
-            if (i==0) & (j==0):
-                vis   = np.copy(  visij  )
-                u     = np.copy(   uij   )
-                v     = np.copy(   vij   )
-                sigma = np.copy( sigmaij )
-                ant1  = np.copy(  ant1ij )
-                ant2  = np.copy(  ant2ij )
-                time  = np.copy(  timeij )
-                chan  = np.zeros(len(uij))
-                
-            else:
-                vis   = np.append(vis   ,   visij)
-                u     = np.append(u     ,     uij)
-                v     = np.append(v     ,     vij)
-                sigma = np.append(sigma , sigmaij)
-                ant1  = np.append(ant1  ,  ant1ij)
-                ant2  = np.append(ant2  ,  ant2ij)
-                time  = np.append(time  ,  timeij)
-                chan  = np.append(chan  ,  channel *np.ones(len(uij)))
-               
-            channel += 1
-            
-    # if outputdir doesn't exist, make it
-    # Should be mkdirs but CASA doesnt have that....
-    if not os.path.exists(outputdir):
-        os.mkdir(outputdir)
-        
-    # Get vis and sigma into all real (Ripples) format
-    Vis = np.zeros(2*len(vis))
-    Sigma=np.zeros(2*len(sigma))
-    Vis[::2]    = vis.real
-    Vis[1::2]   = vis.imag
-    Sigma[::2]  = sigma**-2.
-    Sigma[1::2] = sigma**-2.
-    
-    # Build the DOdPhase matrix (this is for older versions of Ripples)
-    ROWisone , COLisone , ROWisminusone , COLisminusone = Build_dOdp(ant1,ant2,time,NUM_TIME_STEPS)
-    
-    # write everything to binary files
-    write_binary(Vis , outputdir+"vis_chan_0.bin")
-    write_binary(u ,            outputdir+"u.bin")
-    write_binary(v ,            outputdir+"v.bin")
-    write_binary(Sigma,outputdir+"sigma_squared_inv.bin")
-    write_binary(ant1,       outputdir+"ant1.bin")
-    write_binary(ant2,       outputdir+"ant2.bin")
-    write_binary(time,       outputdir+"time.bin")
-    write_binary(chan,       outputdir+"chan.bin")
-    write_binary(ROWisone,   outputdir+"ROWisone.bin")
-    write_binary(COLisone,   outputdir+"COLisone.bin")
-    write_binary(ROWisminusone, outputdir+"ROWisminusone.bin")
-    write_binary(COLisminusone, outputdir+"COLisminusone.bin")
+    reader = evil.CasaToolReader(MeasurementSet,ms,msmd)
+    stream_ms_to_bin(reader,outputdir,NUM_TIME_STEPS)
 
 
 # ========================================================================
@@ -332,22 +240,22 @@ if __name__ == '__main__':
     
     print("Starting the lensing simulation")
     
-    # seed the random variable
-    np.random.seed(lens_seed)
+    # the mock parameters have their own stream of lens_seed (no global reseeding)
+    rng = evil.random_stream(lens_seed,'mock_parameters')
     
     # Generate the lens parameters (even those we won't use)
-    Gamma= (np.random.random()*(gamma_range[1]-gamma_range[0])+gamma_range[0])*(1-SIE)+float(SIE)
-    logM = np.random.random()*(mass_range[1]-mass_range[0]) + mass_range[0]
-    elp  = np.random.random()*(elp_range[1] -elp_range[0] ) + elp_range[0]
-    angle= np.random.random()*(ang_range[1] -ang_range[0] ) + ang_range[0]
-    xl   = np.random.random()*( x_range[1]  -  x_range[0] ) + x_range[0]
-    yl   = np.random.random()*( y_range[1]  -  y_range[0] ) + y_range[0]
-    g1   = np.random.random()*(shear_range[0]-shear_range[1])+shear_range[0]
-    g2   = np.random.random()*(shear_range[0]-shear_range[1])+shear_range[0]
-    A3   = np.random.random()*(mult_range[0]-mult_range[1]) + mult_range[0]
-    B3   = np.random.random()*(mult_range[0]-mult_range[1]) + mult_range[0]
-    A4   = np.random.random()*(mult_range[0]-mult_range[1]) + mult_range[0]
-    B4   = np.random.random()*(mult_range[0]-mult_range[1]) + mult_range[0]
+    Gamma= (rng.random()*(gamma_range[1]-gamma_range[0])+gamma_range[0])*(1-SIE)+float(SIE)
+    logM = rng.random()*(mass_range[1]-mass_range[0]) + mass_range[0]
+    elp  = rng.random()*(elp_range[1] -elp_range[0] ) + elp_range[0]
+    angle= rng.random()*(ang_range[1] -ang_range[0] ) + ang_range[0]
+    xl   = rng.random()*( x_range[1]  -  x_range[0] ) + x_range[0]
+    yl   = rng.random()*( y_range[1]  -  y_range[0] ) + y_range[0]
+    g1   = rng.random()*(shear_range[0]-shear_range[1])+shear_range[0]
+    g2   = rng.random()*(shear_range[0]-shear_range[1])+shear_range[0]
+    A3   = rng.random()*(mult_range[0]-mult_range[1]) + mult_range[0]
+    B3   = rng.random()*(mult_range[0]-mult_range[1]) + mult_range[0]
+    A4   = rng.random()*(mult_range[0]-mult_range[1]) + mult_range[0]
+    B4   = rng.random()*(mult_range[0]-mult_range[1]) + mult_range[0]
     
     # create the lens
     lens = evil.PowerKappa(zlens,zsrc)
@@ -362,14 +270,14 @@ if __name__ == '__main__':
         lens.source.setup_grid(NX=160,NY=160,pixscale=0.00625)  # need crazy hi-res grid because of magnification
         
         # I have found that these control parameters for the source seem to produce good images
-        Nclumps = np.random.randint(1,5)
-        Nsubclumps = np.random.randint(100,500)
+        Nclumps = rng.integers(1,5)
+        Nsubclumps = rng.integers(100,500)
         xs = 0.0
         ys = 0.0
-        qs = np.random.random()*0.7+0.3
-        phi_s = np.random.random()*np.pi
-        r_hl_s = np.random.random()*0.03+0.02
-        n_src = np.random.random()*0.75+0.25
+        qs = rng.random()*0.7+0.3
+        phi_s = rng.random()*np.pi
+        r_hl_s = rng.random()*0.03+0.02
+        n_src = rng.random()*0.75+0.25
         
         # Create the source image
         lens.source.build_sersic_clumps(Nnuclei=Nclumps,NclumpsPerNucleus=Nsubclumps,\
@@ -383,7 +291,7 @@ if __name__ == '__main__':
     lens.source.beta_y *= source_scale
     
     # shift center position of source grid (and thus, the position of the source)
-    source_grid_center = np.random.random(2)*(source_grid_center_range[1]-source_grid_center_range[0])+source_grid_center_range[0]
+    source_grid_center = rng.random(2)*(source_grid_center_range[1]-source_grid_center_range[0])+source_grid_center_range[0]
     lens.source.beta_x += source_grid_center[0]
     lens.source.beta_y += source_grid_center[1]
     
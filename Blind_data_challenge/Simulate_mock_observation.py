@@ -0,0 +1,80 @@
+'''
+A script that generates mock ALMA observations of gravitational lenses
+(including time variable phase errors, and their calibration) without CASA.
+
+This is the pure python counterpart of Simulate_ALMA_Observation.py.  Instead
+of simobserve, the uv tracks are made from the Earth rotation of the antenna
+configuration, and the visibilities are predicted with a non-uniform FFT
+(see evillens.mock_pipeline).  The uv tracks are computed once, and are
+reused by every dataset, so many datasets can be made in one run.
+
+Users are advised to only edit the blocks of arguments below.  Each dataset
+is written to its own folder of binary files for the Ripples pipeline, with a
+subfolder (Top_secret) containing the blinded parameters.  The subfolder
+should not be examined unless a user is ready to deblind.
+
+usage:  python Simulate_mock_observation.py
+'''
+
+import numpy as np
+import sys
+import time
+import evillens as evil
+from evillens.mock_pipeline import *
+
+
+# ----------------- lens simulation Arguments ----------------- #
+
+zlens       = 0.14                          # lens redshift
+zsrc        = 4.0                           # source redshift
+SIE = True                                  # if false, a gamma will be randomly chosen, otherwise gamma = 1
+Multipoles = False                          # if false, just add shear.  Otherwise add m = 3 and m = 4 multipoles.
+
+# lens grid parameters
+NX_lens = 160
+NY_lens = 160
+pixscale_lens = 0.025
+
+# random seeds (one dataset per seed)
+seeds = range(48214,48214+10)
+
+# ------------------ Observation Arguments -------------------- #
+
+antennaconfig = 'alma.cycle2.7.cfg'         # ALMA observing configuration (path to the .cfg file)
+declination = np.deg2rad(-50.0)             # declination of the source
+hour_angle_range = [-np.pi/720,np.pi/720]   # hour angles at the start and end (here, 1 minute)
+integration_time = 6.0                      # Time for single ALMA integration (seconds)
+chanfreqs = [295.0e9]                       # channel frequencies (Hz)
+Flux = 0.15                                 # Flux (in Jy)
+noise_rms = 1.0e-3                          # noise of each visibility (in Jy)
+
+# ----------------- Phase Error Sim Arguments ----------------- #
+
+add_phase_errors = True                     # if false, can ignore all other args here
+Mock_calibration = True                     # if True, a Mock ALMA WVR calibration is used
+wind_speed=6.0                              # velocity of the phase screen (in m/s)
+Phase_amp=100.0                             # amplitude of the phase screen (in degrees)
+pwvmean = 0.001                             # mean pwv column height (in meters... used in phase calibration)
+proportional_error = 0.1                    # proportional error of WVR calibration (ALMA spec is 2%)
+NUM_TIME_STEPS = 1                          # Number of time intervals to use in Ripples phase calibration
+
+# output directory
+outputroot = 'Mock/'
+
+# ------------------------------------------------------------- #
+
+if __name__ == '__main__':
+
+    observation = MockObservation(antennaconfig,declination,hour_angle_range,integration_time,chanfreqs, \
+                                  noise_rms,Flux,add_phase_errors,Mock_calibration,wind_speed,Phase_amp, \
+                                  pwvmean,proportional_error,NUM_TIME_STEPS)
+
+    print("{0} visibilities per dataset".format(observation.Nvis))
+
+    t0 = time.time()
+    for i,outputdir in enumerate(generate_mock_datasets(observation,seeds,outputroot,SIE,Multipoles, \
+                                                        zlens=zlens,zsrc=zsrc,NX=NX_lens,NY=NY_lens, \
+                                                        pixscale=pixscale_lens)):
+        print("{0} written ({1:.1f} s per dataset)".format(outputdir,(time.time()-t0)/(i+1)))
+
+    print("The simulation pipeline has run successfully!!")
@@ -0,0 +1,75 @@
+'''
+Benchmark of the noise scaling estimator (evillens.estimate_sigma_scaling).
+
+Checks that it reproduces the scaling from the original cell-by-cell
+np.where loop, and times it for increasing numbers of visibilities to
+show that the cost grows (close to) linearly.
+
+usage:  python benchmarks/bench_sigma_scaling.py
+'''
+
+import time
+import numpy as np
+import evillens as evil
+
+
+def get_sigma_scaling_loop(u,v,vis,sigma):
+    '''
+    The original O(N_cells x N_vis) implementation, kept for reference.
+    '''
+    UVMAX = np.max([abs(u),abs(v)])*1.01
+    Bins = np.arange(-UVMAX,UVMAX+12,12.0)
+    P,reject1,reject2 = np.histogram2d(u,v,bins=Bins)
+    [row,col] = np.where(P!=0)
+    noise_r = np.zeros(u.shape)
+    indI = np.zeros(u.shape,int)
+    for icount in range(len(row)):
+        inds = np.where((v>=Bins[col[icount]])&(v<Bins[col[icount]+1])&(u>=Bins[row[icount]])&(u<Bins[row[icount]+1]))[0]
+        if len(inds) ==1:
+            continue
+        elif len(inds)%2 ==1:
+            inds = inds[:-1]
+        I = inds[::2]
+        J = inds[1::2]
+        noise_r[I] = (vis[I]-vis[J]).real
+        indI[I] = J
+    iI = np.where(noise_r != 0)[0]
+    N = len(iI)
+    return np.sqrt(N/np.sum((noise_r[iI]/np.sqrt(sigma[iI]**2+sigma[indI[iI]]**2))**2))
+
+
+def mock_data(N,seed=0):
+    '''
+    N visibilities on a disk of uv tracks, with noise twice as large
+    as sigma says it should be.
+    '''
+    rng = evil.random_stream(seed)
+    r = 2000.0*np.sqrt(rng.random(N))
+    theta = 2*np.pi*rng.random(N)
+    u = r*np.cos(theta)
+    v = r*np.sin(theta)
+    sigma = np.ones(N)
+    vis = 2.0*(rng.normal(size=N)+1j*rng.normal(size=N))
+    return u,v,vis,sigma
+
+
+def timeit(f,*args):
+    t0 = time.time()
+    result = f(*args)
+    return result , time.time()-t0
+
+
+if __name__ == '__main__':
+
+    print("Comparison with the original loop")
+    for N in [10**3,10**4,3*10**4]:
+        u,v,vis,sigma = mock_data(N)
+        A_loop , t_loop = timeit(get_sigma_scaling_loop,u,v,vis,sigma)
+        A_fast , t_fast = timeit(lambda *a: evil.estimate_sigma_scaling(*a,verbose=False),u,v,vis,sigma)
+        print("N = {0:>8d}   loop: A = {1:.12f} ({2:8.3f} s)   sorted: A = {3:.12f} ({4:8.4f} s)".format(N,A_loop,t_loop,A_fast,t_fast))
+
+    print("\nScaling of the sorted estimator")
+    for N in [10**4,10**5,10**6,10**7]:
+        u,v,vis,sigma = mock_data(N)
+        A_fast , t_fast = timeit(lambda *a: evil.estimate_sigma_scaling(*a,verbose=False),u,v,vis,sigma)
+        print("N = {0:>8d}   {1:8.4f} s   {2:6.1f} ns per visibility".format(N,t_fast,1e9*t_fast/N))
@@ -0,0 +1,66 @@
+'''
+Benchmark of the Earth rotation uv coverage synthesiser
+(evillens.synthesise_uv_coverage).
+
+Checks the synthesised tracks against a per-row loop over baselines and
+integrations, and times full multi-hour tracks of a 50 antenna array.
+
+usage:  python benchmarks/bench_uv_coverage.py
+'''
+
+import time
+import numpy as np
+import evillens as evil
+
+
+def uvw_loop(enu,dec,hour_angles):
+    '''
+    One row at a time, in measurement set order.
+    '''
+    xyz = evil.enu_to_xyz(enu)
+    rows = []
+    for H in hour_angles:
+        for i in range(len(xyz)):
+            for j in range(i+1,len(xyz)):
+                X,Y,Z = xyz[j]-xyz[i]
+                u = np.sin(H)*X + np.cos(H)*Y
+                v = -np.sin(dec)*np.cos(H)*X + np.sin(dec)*np.sin(H)*Y + np.cos(dec)*Z
+                w = np.cos(dec)*np.cos(H)*X - np.cos(dec)*np.sin(H)*Y + np.sin(dec)*Z
+                rows.append([u,v,w,i,j])
+    return np.array(rows).T
+
+
+def mock_array(Nantennas,seed=0):
+    '''
+    ENU positions of a compact array, a few hundred meters across.
+    '''
+    rng = evil.random_stream(seed)
+    return np.c_[rng.normal(0,300,Nantennas),rng.normal(0,300,Nantennas),rng.normal(0,2,Nantennas)]
+
+
+def timeit(f,*args):
+    t0 = time.time()
+    result = f(*args)
+    return result , time.time()-t0
+
+
+if __name__ == '__main__':
+
+    dec = np.deg2rad(-50.0)
+
+    print("Comparison with the per-row loop")
+    enu = mock_array(50)
+    ha = [-0.1,0.1]
+    u,v,w,ant1,ant2,t = evil.synthesise_uv_coverage(enu,dec,ha,60.0)
+    hour_angles = ha[0] + evil.OMEGA_EARTH*np.unique(t)
+    ref = uvw_loop(enu,dec,hour_angles)
+    print("rows: {0}   max |uvw| difference: {1:.3e} m   antennas identical: {2}".format( \
+          len(u),np.max(np.abs(np.array([u,v,w])-ref[:3])), \
+          np.array_equal(ant1,ref[3]) and np.array_equal(ant2,ref[4])))
+
+    print("\n50 antennas, 6s integrations")
+    for hours,Nchan in [(1,1),(4,1),(8,1),(4,4)]:
+        ha = [-np.pi*hours/24,np.pi*hours/24]
+        chanfreqs = 295.0e9 + 1.0e9*np.arange(Nchan)
+        result , t = timeit(evil.synthesise_uv_coverage,enu,dec,ha,6.0,chanfreqs)
+        print("{0} h, {1} channel(s):  {2:>9d} visibilities  {3:7.3f} s".format(hours,Nchan,result[0].size,t))
@@ -0,0 +1,103 @@
+'''
+Benchmark of the write-back paths of Saboteur.sabotage_measurement_set.
+
+Times, for 10^7 rows:
+
+  - the native (lenstool) output, evillens.write_ripples_binary, against
+    the original struct.pack writer (on a smaller set, per row),
+  - writing the binary blob handed to CASA by evillens.put_visibilities,
+    and the chunked read of that blob done on the CASA side, against
+    embedding the visibilities in the script text as str(list).
+
+The putdata calls themselves need CASA, so are not timed here.
+
+usage:  python benchmarks/bench_write_back.py [outputdir]
+'''
+
+import os
+import sys
+import shutil
+import struct
+import tempfile
+import time
+import numpy as np
+import evillens as evil
+
+
+def write_struct_pack(outputdir,vis,u,v,sigma,chan):
+    '''
+    The original lenstool writer, kept for reference.
+    '''
+    sigma_squared_inv = np.repeat(sigma**-2,2)
+    visf = np.empty(2*len(vis),float)
+    visf[0::2] = vis.real
+    visf[1::2] = vis.imag
+    for name,x in [('u.bin',u),('v.bin',v),('chan.bin',chan), \
+                   ('vis_chan_0.bin',visf),('sigma_squared_inv.bin',sigma_squared_inv)]:
+        f = open(outputdir+name,'wb')
+        f.write(struct.pack('d'*len(x),*x))
+        f.close()
+
+
+def read_blob_in_chunks(blobfile,chunksize):
+    '''
+    What the CASA script does with the blob, minus the putdata calls.
+    '''
+    vis = np.load(blobfile,mmap_mode='r')
+    total = 0.0
+    for start in range(0,len(vis),chunksize):
+        total += vis[start:start+chunksize].real.sum()
+    return total
+
+
+def mock_data(N,seed=0):
+    rng = evil.random_stream(seed)
+    vis = rng.normal(size=N)+1j*rng.normal(size=N)
+    u = rng.normal(0.0,1e5,N)
+    v = rng.normal(0.0,1e5,N)
+    sigma = np.ones(N)
+    chan = np.zeros(N)
+    return vis,u,v,sigma,chan
+
+
+def timeit(f,*args):
+    t0 = time.time()
+    result = f(*args)
+    return result , time.time()-t0
+
+
+if __name__ == '__main__':
+
+    if len(sys.argv) > 1:
+        tempdir = sys.argv[1]
+    else:
+        tempdir = tempfile.mkdtemp(prefix='bench_write_back_')
+    olddir = os.path.join(tempdir,'struct_pack/')
+    newdir = os.path.join(tempdir,'native/')
+    os.makedirs(olddir)
+
+    print("Native (lenstool) output")
+    N = 10**6
+    vis,u,v,sigma,chan = mock_data(N)
+    result , t_old = timeit(write_struct_pack,olddir,vis,u,v,sigma,chan)
+    result , t_new = timeit(evil.write_ripples_binary,newdir,vis,u,v,sigma,chan)
+    identical = all([open(olddir+name,'rb').read() == open(newdir+name,'rb').read() \
+                     for name in os.listdir(olddir)])
+    print("N = {0:>8d}   struct.pack: {1:8.3f} s   tofile: {2:8.4f} s   identical files: {3}".format(N,t_old,t_new,identical))
+
+    N = 10**7
+    vis,u,v,sigma,chan = mock_data(N)
+    result , t_new = timeit(evil.write_ripples_binary,newdir,vis,u,v,sigma,chan)
+    print("N = {0:>8d}   tofile: {1:8.4f} s   {2:6.1f} Mrows/s".format(N,t_new,1e-6*N/t_new))
+
+    print("\nMeasurement set blob")
+    blobfile = os.path.join(tempdir,'vis.npy')
+    result , t_save = timeit(np.save,blobfile,vis)
+    result , t_read = timeit(read_blob_in_chunks,blobfile,10**6)
+    print("N = {0:>8d}   write blob: {1:8.4f} s   chunked read: {2:8.4f} s   {3:6.1f} Mrows/s".format(N,t_save,t_read,1e-6*N/(t_save+t_read)))
+
+    N = 10**6
+    result , t_str = timeit(lambda x: 'vis_new ='+str(list(x)),vis[:N])
+    print("N = {0:>8d}   str(list) script text (original): {1:8.3f} s".format(N,t_str))
+
+    shutil.rmtree(tempdir,ignore_errors=True)
@@ -7,9 +7,25 @@ Created on Tue February 2nd 15:14:00 2016
 
 import numpy as np
 import matplotlib.pyplot as plt
-import glob
+import evillens as evil
 
 
+def selection_index(indices):
+    '''
+    The slice selecting the (increasing) indices, if they are evenly
+    spaced, so that indexing with it gives a view rather than a copy, or
+    else the indices themselves.
+    '''
+    indices = np.asarray(indices,int)
+    if len(indices) == 0:
+        return slice(0,0)
+    if len(indices) == 1:
+        return slice(indices[0],indices[0]+1)
+    step = indices[1]-indices[0]
+    if step > 0 and np.all(np.diff(indices) == step):
+        return slice(indices[0],indices[-1]+1,step)
+    return indices
+
 
 class MCMC(object):
     '''
@@ -17,51 +33,180 @@ class MCMC(object):
     '''
     
     def __init__(self):
-        self.data = None
+        self.set_chains(None,None)
         self.Chi2 = None
         self.GR = None
-        self.Nwalkers = None
-        self.Nparameters=None
-        self.Niter=None
         self.Postmean = None
         return
     
-    def load_chains_from(self, targetdir):
+    def set_chains(self, data, chi2):
         '''
-        Load chains from target directory.  Assumes chains are written in the 
-        Blueberry output format.
+        Use chains data ([Nwalkers,Niter,Nparameters]) and chi2
+        ([Nwalkers,Niter]), with all walkers, iterations and parameters
+        selected.  The arrays are never copied or changed:  cut_chains,
+        cut_walker, cut_parameter and select only change which of them
+        are selected, and data and chi2 are views of the selection
+        (copied only when it is not evenly spaced, and only when used).
         '''
-        filenames = glob.glob(targetdir+'chain_number_*')
-        
-        self.Nwalkers = len(filenames)
+        self.data_base = data
+        self.chi2_base = chi2
+        if data is None:
+            self.walkers , self.parameters , self.first_iteration = None , None , 0
+            self.Nwalkers , self.Niter , self.Nparameters = None , None , None
+            self.selection_cache = {}
+            return
+        self.select(np.arange(data.shape[0]),np.arange(data.shape[2]),0)
         
-        for i,f in enumerate(filenames):
-            temp = np.loadtxt(f)
-            if i ==0:
-                self.Niter = temp.shape[0]
-                self.Nparameters = temp.shape[1]-1
-                self.data = np.zeros([self.Nwalkers,self.Niter,self.Nparameters])
-                self.chi2 = np.zeros([self.Nwalkers,self.Niter])
-            else:
-                pass
-            
-            self.data[i,:,:] = temp[:,1::]
-            self.chi2[i,:] = temp[:,0]
-            
         return
+    
+    def select(self, walkers=None, parameters=None, Tburn=None):
+        '''
+        Select walkers and parameters (boolean masks, or indices, over
+        all of the loaded chains) and the burn in (iterations of the
+        loaded chains to leave out).  Anything not given stays as it is.
+        '''
+        if walkers is not None:
+            walkers = np.asarray(walkers)
+            self.walkers = np.flatnonzero(walkers) if walkers.dtype == bool else np.sort(walkers.astype(int))
+        if parameters is not None:
+            parameters = np.asarray(parameters)
+            self.parameters = np.flatnonzero(parameters) if parameters.dtype == bool else np.sort(parameters.astype(int))
+        if Tburn is not None:
+            self.first_iteration = Tburn
         
-    def get_confidence_interval(self,interval=0.95,Tburn=0):
-        
-        Int_up = np.percentile(self.data[:,Tburn:,:],100*(0.5+interval/2.0),axis={0,1})
-        Int_dn = np.percentile(self.data[:,Tburn:,:],100*(0.5-interval/2.0),axis={0,1})
+        self.Nwalkers = len(self.walkers)
+        self.Nparameters = len(self.parameters)
+        self.Niter = max(self.data_base.shape[1]-self.first_iteration,0)
+        self.selection_cache = {}
         
-        self.CI = np.zeros([len(Int_up),2])
+        return
+    
+    def selected_data(self, iterations=slice(None), parameters=slice(None)):
+        '''
+        The selected walkers, over iterations (a slice of the selected
+        iterations) of parameters (of the selected ones), read from the
+        loaded chains:  a view if the selection is evenly spaced, or else
+        a copy of just this part.
+        '''
+        W = selection_index(self.walkers)
+        start , stop , step = iterations.indices(self.Niter)
+        T = slice(self.first_iteration+start,self.first_iteration+stop,step)
+        P = selection_index(np.atleast_1d(self.parameters[parameters]))
+        if isinstance(W,slice) or isinstance(P,slice):
+            return self.data_base[W,T,P]
+        return self.data_base[W,T][:,:,P]
+    
+    def selected_chi2(self, iterations=slice(None)):
+        '''
+        chi2 of the selected walkers over iterations (a slice of the
+        selected iterations), as selected_data.
+        '''
+        start , stop , step = iterations.indices(self.Niter)
+        T = slice(self.first_iteration+start,self.first_iteration+stop,step)
+        return self.chi2_base[selection_index(self.walkers),T]
+    
+    @property
+    def data(self):
+        if self.data_base is None:
+            return None
+        if 'data' not in self.selection_cache:
+            self.selection_cache['data'] = self.selected_data()
+        return self.selection_cache['data']
+    
+    @data.setter
+    def data(self, data):
+        self.set_chains(data,self.chi2)
+    
+    @property
+    def chi2(self):
+        if self.chi2_base is None:
+            return None
+        if 'chi2' not in self.selection_cache:
+            self.selection_cache['chi2'] = self.selected_chi2()
+        return self.selection_cache['chi2']
+    
+    @chi2.setter
+    def chi2(self, chi2):
+        self.set_chains(self.data,chi2)
+    
+    def load_chains_from(self, targetdir, cache=True, incremental=False, Nprocesses=None):
+        '''
+        Load chains from target directory.  Assumes chains are written in the 
+        Blueberry output format.  The chains are parsed in parallel and
+        kept in a binary cache next to them, which later loads reuse while
+        the chains are unchanged; with incremental=True only the rows
+        appended since the last load are read, to follow a live run (see
+        evil.load_chain_files).  data and chi2 are read only views of the
+        cache.  When an incremental load extends the loaded chains, the
+        selected walkers, parameters and burn in are kept.
+        '''
+        chains = evil.load_chain_files(targetdir,cache,incremental,Nprocesses)
         
-        self.CI[:,0] = Int_up
-        self.CI[:,1] = Int_dn
+        extends = incremental and self.data_base is not None \
+                  and chains.shape[0] == self.data_base.shape[0] \
+                  and chains.shape[1] >= self.data_base.shape[1] \
+                  and chains.shape[2] == self.data_base.shape[2]+1
+        selection = (self.walkers,self.parameters,self.first_iteration)
         
-        return 
+        self.set_chains(chains[:,:,1:],chains[:,:,0])
+        if extends:
+            self.select(*selection)
+            
+        return
         
+    def summarize(self,Tburn=0,quantiles=[0.025,0.16,0.5,0.84,0.975],hpd=[0.68,0.95],weights=None,chunksize=2**24):
+        '''
+        Summarize the posterior of all parameters, after the Tburn-th
+        iteration, in self.summary:  mean, covariance, quantiles
+        ([len(quantiles),Nparameters]) and hpd (the highest posterior
+        density intervals holding each mass in hpd,
+        [len(hpd),Nparameters,2]).  weights are None, 'chi2' (importance
+        weights exp(-chi2/2), as Get_PostMean) or [Nwalkers,Niter-Tburn].
+        The chains are read at most chunksize values at a time (see
+        evil.sample_summary).
+        '''
+        Nsteps = max(self.Niter-Tburn,0)
+        if weights is None:
+            w = None
+        elif isinstance(weights,str) and weights == 'chi2':
+            w = evil.chi2_weights(self.selected_chi2(slice(Tburn,None)))
+        else:
+            w = np.asarray(weights,float).reshape(self.Nwalkers,Nsteps)
+
+        # moments, a block of iterations at a time
+        step = max(chunksize//(self.Nwalkers*self.Nparameters),1)
+        moments = evil.weighted_moments(np.zeros([0,self.Nparameters]))
+        for start in range(0,Nsteps,step):
+            x = self.selected_data(slice(Tburn+start,Tburn+start+step)).reshape(-1,self.Nparameters)
+            wx = None if w is None else w[:,start:start+step].ravel()
+            moments = evil.merge_moments(moments,evil.weighted_moments(x,wx))
+
+        # quantiles and intervals, a block of parameters at a time
+        Q = np.zeros([len(quantiles),self.Nparameters])
+        H = np.zeros([len(hpd),self.Nparameters,2])
+        step = max(chunksize//max(self.Nwalkers*Nsteps,1),1)
+        for start in range(0,self.Nparameters if len(quantiles)+len(hpd) > 0 else 0,step):
+            P = slice(start,min(start+step,self.Nparameters))
+            x = self.selected_data(slice(Tburn,None),P).reshape(self.Nwalkers*Nsteps,-1)
+            Q[:,P] , H[:,P] = evil.sample_summary(x,None if w is None else w.ravel(),quantiles,hpd)
+
+        self.summary = {'mean':moments[2],'covariance':evil.moments_covariance(moments), \
+                        'q':np.array(quantiles,float),'quantiles':Q,'mass':np.array(hpd,float),'hpd':H}
+
+        return
+
+    def get_confidence_interval(self,interval=0.95,Tburn=0):
+        '''
+        Equal tailed interval holding interval of the samples of each
+        parameter, after the Tburn-th iteration:  self.CI[:,0] the upper
+        and self.CI[:,1] the lower ends.
+        '''
+        self.summarize(Tburn,[0.5+interval/2.0,0.5-interval/2.0],[])
+
+        self.CI = self.summary['quantiles'].T.copy()
+
+        return
+
     def get_errorbars(self,interval=0.95,Tburn=0):
         
         self.get_max_likelihood()
@@ -73,83 +218,82 @@ class MCMC(object):
         self.errorup = self.CI[:,0] - self.best_params
         self.errordn = self.CI[:,1] - self.best_params
         
-    def GelmanRubin(self, N=100,interval=0.95):
+    def GelmanRubin(self, N=100,interval=0.95,compression=400):
         '''
         Compute the Gelman Rubin diagnostic on the currently loaded chains.
-        Calculates every Nth iteration on the last N/2 samples in the chain.
+        Calculates every Nth iteration on the last N/2 samples in the chain
+        (GR), and from the confidence intervals of the chains so far (GR2).
+        The diagnostics are computed online (see evil.ChainDiagnostics):
+        once the chains grow (e.g. load_chains_from with incremental=True),
+        update_GelmanRubin only reads the new rows.
         '''        
         
-        assert N % 2 ==0
-        assert interval >=0
-        assert interval <=1
-        
-        self.GR = np.zeros([len(range(N,self.Niter-N,N)),self.Nparameters])
-        self.GR2 =np.zeros([len(range(N,self.Niter-N,N)),self.Nparameters])
-        
-        
-        # first Gelman Rubin statistic, compares variances
-        for i in range(N,self.Niter-N,N):
-            
-            # means for each chain
-            m = self.Nwalkers
-            n = i-i//2
-            xj = np.mean(self.data[:,i//2:i,:],axis=1) 
-            x = np.mean(self.data[:,i//2:i,:],axis=(0,1))
-            W2 = np.zeros(self.Nparameters)
-            
-            
-            
-            # Within chain variance
-            for j in range(self.Nparameters):
-                W2[j] = 1.0/(m*(n-1))*np.sum(np.sum((self.data[:,i//2:i,j]-(xj[:,j])[:,np.newaxis])**2,axis=1),axis=0)
-            W = 1/float(self.Nwalkers)*np.sum(np.std(self.data[:,i//2:i,:],axis=1)**2,axis=0)         
-            
-          
-            # Between chain variance  
-            B2 = n/float(m-1) * np.sum((xj-x)**2,axis=0)
-            B = (i-i//2)/float(self.Nwalkers-1)*np.sum((np.mean(self.data[:,i//2:i,:],axis=1)-np.mean(np.mean(self.data[:,i//2:i,:],axis=1),axis=0))**2,axis=0)
+        self.diagnostics = evil.ChainDiagnostics(self.Nwalkers,self.Nparameters,N,interval,compression)
+        self.diagnostics_selection = (self.walkers.copy(),self.parameters.copy(),self.first_iteration)
+        self.alpha = 1-interval
+        self.update_GelmanRubin()
 
-            variance = (1-1/float(i-i//2))*W+B/float(i-i//2)
-            v2 = (n-1)/float(n)*W2 +B2/float(n)
-            
-            #Reduction = np.sqrt(variance/W)
-            R = (m+1)/float(m)*v2/W2 -(n-1)/float(m*n)
-            
-            self.GR[i//N-1,:] = R
-            #self.GR[i//N-1,:] = R 
+        return
         
-        # second Gelman Rubin.  Compares confidence intervals
-        for i in range(N,self.Niter-N,N):
-            Pup_m = np.percentile(self.data[:,:i,:],100*(0.5+interval/2.0),axis=1)
-            Pdn_m = np.percentile(self.data[:,:i,:],100*(0.5-interval/2.0),axis=1)
-            
-            Pup_t = np.percentile(self.data[:,:i,:],100*(0.5+interval/2.0),axis={0,1})
-            Pdn_t = np.percentile(self.data[:,:i,:],100*(0.5-interval/2.0),axis={0,1})
-            
-            Clm = Pup_m-Pdn_m
-            Clt = Pup_t-Pdn_t
-            
+    def update_GelmanRubin(self):
+        '''
+        Add the rows loaded since the last GelmanRubin (or
+        update_GelmanRubin) to the diagnostics.  The selected walkers,
+        parameters and burn in must be those of GelmanRubin.
+        '''
+        walkers , parameters , first_iteration = self.diagnostics_selection
+        if not (np.array_equal(walkers,self.walkers) and np.array_equal(parameters,self.parameters) \
+                and first_iteration == self.first_iteration):
+            raise Exception("the selected walkers, parameters or burn in have changed since GelmanRubin \n")
+        # a few checkpoints at a time, so that only those rows are ever
+        # copied from the chains
+        step = 10*self.diagnostics.N
+        for start in range(self.diagnostics.Niter,self.Niter,step):
+            self.diagnostics.update(self.selected_data(slice(start,start+step)))
+        self.GR = self.diagnostics.GR
+        self.GR2 = self.diagnostics.GR2
 
-            self.GR2[i//N-1,:] = Clt/np.mean(Clm,axis=0)
-            self.alpha = 1-interval
-            
-        
+        return
+
+    def get_autocorrelation_time(self,Tburn=0,c=5.0):
+        '''
+        Compute the integrated autocorrelation time (self.tau, in
+        iterations) and effective sample size (self.ESS) of each
+        parameter, after the Tburn-th iteration, from the autocorrelation
+        functions of all walkers (see evil.autocorrelation_time).
+        '''
+        self.tau = evil.autocorrelation_time(self.selected_data(slice(Tburn,None)),c)
+        self.ESS = self.Nwalkers*max(self.Niter-Tburn,0)/self.tau
 
         return
-        
+
+    def thin_chains(self,thin=None,Tburn=0):
+        '''
+        Keep only every thin-th iteration (by default, half the shortest
+        autocorrelation time) after the Tburn-th, in memory, e.g. for
+        plotting long chains.
+        '''
+        if thin is None:
+            if getattr(self,'tau',None) is None:
+                self.get_autocorrelation_time(Tburn)
+            thin = max(int(0.5*np.min(self.tau)),1)
+
+        self.set_chains(np.ascontiguousarray(self.selected_data(slice(Tburn,None,thin))), \
+                        np.ascontiguousarray(self.selected_chi2(slice(Tburn,None,thin))))
+        self.thin = thin
+
+        return
+
     def Get_PostMean(self,Tburn):
         '''
         Calculate the posterior mean of the parameters, starting at 
-        the Tburn-th iteration, and proceeding until the end.
+        the Tburn-th iteration, and proceeding until the end, with each
+        sample weighted by exp(-chi2/2).
         '''
-        z = np.min(self.chi2)/2.0
-        prob = np.exp(-self.chi2/2.0+z)
-        prob /= np.sum(prob)
-        
-        self.Postmean = np.zeros(self.Nparameters)
-        for i in range(self.Nparameters):
-            self.Postmean[i] = np.sum(prob*self.data[:,:,i])
-        
+        self.summarize(Tburn,[],[],'chi2')
+
+        self.Postmean = self.summary['mean']
+
         return
         
     def cut_chains(self,Tburn):
@@ -157,42 +301,21 @@ class MCMC(object):
         cut the burn in chains out of the chains used for study.
         '''        
         
-        self.data = self.data[:,Tburn::,:]
-        self.chi2 = self.chi2[:,Tburn::]
-        self.Niter = self.data.shape[1]
+        self.select(Tburn=self.first_iteration+Tburn)
         return        
         
     def cut_walker(self,walker_id):
         '''
         Remove walkers from the data used for study (risky)
         '''
-        data = np.zeros([self.Nwalkers-1,self.Niter,self.Nparameters])
-        chi2 = np.zeros([self.Nwalkers-1,self.Niter])
-        for i in range(self.Nwalkers):
-            if i < walker_id:
-                data[i,:,:]   = self.data[i,:,:]
-                chi2[i,:] = self.chi2[i,:]
-            elif i>walker_id:
-                data[i-1,:,:] = self.data[i,:,:]
-                chi2[i-1,:] = self.chi2[i,:]
-            else:
-                pass
-        self.data = data
-        self.chi2 = chi2
-        self.Nwalkers -= 1
+        self.select(walkers=np.delete(self.walkers,walker_id))
         
         return
     def cut_parameter(self,parameter_id):
-        data = np.zeros([self.Nwalkers,self.Niter,self.Nparameters-1])
-        for i in range(self.Nparameters):
-            if   i < parameter_id:
-                data[:,:,i] = self.data[:,:,i]
-            elif i > parameter_id:
-                data[:,:,i-1] = self.data[:,:,i]
-            else:
-                pass
-        self.data = data
-        self.Nparameters -= 1
+        '''
+        Remove parameters from the data used for study.
+        '''
+        self.select(parameters=np.delete(self.parameters,parameter_id))
             
         return
         
@@ -200,7 +323,7 @@ class MCMC(object):
         best_walker = np.argmin(np.min(self.chi2,axis=1))
         best_step = np.argmin(self.chi2[best_walker,:])
         self.best_chi2 = self.chi2[best_walker,best_step]
-        self.best_params=self.data[best_walker,best_step,:]
+        self.best_params=self.selected_data(slice(best_step,best_step+1))[best_walker,0,:]
         
         return
         
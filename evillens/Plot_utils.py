@@ -481,40 +481,83 @@ def Plot_source(sourcedir,Npixels,source_L,sourcecent,includecaustics=True,\
     return fig
     
     
-def Compare_Triangles(MCMC1,MCMC2,paramslist=None,Title=None,Filename=None,levels=[0.68,0.95],truths=None,Nbins=20,show_both=False):
+def Compare_Triangles(MCMC1,MCMC2,paramslist=None,Title=None,Filename=None,levels=[0.68,0.95],truths=None,Nbins=20,show_both=False,Nprocesses=None):
+    '''
+    Triangle plot comparing two runs (see Compare_Triangle_list).
+    '''
+    return Compare_Triangle_list([MCMC1,MCMC2],paramslist=paramslist,Title=Title,Filename=Filename,levels=levels, \
+                                 truths=truths,Nbins=Nbins,show_both=show_both,Nprocesses=Nprocesses)
     
-    d1 = MCMC1.data.reshape(-1,MCMC1.Nparameters)
-    d2 = MCMC2.data.reshape(-1,MCMC2.Nparameters)
     
-    if MCMC1.Nparameters != MCMC2.Nparameters:
-        raise Exception('MCMC objects must have the same number of parameters \n')
-    
-    if paramslist is not None:
-        paramslist=paramslist
-    else:
-        paramslist = ['' for i in range(MCMC1.Nparameters)]
+def Compare_Triangle_list(MCMClist,paramslist=None,Title=None,Filename=None,levels=[0.68,0.95],truths=None,Nbins=20,show_both=False,Tburn=0,Nprocesses=None):
+    '''
+    Triangle plot comparing runs (MCMC objects, or directories of their
+    chains, loaded only by the worker processes that bin them, see
+    evil.compare_runs):  histograms of each parameter on the diagonal, and
+    the levels contours of each pair of parameters below it.  With
+    show_both the axes span all of the runs, otherwise the first.
+    '''
     
-    if truths is not None:
-        truths = truths
-    else:
-        truths = [10**10 for i in range(MCMC1.Nparameters)]
-        
     if Nbins is None:
         Nbins = 50
         
-    # if we want to see both sets of contours, set the ranges manually
+    summaries = evil.compare_runs(MCMClist,Tburn,None,None,Nbins,None,Nprocesses)
+    
+    Npars = summaries[0]['hist1d'].shape[0]
+    if any([s['hist1d'].shape[0] != Npars for s in summaries]):
+        raise Exception('MCMC objects must have the same number of parameters \n')
+    
+    if paramslist is None:
+        paramslist = ['' for i in range(Npars)]
+        
+    # if we want to see all sets of contours, span all of the ranges
     if show_both is True:
-        upper_lims = np.vstack([np.max(MCMC1.data,axis=(0,1)),np.max(MCMC2.data,axis=(0,1))])
-        lower_lims = np.vstack([np.min(MCMC1.data,axis=(0,1)),np.min(MCMC2.data,axis=(0,1))])
-        ranges = []
-        for i in range(MCMC1.Nparameters):
-            ranges.append((lower_lims[:,i].min(),upper_lims[:,i].max()))
-        print ranges
+        ranges = np.vstack([np.min([s['ranges'][:,0] for s in summaries],axis=0), \
+                            np.max([s['ranges'][:,1] for s in summaries],axis=0)]).T
     else:
-        ranges=None
-        
-    fig = corner.corner(d1,range=ranges,levels = levels, labels=paramslist , truths=truths,plot_datapoints=False,bins=Nbins,fill_contours=True,hist_kwargs=dict(normed=True))
-    corner.corner(d2,range=ranges,fig=fig,levels=levels,color='blue',plot_datapoints=False,bins=Nbins,fill_contours=True,hist_kwargs=dict(normed=True));
+        ranges = summaries[0]['ranges']
+    
+    colorlist = ['k','b','r','c','m','g']
+    fig = plt.figure(figsize=[2*Npars,2*Npars])
+    gs = gridspec.GridSpec(Npars,Npars)
+    gs.update(wspace=0.05,hspace=0.05)
+    for i in range(Npars):
+        for j in range(i+1):
+            ax = fig.add_subplot(gs[i,j])
+            for k,s in enumerate(summaries):
+                color = colorlist[k % len(colorlist)]
+                xc = 0.5*(s['edges'][j][1:]+s['edges'][j][:-1])
+                if i == j:
+                    density = s['hist1d'][i]/(np.sum(s['hist1d'][i])*np.diff(s['edges'][i]))
+                    ax.step(xc,density,color=color,where='mid')
+                    continue
+                H = s['hist2d'][i,j]
+                if np.sum(H) == 0:
+                    continue
+                yc = 0.5*(s['edges'][i][1:]+s['edges'][i][:-1])
+                heights = evil.credible_levels(H,levels)
+                for h in heights:
+                    ax.contourf(xc,yc,H,[h,H.max()+1],colors=color,alpha=0.25)
+                ax.contour(xc,yc,H,heights,colors=color)
+                
+            if truths is not None:
+                ax.axvline(truths[j],color='c')
+                if i != j:
+                    ax.axhline(truths[i],color='c')
+                    
+            ax.set_xlim(ranges[j])
+            if i == j:
+                ax.set_yticks([])
+            else:
+                ax.set_ylim(ranges[i])
+            if i == Npars-1:
+                ax.set_xlabel(paramslist[j])
+            else:
+                ax.set_xticklabels([])
+            if j == 0 and i > 0:
+                ax.set_ylabel(paramslist[i])
+            elif i != j:
+                ax.set_yticklabels([])
     
     if Title is not None:
         plt.suptitle(Title,fontsize=22)
@@ -534,42 +577,37 @@ def Compare_Triangles(MCMC1,MCMC2,paramslist=None,Title=None,Filename=None,level
     
     
 def Compare_chains(MCMClist,paramslist=None,Numpars=None,Tburn=None,Niter=None,figsize=[5,5], \
-                Nrows=4, Ncols=4,PlotTitle=None, Filename=None):
-                    
-    if paramslist is not None:
-        paramslist = paramslist
-    
-    if Numpars is not None:
-        Numpars = Numpars
-    else:
-        Numpars = MCMClist[0].Nparameters
+                Nrows=4, Ncols=4,PlotTitle=None, Filename=None,Npoints=500,Nprocesses=None):
+    '''
+    Plot the chains of runs (MCMC objects, or directories of their
+    chains, loaded only by the worker processes that thin them, see
+    evil.compare_runs) over each other, with every walker thinned to at
+    most Npoints iterations.
+    '''
     
     if Tburn is not None:
         Tburn = Tburn
     else:
         Tburn = 0
         
-    if Niter is not None:
-        Niter2 = []
-        for i in range(len(MCMClist)):
-            Niter2.append(Niter)
-            Niter = Niter2
+    summaries = evil.compare_runs(MCMClist,Tburn,Niter,Npoints,None,None,Nprocesses)
+    Niter = [s['Niter'] for s in summaries]
+    
+    if Numpars is not None:
+        Numpars = Numpars
     else:
-        Niter = []
-        for i in range(len(MCMClist)):
-            Niter.append(MCMClist[i].Niter)
+        Numpars = summaries[0]['traces'].shape[2]
         
     assert Numpars <= Nrows*Ncols
     
     fig = plt.figure(figsize=figsize)
     gs = gridspec.GridSpec(Nrows,Ncols)
     gs.update(left=0.05,right=0.95,wspace=0.5,hspace=0.1)
+    colorlist = ['k','r','b','c','m','g']
     for i in range(Numpars):
-        colorlist = ['k','r','b','c','m','g']
         plt.subplot(gs[i//Ncols,i % Ncols])
-        for j in range(len(MCMClist)):
-            for k in range(MCMClist[j].Nwalkers):
-                plt.plot(MCMClist[j].data[k,Tburn:Niter[j],i],colorlist[j],alpha=0.3)
+        for j in range(len(summaries)):
+            plt.plot(summaries[j]['iterations'],summaries[j]['traces'][:,:,i].T,colorlist[j % len(colorlist)],alpha=0.3)
             
         if paramslist is not None:
             plt.ylabel(paramslist[i])
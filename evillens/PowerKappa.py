@@ -323,8 +323,7 @@ class PowerKappa(evil.GravitationalLens):
 # ----------------------------------------------------------------------
 
     def add_subhalo_population(self,halo_mass,minimum_subhalo_mass,\
-                               seed1 = np.random.randint(999999999),\
-                               seed2 = np.random.randint(999999999)):
+                               seed1 = None, seed2 = None):
         '''
         Add a subhalo population with a mass function and radial distribution
         from Springel et al. 2008 and the other aquarius simulation papers.
@@ -338,7 +337,9 @@ class PowerKappa(evil.GravitationalLens):
                                   not affect abundance of high mass 
                                   subhalos.)
         
-        - seed1,seed2:            random seeds to allow for user control.      
+        - seed1,seed2:            random seeds of the subhalo masses and
+                                  positions, to allow for user control
+                                  (None gives a new population each call).
         
         Returns:
         - void:                   updates deflections and kappa to include
@@ -346,16 +347,13 @@ class PowerKappa(evil.GravitationalLens):
         
         '''
         
-        # first, compute the CDF of the subhalos (include larger range than allowed subhalo masses)
-        Msubs = 10**np.linspace(np.log10(minimum_subhalo_mass)-3.,np.log10(halo_mass)+3.,4000)
-        CDF = evil.Subhalo_cumulative_mass_function(Msubs,halo_mass)
-    
-        # build interpolation kernel
-        finterp = interp1d(CDF/np.max(CDF),Msubs,'linear')
+        # inverse CDF of the subhalo masses (cached for each halo_mass and
+        # minimum_subhalo_mass), and the number of subhalos to draw
+        mass_sampler , Nmax = evil.subhalo_mass_sampler(halo_mass,minimum_subhalo_mass)
     
         # now draw a number of subhalos equivalent to the max of the CDF from the CDF
-        np.random.seed(seed1)
-        Subhalo_masses = finterp(np.random.random(np.max(CDF).astype('int')))
+        rng = evil.random_stream(seed1,'subhalo_masses')
+        Subhalo_masses = mass_sampler(rng.random(Nmax))
     
         # Cut all subhalos below the mass cutoff
         Subhalo_masses = Subhalo_masses[(Subhalo_masses>minimum_subhalo_mass)]
@@ -364,22 +362,17 @@ class PowerKappa(evil.GravitationalLens):
         Nsubs = len(Subhalo_masses)
         
         # now get radial distributions...
-        # pdf of n(r) is an Einasto profile.  Get CDF
-        r_kpc = np.linspace(0,10000.,10**6)
-        pdf = evil.Einasto(r_kpc,0.678,199.)
-        cdf = np.flipud(np.cumsum(np.flipud(pdf)))
-    
-        # create interpolation kernel
-        radial_interp = interp1d(cdf/np.max(cdf),r_kpc,'linear')
+        # pdf of n(r) is an Einasto profile (inverse CDF is cached)
+        radial_interp = evil.einasto_radius_sampler(0.678,199.)
     
         # draw subhalo radii
-        np.random.seed(seed2)
-        r = radial_interp(np.random.random(Nsubs))
+        rng = evil.random_stream(seed2,'subhalo_positions')
+        r = radial_interp(rng.random(Nsubs))
     
         # Have radius, now want position angle
         # random in 3D
-        phi = np.random.random(Nsubs)*2*np.pi
-        theta = np.random.random(Nsubs)*np.pi
+        phi = rng.random(Nsubs)*2*np.pi
+        theta = rng.random(Nsubs)*np.pi
     
         # radii and angles to xyz (also add ellipticity)
         xp = r*np.cos(phi)*np.sin(theta)/self.q
@@ -11,3 +11,22 @@ from PowerKappa import *
 from _fastell import *
 from misc_utils import *
 from analyticSource import *
+from random_streams import *
+from gains import *
+from phase_matrix import *
+from noise_scaling import *
+from binary_io import *
+from chain_io import *
+from chain_diagnostics import *
+from chain_summaries import *
+from chain_comparison import *
+from ms_io import *
+from nufft import *
+from source_rendering import *
+from samplers import *
+from point_masses import *
+from magnification_maps import *
+from microlens_sweeps import *
+from microlens_animation import *
+from antenna_registry import *
+from uvcoverage import *
@@ -21,7 +21,7 @@ class SersicSource(evil.Source):
         
 # ----------------------------------------------------------------------
 
-    def Build_Source(self,Flux=0,position=[0,0],q=1.0,angle=0.0,n=4.,reff=1):
+    def Build_Source(self,Flux=0,position=[0,0],q=1.0,angle=0.0,n=4.,reff=1,integrate=False,rtol=1.0e-3):
     
         """
         Build source intensity using sersic profile
@@ -40,6 +40,13 @@ class SersicSource(evil.Source):
         n:          Sersic Index.
     
         reff:       The e-folding scale length of the source.    
+        
+        integrate:  If True, each pixel is the mean of the profile over
+                    its area (supersampled where the profile is steep, see
+                    evil.pixel_integrated), rather than its value at the
+                    pixel center.
+        
+        rtol:       Relative accuracy of the pixels when integrating.
             
         """
         if Flux is not None:
@@ -55,15 +62,21 @@ class SersicSource(evil.Source):
         if reff is not None:
             self.reff = reff
         
-        # convert to rotated coordinates
-        xp = np.cos(self.angle)*(self.beta_x-self.position[0]) + np.sin(self.angle)*(self.beta_y-self.position[1])
-        yp =-np.sin(self.angle)*(self.beta_x-self.position[0]) + np.cos(self.angle)*(self.beta_y-self.position[1])
-    
-        # convert to elliptical radius
-        r = np.sqrt(self.q*xp**2 + yp**2/self.q)
-    
-        # Sersic is 1-d function of radius
-        self.intensity = np.exp(-(r / reff)**(1/self.n))
+        def profile(x,y):
+            # convert to rotated coordinates
+            xp = np.cos(self.angle)*(x-self.position[0]) + np.sin(self.angle)*(y-self.position[1])
+            yp =-np.sin(self.angle)*(x-self.position[0]) + np.cos(self.angle)*(y-self.position[1])
+        
+            # convert to elliptical radius
+            r = np.sqrt(self.q*xp**2 + yp**2/self.q)
+        
+            # Sersic is 1-d function of radius
+            return np.exp(-(r / reff)**(1/self.n))
+        
+        if integrate:
+            self.intensity = evil.pixel_integrated(profile,self.beta_x[0,:],self.beta_y[:,0],rtol)
+        else:
+            self.intensity = profile(self.beta_x,self.beta_y)
     
         # Normalize to get flux
         self.intensity *= self.Flux/np.sum(self.intensity)
@@ -98,7 +111,14 @@ class GaussianSource(evil.Source):
         
 # ----------------------------------------------------------------------
 
-    def Build_Source(self,Flux=0,position=[0,0],q=1.0,angle=0.0,sigma=1.0):
+    def Build_Source(self,Flux=0,position=[0,0],q=1.0,angle=0.0,sigma=1.0,integrate=False,rtol=1.0e-3):
+        """
+        Build source intensity using an elliptical gaussian profile.  If
+        integrate is True, each pixel is the mean of the profile over its
+        area:  analytically when the axes of the gaussian are aligned
+        with the grid, and otherwise by supersampling to a relative
+        accuracy rtol.
+        """
         if Flux is not None:
             self.Flux = Flux
         if position is not None:
@@ -110,15 +130,33 @@ class GaussianSource(evil.Source):
         if sigma is not None:
             self.sigma = sigma
     
-        # convert to rotated coordinates
-        xp = np.cos(self.angle)*(self.beta_x-self.position[0]) + np.sin(self.angle)*(self.beta_y-self.position[1])
-        yp =-np.sin(self.angle)*(self.beta_x-self.position[0]) + np.cos(self.angle)*(self.beta_y-self.position[1])
-
-        # convert to elliptical radius
-        r = np.sqrt(self.q*xp**2 + yp**2/self.q)
+        def profile(x,y):
+            # convert to rotated coordinates
+            xp = np.cos(self.angle)*(x-self.position[0]) + np.sin(self.angle)*(y-self.position[1])
+            yp =-np.sin(self.angle)*(x-self.position[0]) + np.cos(self.angle)*(y-self.position[1])
+    
+            # convert to elliptical radius
+            r = np.sqrt(self.q*xp**2 + yp**2/self.q)
+            
+            # Intensity is 1d function of r
+            return self.Flux*np.exp(-0.5*(r/self.sigma)**2)/(2*np.pi*self.sigma**2)
+        
+        if not integrate:
+            self.intensity = profile(self.beta_x,self.beta_y)
+        
+        elif abs(np.sin(2*self.angle)) < 1e-12:
+            # axes along the grid, so the pixel integral is separable
+            sx = self.sigma/np.sqrt(self.q)
+            sy = self.sigma*np.sqrt(self.q)
+            if abs(np.cos(self.angle)) < 0.5:
+                sx , sy = sy , sx
+            gx = evil.gaussian_pixel_profile(self.beta_x[0,:],self.position[0],sx,self.pixscale)
+            gy = evil.gaussian_pixel_profile(self.beta_y[:,0],self.position[1],sy,self.pixscale)
+            self.intensity = self.Flux*np.outer(gy,gx)/(2*np.pi*self.sigma**2)
+        
+        else:
+            self.intensity = evil.pixel_integrated(profile,self.beta_x[0,:],self.beta_y[:,0],rtol)
         
-        # Intensity is 1d function of r
-        self.intensity = self.Flux*np.exp(-0.5*(r/self.sigma)**2)/(2*np.pi*self.sigma**2)
         return
 
 # ----------------------------------------------------------------------
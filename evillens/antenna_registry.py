@@ -0,0 +1,189 @@
+"""
+Registry of antenna configurations, without CASA.
+
+Antenna configurations are the simobserve .cfg files (alma.cycle*.cfg and
+friends), whose columns are the East, North, Up offsets of each antenna
+(in meters), its diameter, and its pad name.  A configuration is given
+either as a path to a file, or by name, in which case it is looked for
+in (in order):
+
+    the directories passed as path=...
+    the directories in $EVILLENS_ANTENNA_PATH (separated by os.pathsep)
+    the package directory evillens/antennas/
+    $CASAPATH/data/alma/simmos/, if CASAPATH is set
+
+so the CASA configurations are still found on machines with CASA
+installed, but only the environment variable is read (no CASA session is
+started).  Copying the .cfg files into evillens/antennas/ (or pointing
+$EVILLENS_ANTENNA_PATH at them) removes the need for CASA altogether.
+
+Parsed configurations are cached as .npy files in $EVILLENS_CACHE
+(default ~/.evillens/antennas/), keyed on the path, modification time
+and size of the .cfg file, and are also kept in memory for the rest of
+the session, so each configuration is only parsed once.
+"""
+# ======================================================================
+
+import os
+import hashlib
+import numpy as np
+
+# Configurations shipped with (or copied into) the package
+ANTENNA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),'antennas')
+
+# Parsed configurations of this session, keyed like the .npy cache
+_loaded_antenna_configs = {}
+
+# ======================================================================
+
+def antenna_config_path(path=None):
+    '''
+    The directories searched for antenna configurations, in order.
+    '''
+    if path is None:
+        path = []
+    elif isinstance(path,str):
+        path = path.split(os.pathsep)
+    else:
+        path = list(path)
+
+    path += [p for p in os.getenv('EVILLENS_ANTENNA_PATH','').split(os.pathsep) if p]
+    path.append(ANTENNA_DIR)
+
+    if os.getenv('CASAPATH') is not None:
+        path.append(os.path.join(os.getenv('CASAPATH').split(' ')[0],'data','alma','simmos'))
+
+    return path
+
+# ----------------------------------------------------------------------
+
+def find_antenna_config(antennaconfig, path=None):
+    '''
+    The file of an antenna configuration, given either its path or its
+    name (e.g. 'alma.cycle2.7.cfg').
+    '''
+    antennaconfig = str(antennaconfig)
+    if os.path.isfile(antennaconfig):
+        return antennaconfig
+
+    searched = antenna_config_path(path)
+    for directory in searched:
+        filename = os.path.join(directory,antennaconfig)
+        if os.path.isfile(filename):
+            return filename
+
+    raise IOError("antenna configuration {0} not found in {1}".format(antennaconfig,searched))
+
+# ----------------------------------------------------------------------
+
+def list_antenna_configs(path=None):
+    '''
+    Names of the .cfg files in the registry.
+    '''
+    names = set()
+    for directory in antenna_config_path(path):
+        if os.path.isdir(directory):
+            names.update(f for f in os.listdir(directory) if f.endswith('.cfg'))
+    return sorted(names)
+
+# ----------------------------------------------------------------------
+
+def antenna_cache_dir():
+    '''
+    The directory of the cached, parsed configurations.
+    '''
+    return os.getenv('EVILLENS_CACHE',os.path.join(os.path.expanduser('~'),'.evillens','antennas'))
+
+# ----------------------------------------------------------------------
+
+def load_antenna_config(antennaconfig, path=None, cache=True):
+    '''
+    Load an antenna configuration (a path, or a name in the registry).
+
+    Takes:
+
+    antennaconfig:  simobserve antenna configuration file, or its name
+
+    path:           extra directories to search before the defaults
+
+    cache:          if True, read and write the parsed .npy cache
+
+    Returns:
+
+    antennaparams:  [Nantennas,4] array of East, North, Up positions and
+                    diameters (in meters)
+    '''
+    filename = os.path.abspath(find_antenna_config(antennaconfig,path))
+    stat = os.stat(filename)
+    key = hashlib.sha1('{0}|{1!r}|{2}'.format(filename,stat.st_mtime,stat.st_size).encode()).hexdigest()[:16]
+
+    if key in _loaded_antenna_configs:
+        return _loaded_antenna_configs[key].copy()
+
+    cachefile = os.path.join(antenna_cache_dir(),'{0}.{1}.npy'.format(os.path.basename(filename),key))
+
+    antennaparams = None
+    if cache and os.path.isfile(cachefile):
+        try:
+            antennaparams = np.load(cachefile)
+        except (IOError,ValueError):
+            antennaparams = None
+
+    if antennaparams is None:
+        antennaparams = np.genfromtxt(filename,usecols=(0,1,2,3),comments='#',ndmin=2)
+        if cache:
+            try:
+                if not os.path.isdir(antenna_cache_dir()):
+                    os.makedirs(antenna_cache_dir())
+                np.save(cachefile,antennaparams)
+            except (IOError,OSError):
+                pass
+
+    _loaded_antenna_configs[key] = antennaparams
+
+    return antennaparams.copy()
+
+# ----------------------------------------------------------------------
+
+def register_antenna_config(name, enu, diam=12.0, directory=None, pads=None):
+    '''
+    Add an antenna configuration to the registry, as a simobserve .cfg
+    file in directory (by default, the package directory).
+
+    Takes:
+
+    name:       name of the configuration (e.g. 'compact.cfg')
+
+    enu:        [Nantennas,3] array of East, North, Up positions (in meters)
+
+    diam:       antenna diameters (in meters), one or one per antenna
+
+    directory:  where to write the file
+
+    pads:       pad names (default A001, A002, ...)
+
+    Returns:
+
+    filename:   the path of the new .cfg file
+    '''
+    enu = np.asarray(enu,float)
+    diam = np.broadcast_to(np.asarray(diam,float),len(enu))
+    if pads is None:
+        pads = ['A{0:03d}'.format(i+1) for i in range(len(enu))]
+
+    if directory is None:
+        directory = ANTENNA_DIR
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    filename = os.path.join(directory,name)
+    with open(filename,'w') as f:
+        f.write('# observatory=ALMA\n')
+        f.write('# coordsys=LOC (local tangent plane)\n')
+        f.write('# x y z diam pad#\n')
+        for (E,N,U),D,pad in zip(enu,diam,pads):
+            f.write('{0:.6f} {1:.6f} {2:.6f} {3:.2f} {4}\n'.format(E,N,U,D,pad))
+
+    return filename
+
+# ======================================================================
@@ -0,0 +1,137 @@
+"""
+Helpers for the binary files written by ms_to_bin, and read by the Ripples
+pipeline.  All files are flat arrays of native doubles.
+
+Per-channel files are named <name>_spw_<i>_chan_<j>.bin, while the
+antenna and time columns (ant_1.bin, ant_2.bin, time.bin) are shared by
+all channels.
+"""
+# ======================================================================
+
+import numpy as np
+import os
+import multiprocessing
+import evillens as evil
+
+# ======================================================================
+
+def read_binary(binaryfile,dtype='d'):
+    '''
+    Read a binary file into memory in a single call.
+    '''
+    return np.fromfile(binaryfile,dtype=dtype)
+
+# ----------------------------------------------------------------------
+
+def memmap_binary(binaryfile,dtype='d'):
+    '''
+    Memory-map a binary file (read only), so that it is paged in from
+    disk only when it is used.
+    '''
+    return np.memmap(binaryfile,dtype=dtype,mode='r')
+
+# ----------------------------------------------------------------------
+
+def write_ripples_binary(outputdir,vis,u,v,sigma,chan=None):
+    '''
+    Write a dataset as the binary files read by Ripples, with one bulk
+    write per file.
+    
+    Takes:
+    
+    outputdir:   Directory to write to (created if it doesn't exist)
+    
+    vis:         complex visibilities (written interleaved, real then imag)
+    
+    u,v:         uv coordinates (in wavelengths)
+    
+    sigma:       noise of each visibility (written as sigma**-2, for the
+                 real and imaginary parts)
+    
+    chan:        channel ID of each visibility (defaults to 0)
+    '''
+    if not os.path.exists(outputdir):
+        os.makedirs(outputdir)
+    
+    if chan is None:
+        chan = np.zeros(len(u))
+    
+    # a complex array viewed as doubles is already interleaved
+    np.ascontiguousarray(vis,complex).view(float).tofile(outputdir+'vis_chan_0.bin')
+    np.repeat(np.asarray(sigma,float)**-2,2).tofile(outputdir+'sigma_squared_inv.bin')
+    np.asarray(u,float).tofile(outputdir+'u.bin')
+    np.asarray(v,float).tofile(outputdir+'v.bin')
+    np.asarray(chan,float).tofile(outputdir+'chan.bin')
+    
+    return
+
+# ----------------------------------------------------------------------
+
+def ripples_memmaps(outputdir,Nvis):
+    '''
+    Preallocate the binary files of a Ripples dataset with Nvis
+    visibilities as writable memory maps, so that they can be filled one
+    block at a time.  Returns a dict keyed by file name (without .bin);
+    vis_chan_0 and sigma_squared_inv hold 2*Nvis interleaved doubles.
+    '''
+    if not os.path.exists(outputdir):
+        os.makedirs(outputdir)
+
+    files = {}
+    for name,length in [('vis_chan_0',2*Nvis),('sigma_squared_inv',2*Nvis),('u',Nvis),('v',Nvis), \
+                        ('ant1',Nvis),('ant2',Nvis),('time',Nvis),('chan',Nvis)]:
+        files[name] = np.memmap(outputdir+name+'.bin',dtype='d',mode='w+',shape=(length,))
+
+    return files
+
+# ----------------------------------------------------------------------
+
+def channel_file(direct,name,spw,chan):
+    '''
+    Name of the binary file holding column name for one spw and channel.
+    '''
+    return direct+'{0}_spw_{1}_chan_{2}.bin'.format(name,spw,chan)
+
+# ----------------------------------------------------------------------
+
+def channel_sigma_scaling(args):
+    '''
+    Compute the noise scaling of a single channel from its files.
+    Takes a tuple (direct,spw,chan,wavelength) so that it can be mapped
+    over a pool of worker processes.  Each worker memory-maps its own
+    channel, so only one channel per worker is ever read into memory.
+    '''
+    direct,spw,chan,wavelength = args
+
+    u     = memmap_binary(channel_file(direct,'u',spw,chan))*wavelength
+    v     = memmap_binary(channel_file(direct,'v',spw,chan))*wavelength
+    vis   = memmap_binary(channel_file(direct,'vis',spw,chan))
+    sigma = memmap_binary(channel_file(direct,'sigma',spw,chan))
+
+    vis = vis[::2]+1j*vis[1::2]
+
+    return evil.estimate_sigma_scaling(u,v,vis,sigma,cellsize=12.0,verbose=False)
+
+# ----------------------------------------------------------------------
+
+def map_channels(function,arglist,Nprocesses=None):
+    '''
+    Map function over arglist using a pool of Nprocesses worker processes
+    (defaults to the number of cpus).  With a single process, or a single
+    item, everything is run in this process.
+    '''
+    if Nprocesses is None:
+        Nprocesses = multiprocessing.cpu_count()
+    Nprocesses = min(Nprocesses,len(arglist))
+
+    if Nprocesses <= 1:
+        return [function(args) for args in arglist]
+
+    pool = multiprocessing.Pool(Nprocesses)
+    try:
+        results = pool.map(function,arglist)
+    finally:
+        pool.close()
+        pool.join()
+
+    return results
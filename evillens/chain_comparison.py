@@ -0,0 +1,170 @@
+"""
+Comparison of many MCMC runs (see Plot_utils.Compare_chains and
+Compare_Triangles), without holding any of their chains in memory.
+
+Each run (an MCMC object, or the directory of its chain_number_* files)
+is reduced, in a pool of worker processes, to the few small products the
+comparison plots draw:
+
+    Niter:               the last iteration used
+    iterations, traces:  the walkers, thinned to at most Npoints
+                         iterations  ([Nwalkers,Npoints,Nparameters])
+    ranges, edges:       the range of each parameter and its Nbins bins
+    hist1d, hist2d:      counts of the samples of each parameter, and of
+                         each pair of parameters, in those bins
+
+Directories are loaded by the workers themselves, as memory maps of
+their chain cache (see evil.load_chain_files), and read a chunk of
+iterations at a time.  MCMC objects are summarized in this process,
+since passing them to a worker would copy their chains.  Products that
+a plot does not draw (Npoints or Nbins None) are not computed.
+"""
+# ======================================================================
+
+import numpy as np
+import evillens as evil
+
+# ======================================================================
+
+def load_run(run):
+    '''
+    The MCMC object of run:  run itself, or the chains of the directory
+    run (ending in /), mapped from their cache.
+    '''
+    if isinstance(run,str):
+        chains = evil.load_chain_files(run,True,False,1)
+        MCMC = evil.MCMC()
+        MCMC.set_chains(chains[:,:,1:],chains[:,:,0])
+        return MCMC
+    return run
+
+# ----------------------------------------------------------------------
+
+def bin_indices(x, edges):
+    '''
+    Bin of each of samples x in edges (Nbins+1), or -1 outside of them.
+    '''
+    Nbins = len(edges)-1
+    i = np.floor((x-edges[0])*(Nbins/(edges[-1]-edges[0]))).astype(int)
+    i[x == edges[-1]] = Nbins-1
+    i[(i < 0) | (i >= Nbins) | ~np.isfinite(x)] = -1
+    return i
+
+# ----------------------------------------------------------------------
+
+def summarize_run(args):
+    '''
+    Reduce a run to the products drawn by the comparison plots.
+
+    Takes a tuple (run,Tburn,Niter,Npoints,Nbins,prange) so that it can
+    be mapped over a pool of worker processes:  the iterations from
+    Tburn up to Niter (None for all of them) are used, and the bins span
+    prange ([Nparameters,2]), or else the range of each parameter.
+    Returns a dictionary (see the module docstring).
+    '''
+    run , Tburn , Niter , Npoints , Nbins , prange = args
+    MCMC = load_run(run)
+
+    stop = MCMC.Niter if Niter is None else min(Niter,MCMC.Niter)
+    Nsteps = max(stop-Tburn,0)
+    P = MCMC.Nparameters
+    step = max(2**22//(MCMC.Nwalkers*P),1)
+    chunks = [slice(start,min(start+step,stop)) for start in range(Tburn,stop,step)]
+
+    summary = {'Niter':stop}
+    if Npoints is not None:
+        thin = max(int(np.ceil(Nsteps/float(Npoints))),1)
+        summary['iterations'] = np.arange(Tburn,stop,thin)
+        summary['traces'] = np.array(MCMC.selected_data(slice(Tburn,stop,thin)))
+    if Nbins is None:
+        return summary
+
+    if prange is None:
+        ranges = np.zeros([P,2])
+        ranges[:,0] , ranges[:,1] = np.inf , -np.inf
+        for chunk in chunks:
+            x = MCMC.selected_data(chunk)
+            ranges[:,0] = np.minimum(ranges[:,0],np.min(x,axis=(0,1)))
+            ranges[:,1] = np.maximum(ranges[:,1],np.max(x,axis=(0,1)))
+        # a parameter that never moved still gets bins around its value
+        flat = ranges[:,1] <= ranges[:,0]
+        ranges[flat,0] -= 0.5
+        ranges[flat,1] += 0.5
+    else:
+        ranges = np.array(prange,float)
+    edges = np.array([np.linspace(lo,hi,Nbins+1) for lo,hi in ranges])
+
+    hist1d = np.zeros([P,Nbins])
+    hist2d = np.zeros([P,P,Nbins,Nbins])
+    for chunk in chunks:
+        x = MCMC.selected_data(chunk).reshape(-1,P)
+        bins = [bin_indices(x[:,i],edges[i]) for i in range(P)]
+        for i in range(P):
+            hist1d[i] += np.bincount(bins[i][bins[i] >= 0],minlength=Nbins)
+            for j in range(i):
+                inside = (bins[i] >= 0) & (bins[j] >= 0)
+                hist2d[i,j] += np.bincount(bins[i][inside]*Nbins+bins[j][inside], \
+                                           minlength=Nbins**2).reshape(Nbins,Nbins)
+
+    summary.update({'ranges':ranges,'edges':edges,'hist1d':hist1d,'hist2d':hist2d})
+    return summary
+
+# ======================================================================
+
+def compare_runs(runs, Tburn=0, Niter=None, Npoints=500, Nbins=20, prange=None, Nprocesses=None):
+    '''
+    Summarize many runs for comparison.
+
+    Takes:
+
+    runs:        MCMC objects, or directories of chain_number_* files
+                 (ending in /), loaded only by the worker summarizing them
+
+    Tburn:       first iteration used
+
+    Niter:       last iteration used, for all runs or a list with one per
+                 run (None for all iterations)
+
+    Npoints:     iterations kept (at most) of each walker's trace, or None
+                 for no traces
+
+    Nbins:       bins of the histograms of each parameter, or None for no
+                 histograms
+
+    prange:      range of the bins of each parameter ([Nparameters,2]),
+                 or None for the range of each run
+
+    Nprocesses:  worker processes (defaults to the number of cpus)
+
+    Returns:
+
+    summaries:   list of the products of each run (see summarize_run)
+    '''
+    if Niter is None or np.isscalar(Niter):
+        Niter = [Niter]*len(runs)
+    arglist = [(run,Tburn,N,Npoints,Nbins,prange) for run,N in zip(runs,Niter)]
+
+    lazy = [i for i,run in enumerate(runs) if isinstance(run,str)]
+    summaries = [None]*len(runs)
+    for i,summary in zip(lazy,evil.map_channels(summarize_run,[arglist[i] for i in lazy],Nprocesses)):
+        summaries[i] = summary
+    for i in range(len(runs)):
+        if summaries[i] is None:
+            summaries[i] = summarize_run(arglist[i])
+
+    return summaries
+
+# ----------------------------------------------------------------------
+
+def credible_levels(H, levels):
+    '''
+    The heights of a histogram H above which lie the fractions levels
+    of its counts, in increasing order (for contour plots).
+    '''
+    Hflat = np.sort(H.ravel())[::-1]
+    cum = np.cumsum(Hflat)
+    cum /= cum[-1]
+    heights = [Hflat[min(np.searchsorted(cum,level),len(Hflat)-1)] for level in levels]
+    return np.unique(heights)
+
+# ======================================================================
@@ -0,0 +1,367 @@
+"""
+Online convergence diagnostics of MCMC chains (see MCMC.GelmanRubin),
+updated as rows are appended to the chains (e.g. by
+MCMC.load_chains_from(incremental=True)), at a cost that only depends on
+the new rows rather than on the length of the chains so far.
+
+GR:   the Gelman-Rubin statistic of each checkpoint i (every N rows)
+      compares the means and variances of the walkers over rows
+      i//2 to i, which are blocks i//N to 2i//N of N/2 rows.  The count,
+      mean and sum of squared deviations of each walker are accumulated
+      one block at a time (Welford/Chan updates), and those of rows i//2
+      to i are the difference of the running totals at rows i and i//2.
+
+GR2:  the interval based statistic compares the confidence intervals of
+      each walker, and of all walkers, over rows 0 to i.  Their quantiles
+      come from a t-digest of each walker and parameter:  a sorted set of
+      weighted centroids, finest in the tails, into which each new block
+      of rows is merged.  The digests of all walkers are merged for the
+      intervals of all walkers.  With enough compression (more than ~3
+      times the rows) every centroid is a single row, and the quantiles
+      are those of np.percentile.
+
+How many independent samples the chains hold is measured by the
+integrated autocorrelation time tau of each parameter (Goodman & Weare
+2010, Sokal 1997):  the autocorrelation function of every walker is
+computed by FFT, averaged over walkers, and summed out to the smallest
+window M >= c tau(M), beyond which it is mostly noise.  The effective
+sample size is then Nwalkers*Niter/tau, and keeping every ~tau/2 rows
+(thin_chains) loses little information.
+"""
+# ======================================================================
+
+import numpy as np
+
+# ======================================================================
+
+def chan_merge(a, b):
+    '''
+    Count, mean and sum of squared deviations of two sets of samples
+    together, from those (n,mean,M2) of each.
+    '''
+    n = a[0]+b[0]
+    if n == 0:
+        return a
+    delta = b[1]-a[1]
+    mean = a[1] + delta*b[0]/float(n)
+    M2 = a[2] + b[2] + delta**2*a[0]*b[0]/float(n)
+    return n , mean , M2
+
+# ----------------------------------------------------------------------
+
+def chan_difference(a, b):
+    '''
+    Count, mean and sum of squared deviations of the samples of a that
+    are not in b (b being a subset of a).
+    '''
+    n = a[0]-b[0]
+    if b[0] == 0:
+        return a
+    mean = (a[0]*a[1]-b[0]*b[1])/float(n)
+    delta = mean-b[1]
+    M2 = a[2] - b[2] - delta**2*b[0]*n/float(a[0])
+    return n , mean , M2
+
+# ----------------------------------------------------------------------
+
+def digest_quantile(means, weights, lo, hi, q, presorted=False):
+    '''
+    The quantiles q of each row of a set of weighted centroids (means of
+    weight 0 are ignored), between the smallest and largest samples lo
+    and hi, as a [len(q),Nrows] array.  Centroids are interpolated at
+    their centers in cumulative weight, so that single samples give the
+    quantiles of np.percentile.  If presorted, the centroids of each row
+    are already sorted, with those of weight 0 last.
+    '''
+    if not presorted:
+        order = np.argsort(means,axis=1,kind='stable')
+        means = np.take_along_axis(means,order,1)
+        weights = np.take_along_axis(weights,order,1)
+
+    total = np.sum(weights,axis=1)
+    centers = np.cumsum(weights,axis=1) - 0.5*weights
+    means = np.where(weights > 0,means,hi[:,None])
+    X = np.concatenate([np.zeros([len(total),1]),centers,total[:,None]],axis=1)
+    Y = np.concatenate([lo[:,None],means,hi[:,None]],axis=1)
+
+    target = np.atleast_1d(q)[:,None]*(total-1)+0.5
+    idx = np.clip(np.sum(X[None,:,:] <= target[:,:,None],axis=2),1,X.shape[1]-1)
+    rows = np.arange(len(total))
+    x0 , x1 = X[rows,idx-1] , X[rows,idx]
+    y0 , y1 = Y[rows,idx-1] , Y[rows,idx]
+    with np.errstate(divide='ignore',invalid='ignore'):
+        frac = np.where(x1 > x0,(target-x0)/(x1-x0),0.0)
+
+    return y0 + np.clip(frac,0,1)*(y1-y0)
+
+# ======================================================================
+
+class TDigest(object):
+    '''
+    Merging t-digests of Nrows streams of samples at once, each with at
+    most compression/2+1 centroids (with the arcsine scale function, so
+    that centroids are smallest in the tails).
+    '''
+    def __init__(self, Nrows, compression=400):
+
+        self.compression = float(compression)
+        self.Ncentroids = int(compression//2)+1
+        self.means = np.full([Nrows,self.Ncentroids],np.nan)
+        self.weights = np.zeros([Nrows,self.Ncentroids])
+        self.min = np.full(Nrows,np.inf)
+        self.max = np.full(Nrows,-np.inf)
+
+        return
+
+# ----------------------------------------------------------------------
+
+    def update(self, x):
+        '''
+        Merge new samples x ([Nrows,N]) into the digests.
+        '''
+        Nrows , G = self.weights.shape
+        x = np.asarray(x,float).reshape(Nrows,-1)
+        if x.shape[1] == 0:
+            return
+        self.min = np.minimum(self.min,np.min(x,axis=1))
+        self.max = np.maximum(self.max,np.max(x,axis=1))
+
+        # the centroids are kept sorted, so this merges two sorted runs
+        means = np.concatenate([self.means,np.sort(x,axis=1)],axis=1)
+        weights = np.concatenate([self.weights,np.ones(x.shape)],axis=1)
+        order = np.argsort(means,axis=1,kind='stable')
+        means = np.take_along_axis(means,order,1)
+        weights = np.take_along_axis(weights,order,1)
+
+        # centroids falling within each unit of the scale function
+        # k(q) = compression/(2 pi) asin(2q-1) are merged
+        cum = np.cumsum(weights,axis=1)
+        q = (cum-0.5*weights)/cum[:,-1:]
+        k = self.compression/(2*np.pi)*np.arcsin(np.clip(2*q-1,-1,1)) + self.compression/4.0
+        group = np.clip(k.astype(int),0,G-1) + G*np.arange(Nrows)[:,None]
+
+        wsum = np.bincount(group.ravel(),weights.ravel(),Nrows*G).reshape(Nrows,G)
+        xsum = np.bincount(group.ravel(),(np.where(weights > 0,means,0.0)*weights).ravel(),Nrows*G).reshape(Nrows,G)
+
+        # the centroids in order, then the empty groups
+        full = wsum > 0
+        slot = np.cumsum(full,axis=1)-1 + G*np.arange(Nrows)[:,None]
+        self.means = np.full(Nrows*G,np.nan)
+        self.weights = np.zeros(Nrows*G)
+        self.means[slot[full]] = xsum[full]/wsum[full]
+        self.weights[slot[full]] = wsum[full]
+        self.means = self.means.reshape(Nrows,G)
+        self.weights = self.weights.reshape(Nrows,G)
+
+        return
+
+# ----------------------------------------------------------------------
+
+    def quantile(self, q):
+        '''
+        The quantiles q of each stream ([len(q),Nrows]).
+        '''
+        return digest_quantile(self.means,self.weights,self.min,self.max,q,presorted=True)
+
+# ======================================================================
+
+class ChainDiagnostics(object):
+    '''
+    The Gelman-Rubin diagnostics of MCMC.GelmanRubin (GR and GR2, every
+    N rows, with confidence intervals of interval), for chains of
+    Nwalkers walkers and Nparameters parameters that are fed to update()
+    as they grow.
+    '''
+    def __init__(self, Nwalkers, Nparameters, N=100, interval=0.95, compression=400):
+
+        assert N % 2 == 0
+        assert interval >= 0
+        assert interval <= 1
+
+        self.Nwalkers = Nwalkers
+        self.Nparameters = Nparameters
+        self.N = N
+        self.interval = interval
+        self.Niter = 0
+
+        # rows of the last, incomplete block
+        self.pending = np.zeros([Nwalkers,0,Nparameters])
+
+        # moments of each walker over all blocks so far, and over the
+        # first k blocks for each checkpoint still to come
+        zero = np.zeros([Nwalkers,Nparameters])
+        self.Nblocks = 0
+        self.moments = (0,zero,zero)
+        self.block_moments = {0:self.moments}
+
+        self.digest = TDigest(Nwalkers*Nparameters,compression)
+        self.digest_rows = []
+
+        # diagnostics of every checkpoint so far
+        self.GR_checkpoints = []
+        self.GR2_checkpoints = []
+
+        return
+
+# ----------------------------------------------------------------------
+
+    def update(self, rows):
+        '''
+        Feed new rows of the chains ([Nwalkers,Nnew,Nparameters]).
+        '''
+        rows = np.asarray(rows,float)
+        half = self.N//2
+        self.Niter += rows.shape[1]
+
+        start = 0
+        if self.pending.shape[1] > 0:
+            start = min(half-self.pending.shape[1],rows.shape[1])
+            self.pending = np.concatenate([self.pending,rows[:,:start]],axis=1)
+            if self.pending.shape[1] < half:
+                return
+            self.add_block(self.pending)
+        while start+half <= rows.shape[1]:
+            self.add_block(rows[:,start:start+half])
+            start += half
+        self.pending = np.array(rows[:,start:])
+
+        return
+
+# ----------------------------------------------------------------------
+
+    def add_block(self, block):
+        '''
+        Accumulate a block of N/2 rows, and compute the diagnostics of the
+        checkpoint it completes (every other block).
+        '''
+        mean = np.mean(block,axis=1)
+        M2 = np.sum((block-mean[:,None,:])**2,axis=1)
+        self.moments = chan_merge(self.moments,(block.shape[1],mean,M2))
+        self.Nblocks += 1
+        self.block_moments[self.Nblocks] = self.moments
+
+        # the digests only need to be up to date at the checkpoints
+        self.digest_rows.append(np.transpose(block,[0,2,1]).reshape(self.Nwalkers*self.Nparameters,-1))
+        if self.Nblocks % 2 == 1:
+            return
+        self.digest.update(np.concatenate(self.digest_rows,axis=1))
+        self.digest_rows = []
+        k = self.Nblocks//2
+
+        # GR, over rows i//2 to i
+        n , xj , M2 = chan_difference(self.moments,self.block_moments.pop(k))
+        m = self.Nwalkers
+        x = np.mean(xj,axis=0)
+        W2 = np.sum(M2,axis=0)/(m*(n-1.0))
+        B2 = n/float(m-1)*np.sum((xj-x)**2,axis=0)
+        v2 = (n-1)/float(n)*W2 + B2/float(n)
+        self.GR_checkpoints.append((m+1)/float(m)*v2/W2 - (n-1)/float(m*n))
+
+        # GR2, over rows 0 to i
+        up , dn = 0.5+self.interval/2.0 , 0.5-self.interval/2.0
+        Pm = self.digest.quantile([up,dn])
+        Clm = (Pm[0]-Pm[1]).reshape(m,self.Nparameters)
+        means = np.transpose(self.digest.means.reshape(m,self.Nparameters,-1),[1,0,2]).reshape(self.Nparameters,-1)
+        weights = np.transpose(self.digest.weights.reshape(m,self.Nparameters,-1),[1,0,2]).reshape(self.Nparameters,-1)
+        lo = np.min(self.digest.min.reshape(m,self.Nparameters),axis=0)
+        hi = np.max(self.digest.max.reshape(m,self.Nparameters),axis=0)
+        Pt = digest_quantile(means,weights,lo,hi,[up,dn])
+        Clt = Pt[0]-Pt[1]
+        self.GR2_checkpoints.append(Clt/np.mean(Clm,axis=0))
+
+        return
+
+# ----------------------------------------------------------------------
+
+    def checkpoints(self):
+        '''
+        Number of checkpoints i = N, 2N, ... with i < Niter-N (those of
+        MCMC.GelmanRubin).
+        '''
+        return len(range(self.N,self.Niter-self.N,self.N))
+
+    @property
+    def GR(self):
+        return np.reshape(self.GR_checkpoints[:self.checkpoints()],[-1,self.Nparameters])
+
+    @property
+    def GR2(self):
+        return np.reshape(self.GR2_checkpoints[:self.checkpoints()],[-1,self.Nparameters])
+
+# ======================================================================
+
+def autocorrelation_function(x):
+    '''
+    Normalised autocorrelation function of each walker and parameter of
+    chains x ([Nwalkers,Niter,Nparameters]), by FFT (zero padded so that
+    it does not wrap around).
+    '''
+    x = np.asarray(x,float)
+    Niter = x.shape[1]
+    n = 2**int(np.ceil(np.log2(2*Niter)))
+    x = x - np.mean(x,axis=1,keepdims=True)
+    f = np.fft.rfft(x,n=n,axis=1)
+    acf = np.fft.irfft(f*np.conj(f),n=n,axis=1)[:,:Niter]
+    with np.errstate(divide='ignore',invalid='ignore'):
+        return acf/acf[:,:1]
+
+# ----------------------------------------------------------------------
+
+def autocorrelation_time(x, c=5.0, chunksize=2**22):
+    '''
+    Integrated autocorrelation time of each parameter of chains x
+    ([Nwalkers,Niter,Nparameters]), from the autocorrelation function
+    averaged over walkers, summed out to the smallest window M with
+    M >= c*tau(M).
+
+    Takes:
+
+    x:          chains (e.g. MCMC.data, or a memory map of them)
+
+    c:          window, in autocorrelation times
+
+    chunksize:  largest number of (padded) samples transformed at once
+    '''
+    Nwalkers , Niter , Nparameters = x.shape
+    n = 2**int(np.ceil(np.log2(2*Niter)))
+    series = max(chunksize//n,1)
+    pstep = min(Nparameters,series)
+    wstep = max(series//pstep,1)
+
+    tau = np.zeros(Nparameters)
+    for p0 in range(0,Nparameters,pstep):
+        p1 = min(p0+pstep,Nparameters)
+        acf = np.zeros([Niter,p1-p0])
+        for w0 in range(0,Nwalkers,wstep):
+            acf += np.sum(autocorrelation_function(x[w0:w0+wstep,:,p0:p1]),axis=0)
+        acf /= Nwalkers
+
+        # tau(M) = 1 + 2 sum_{t=1}^{M} acf(t)
+        taus = 2*np.cumsum(acf,axis=0)-1
+        inside = np.arange(Niter)[:,None] < c*taus
+        window = np.where(np.all(inside,axis=0),Niter-1,np.argmin(inside,axis=0))
+        tau[p0:p1] = taus[window,np.arange(p1-p0)]
+
+    return tau
+
+# ----------------------------------------------------------------------
+
+def effective_sample_size(x, tau=None, c=5.0):
+    '''
+    Effective number of independent samples of each parameter of chains
+    x ([Nwalkers,Niter,Nparameters]), Nwalkers*Niter/tau.
+    '''
+    if tau is None:
+        tau = autocorrelation_time(x,c)
+    return x.shape[0]*x.shape[1]/np.asarray(tau,float)
+
+# ----------------------------------------------------------------------
+
+def thin_chains(x, thin):
+    '''
+    Every thin-th row of chains x ([Nwalkers,Niter,...]), copied into
+    memory (e.g. from a memory map) for plotting.
+    '''
+    return np.ascontiguousarray(x[:,::max(int(thin),1)])
+
+# ======================================================================
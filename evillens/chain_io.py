@@ -0,0 +1,195 @@
+"""
+Fast loading of Blueberry MCMC chains (the chain_number_* text files,
+one per walker, each row chi2 followed by the parameters).
+
+The text files are parsed in a pool of worker processes, each with a
+single np.fromstring over the whole file rather than np.loadtxt line by
+line.  The chains are then written, alongside the text files, to a
+binary cache of native doubles,
+
+    chain_cache.bin:    [Niter,Nwalkers,1+Nparameters], C order
+    chain_cache.json:   the walker files, with the size and modification
+                        time of each when it was read, and how far (in
+                        bytes) it has been read
+
+and are returned as a memory map of the cache.  A later load with the
+text files unchanged just maps the cache again.  While a run is still
+going, an incremental load only parses the rows appended to each file
+since the last load, and appends them to the cache (only rows that
+every walker has reached are used, the rest are read again next time).
+"""
+# ======================================================================
+
+import os
+import re
+import glob
+import json
+import numpy as np
+import evillens as evil
+
+# ======================================================================
+
+def chain_files(targetdir):
+    '''
+    The chain_number_* files of targetdir, in walker number order.
+    '''
+    filenames = glob.glob(targetdir+'chain_number_*')
+    key = lambda f: [int(s) if s.isdigit() else s for s in re.split('([0-9]+)',os.path.basename(f))]
+    return sorted(filenames,key=key)
+
+# ----------------------------------------------------------------------
+
+def parse_chain_text(args):
+    '''
+    Parse the complete rows of a chain text file from byte offset on.
+
+    Takes a tuple (filename,offset) so that it can be mapped over a pool
+    of worker processes.  Returns the rows ([N,Ncolumns]) and the byte
+    offset of the end of each row.
+    '''
+    filename,offset = args
+
+    with open(filename,'rb') as f:
+        f.seek(offset)
+        text = f.read()
+
+    # a live run may be half way through writing its last row
+    text = text[:text.rfind(b'\n')+1]
+    ends = offset + np.flatnonzero(np.frombuffer(text,np.uint8) == ord('\n')) + 1
+    if len(ends) == 0:
+        return np.zeros([0,0]) , np.zeros(0,int)
+
+    Ncolumns = len(text[:ends[0]-offset].split())
+    try:
+        values = np.fromstring(text,sep=' ')
+    except ValueError:
+        values = np.zeros(0)
+    if Ncolumns > 0 and values.size == len(ends)*Ncolumns:
+        rows = values.reshape(len(ends),Ncolumns)
+    else:
+        # blank or commented lines, which np.loadtxt skips
+        lines = text.split(b'\n')[:-1]
+        valid = [len(line.split(b'#')[0].split()) > 0 for line in lines]
+        ends = ends[np.array(valid,bool)]
+        rows = np.loadtxt([line.decode() for line,v in zip(lines,valid) if v],ndmin=2)
+        if len(ends) == 0:
+            rows = np.zeros([0,0])
+
+    return rows , ends
+
+# ----------------------------------------------------------------------
+
+def chain_cache_files(targetdir):
+    '''
+    Names of the binary cache and of its index, in targetdir.
+    '''
+    return targetdir+'chain_cache.bin' , targetdir+'chain_cache.json'
+
+# ----------------------------------------------------------------------
+
+def map_chain_cache(targetdir, index):
+    '''
+    The cached chains, as a read only [Nwalkers,Niter,Ncolumns] memory map.
+    '''
+    binfile , _ = chain_cache_files(targetdir)
+    shape = (index['Niter'],len(index['files']),index['Ncolumns'])
+    if index['Niter'] == 0:
+        return np.zeros(shape).transpose(1,0,2)
+    return np.memmap(binfile,dtype='d',mode='r',shape=shape).transpose(1,0,2)
+
+# ======================================================================
+
+def load_chain_files(targetdir, cache=True, incremental=False, Nprocesses=None):
+    '''
+    Load the chains of targetdir.
+
+    Takes:
+
+    targetdir:    directory of the chain_number_* files (ending in /)
+
+    cache:        if True, use (and update) the binary cache
+
+    incremental:  if True, and there is a cache, only read the rows
+                  appended since it was written
+
+    Nprocesses:   worker processes used to parse the files (defaults to
+                  the number of cpus)
+
+    Returns:
+
+    chains:       [Nwalkers,Niter,1+Nparameters] array, chi2 first
+    '''
+    if incremental and not cache:
+        raise Exception("incremental loads need the chain cache \n")
+
+    filenames = chain_files(targetdir)
+    names = [os.path.basename(f) for f in filenames]
+    stats = [os.stat(f) for f in filenames]
+    sizes = [s.st_size for s in stats]
+    mtimes = [s.st_mtime for s in stats]
+    binfile , indexfile = chain_cache_files(targetdir)
+
+    index = None
+    if cache and os.path.isfile(indexfile) and os.path.isfile(binfile):
+        with open(indexfile) as f:
+            index = json.load(f)
+        if index['files'] != names:
+            index = None
+
+    # unchanged since the cache was written
+    if index is not None and index['sizes'] == sizes and index['mtimes'] == mtimes:
+        return map_chain_cache(targetdir,index)
+
+    # only the appended rows, unless a file has been rewritten
+    if index is None or not incremental or np.any(np.array(sizes) < np.array(index['offsets'])):
+        index = None
+        offsets = [0]*len(filenames)
+    else:
+        offsets = index['offsets']
+
+    parsed = evil.map_channels(parse_chain_text,list(zip(filenames,offsets)),Nprocesses)
+    Nnew = min([len(rows) for rows,ends in parsed]) if len(parsed) > 0 else 0
+    if index is not None:
+        # some walker has no new complete row yet (it was only touched, is
+        # behind the others, or is half way through a row):  the cache is
+        # still up to date, and the rows the others have appended are read
+        # once every walker has reached them
+        if Nnew == 0:
+            return map_chain_cache(targetdir,index)
+        Ncolumns = index['Ncolumns']
+        if any([rows.shape[1] != Ncolumns for rows,ends in parsed]):
+            raise Exception("appended rows of {0} do not match the chain cache \n".format(targetdir))
+    else:
+        Ncolumns = max([rows.shape[1] for rows,ends in parsed]) if len(parsed) > 0 else 0
+
+    block = np.zeros([Nnew,len(filenames),Ncolumns])
+    if Nnew > 0:
+        for i,(rows,ends) in enumerate(parsed):
+            block[:,i,:] = rows[:Nnew]
+
+    if not cache:
+        return block.transpose(1,0,2)
+
+    # rewrite the cache (as a new file, so that chains mapped by earlier
+    # loads stay valid), or append to it, cutting any rows of an
+    # interrupted append beyond the end of the index
+    if index is None:
+        Niter = 0
+        block.tofile(binfile+'.tmp')
+        os.rename(binfile+'.tmp',binfile)
+    else:
+        Niter = index['Niter']
+        with open(binfile,'r+b') as f:
+            f.seek(Niter*len(filenames)*Ncolumns*block.itemsize)
+            f.truncate()
+            block.tofile(f)
+
+    index = {'files':names,'sizes':sizes,'mtimes':mtimes,'Niter':Niter+Nnew,'Ncolumns':Ncolumns, \
+             'offsets':[int(ends[Nnew-1]) if Nnew > 0 else offsets[i] for i,(rows,ends) in enumerate(parsed)]}
+    with open(indexfile+'.tmp','w') as f:
+        json.dump(index,f)
+    os.rename(indexfile+'.tmp',indexfile)
+
+    return map_chain_cache(targetdir,index)
+
+# ======================================================================
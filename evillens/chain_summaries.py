@@ -0,0 +1,155 @@
+"""
+Posterior summaries of MCMC chains (see MCMC.summarize):  means,
+covariances, quantiles and highest posterior density (HPD) intervals of
+all parameters at once, optionally with importance weights (e.g.
+exp(-chi2/2), as in MCMC.Get_PostMean).
+
+The moments are accumulated a chunk of samples at a time (weighted
+Welford/Chan merges), so the chains are never read into memory whole.
+Quantiles are found by selection rather than sorting:  a single
+np.partition of each block of parameters places every sample needed by
+every quantile at once (with the linear interpolation of np.percentile).
+Weighted quantiles and HPD intervals need the samples in order, so they
+come from a single sort of each block of parameters.
+"""
+# ======================================================================
+
+import numpy as np
+
+# ======================================================================
+
+def chi2_weights(chi2):
+    '''
+    Importance weights exp(-chi2/2) (relative to the smallest chi2, so
+    that they do not underflow), normalised to sum to one.
+    '''
+    chi2 = np.asarray(chi2,float)
+    w = np.exp(-0.5*(chi2-np.min(chi2)))
+    return w/np.sum(w)
+
+# ----------------------------------------------------------------------
+
+def weighted_moments(x, w=None):
+    '''
+    Total weight, total squared weight, mean and weighted sum of the
+    outer products of the deviations of samples x ([N,Nparameters]).
+    '''
+    x = np.asarray(x,float)
+    if w is None:
+        w = np.ones(len(x))
+    w = np.asarray(w,float)
+    W = np.sum(w)
+    if W == 0:
+        return 0.0 , 0.0 , np.zeros(x.shape[1]) , np.zeros([x.shape[1],x.shape[1]])
+    mean = np.dot(w,x)/W
+    dx = x-mean
+    return W , np.sum(w**2) , mean , np.dot((dx*w[:,None]).T,dx)
+
+# ----------------------------------------------------------------------
+
+def merge_moments(a, b):
+    '''
+    The moments (as weighted_moments) of two sets of samples together.
+    '''
+    W = a[0]+b[0]
+    if W == 0:
+        return a
+    d = b[2]-a[2]
+    mean = a[2] + d*b[0]/W
+    C = a[3] + b[3] + np.outer(d,d)*a[0]*b[0]/W
+    return W , a[1]+b[1] , mean , C
+
+# ----------------------------------------------------------------------
+
+def moments_covariance(moments):
+    '''
+    Unbiased covariance from moments (as np.cov without weights).
+    '''
+    W , W2 , mean , C = moments
+    return C/(W-W2/W)
+
+# ======================================================================
+
+def partition_quantiles(x, q):
+    '''
+    Quantiles q of each column of samples x ([N,Nparameters]), as
+    np.percentile (linear interpolation), with one np.partition.
+    '''
+    q = np.atleast_1d(np.asarray(q,float))
+    N = len(x)
+    position = q*(N-1)
+    lo = np.floor(position).astype(int)
+    hi = np.minimum(lo+1,N-1)
+    part = np.partition(x,np.unique(np.concatenate([lo,hi])),axis=0)
+    t = (position-lo)[:,None]
+    return part[lo] + t*(part[hi]-part[lo])
+
+# ----------------------------------------------------------------------
+
+def sorted_quantiles(xs, ws, q):
+    '''
+    Quantiles q of each column of sorted samples xs with weights ws
+    ([N,Nparameters]), interpolated at the centers of the samples in
+    cumulative weight (for equal weights, as np.percentile).
+    '''
+    q = np.atleast_1d(np.asarray(q,float))
+    cum = np.cumsum(ws,axis=0)
+    W = cum[-1]
+    centers = (cum-0.5*ws-0.5*ws[0])/(W-0.5*ws[0]-0.5*ws[-1])
+    Q = np.zeros([len(q),xs.shape[1]])
+    for i in range(xs.shape[1]):
+        Q[:,i] = np.interp(q,centers[:,i],xs[:,i])
+    return Q
+
+# ----------------------------------------------------------------------
+
+def sorted_hpd(xs, ws, mass):
+    '''
+    Shortest intervals ([len(mass),Nparameters,2]) holding mass of the
+    weight of each column of sorted samples xs with weights ws.
+    '''
+    mass = np.atleast_1d(np.asarray(mass,float))
+    N , P = xs.shape
+    cum = np.cumsum(ws,axis=0)
+    cum /= cum[-1]
+    before = cum-ws/np.sum(ws,axis=0)
+
+    hpd = np.zeros([len(mass),P,2])
+    for k,m in enumerate(mass):
+        for i in range(P):
+            # the last sample of the shortest run holding m from each sample
+            last = np.searchsorted(cum[:,i],before[:,i]+m*(1-1e-12),'left')
+            valid = np.flatnonzero(last < N)
+            width = xs[last[valid],i]-xs[valid,i]
+            first = valid[np.argmin(width)]
+            hpd[k,i] = xs[first,i] , xs[last[first],i]
+    return hpd
+
+# ----------------------------------------------------------------------
+
+def sample_summary(x, w=None, quantiles=(), hpd=()):
+    '''
+    Quantiles ([len(quantiles),Nparameters]) and HPD intervals
+    ([len(hpd),Nparameters,2]) of each column of samples x
+    ([N,Nparameters]), with weights w (one per sample) if given.
+    '''
+    x = np.asarray(x,float)
+    if w is None and len(hpd) == 0:
+        return partition_quantiles(x,quantiles) , np.zeros([0,x.shape[1],2])
+
+    if w is None:
+        xs = np.sort(x,axis=0)
+        ws = np.ones(xs.shape)
+    else:
+        order = np.argsort(x,axis=0)
+        xs = x[order,np.arange(x.shape[1])]
+        ws = np.asarray(w,float)[order]
+
+    if w is None:
+        Q = partition_quantiles(xs,quantiles)
+    else:
+        Q = sorted_quantiles(xs,ws,quantiles)
+
+    return Q , sorted_hpd(xs,ws,hpd)
+
+# ======================================================================
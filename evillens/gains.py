@@ -0,0 +1,118 @@
+"""
+Antenna based gain corruptions for visibility data.
+
+Every visibility measured on baseline (i,j) is corrupted by the complex
+gains of its two antennas,
+
+    V_ij' = g_i * conj(g_j) * V_ij
+
+where the gains are allowed to vary between spectral windows and between
+time intervals.  The gains are drawn once into a small
+[Nspw, Nintervals, Nantennas] table, and applied to the data with a single
+gather-multiply.  Because the table only depends on the random seed (and
+not on the data), the visibilities can be corrupted in arbitrary chunks
+and the result is identical to corrupting everything at once.
+"""
+# ======================================================================
+
+import numpy as np
+import evillens as evil
+
+# ======================================================================
+
+def draw_antenna_gains(Nantennas,Nintervals=1,Nspw=1,amp_rms=0.0,phase_rms=0.0,seed=1):
+    '''
+    Draw a table of complex antenna gains.
+
+    Takes:
+
+    Nantennas:   Number of antennas
+
+    Nintervals:  Number of time intervals over which the gains are constant
+
+    Nspw:        Number of spectral windows
+
+    amp_rms:     rms of the gain amplitudes (gaussian, centered on 1)
+
+    phase_rms:   rms of the gain phases (gaussian, in radians)
+
+    seed:        random seed.  The same seed always gives the same table.
+
+    Returns:
+
+    gains:       complex array of shape [Nspw, Nintervals, Nantennas]
+    '''
+
+    shape = (int(Nspw),int(Nintervals),int(Nantennas))
+    rng = evil.random_stream(seed,'gains')
+
+    amp   = rng.normal(1.0,amp_rms,shape)
+    phase = rng.normal(0.0,phase_rms,shape)
+
+    return amp*np.exp(1j*phase)
+
+# ----------------------------------------------------------------------
+
+def apply_antenna_gains(vis,ant1,ant2,gains,interval=None,spw=None):
+    '''
+    Multiply visibilities by the gains of their antennas.
+
+    Takes:
+
+    vis:         complex visibilities (any chunk of the data)
+
+    ant1,ant2:   integer antenna IDs of each visibility
+
+    gains:       gain table from draw_antenna_gains
+
+    interval:    time interval ID of each visibility (None if the
+                 table has a single interval)
+
+    spw:         spectral window ID of each visibility (None if the
+                 table has a single spw)
+
+    Returns:
+
+    vis_new:     the corrupted visibilities
+    '''
+
+    ant1 = np.asarray(ant1,int)
+    ant2 = np.asarray(ant2,int)
+
+    if interval is None:
+        interval = 0
+    if spw is None:
+        spw = 0
+
+    g1 = gains[spw,interval,ant1]
+    g2 = gains[spw,interval,ant2]
+
+    # The complex products are written out in real arithmetic.  numpy's
+    # vectorised complex multiply rounds differently depending on where an
+    # element falls in the array, which would make the result depend on
+    # the chunking.
+    gr = g1.real*g2.real + g1.imag*g2.imag
+    gi = g1.imag*g2.real - g1.real*g2.imag
+
+    vis_new = np.empty(np.shape(vis),complex)
+    vis_new.real = vis.real*gr - vis.imag*gi
+    vis_new.imag = vis.real*gi + vis.imag*gr
+
+    return vis_new
+
+# ----------------------------------------------------------------------
+
+def apply_antenna_gains_in_chunks(vis,ant1,ant2,gains,interval=None,spw=None,chunksize=10**6):
+    '''
+    Corrupt the visibilities in place, chunksize rows at a time, so that
+    the temporary gain arrays never exceed the size of one chunk.  vis may
+    be a memory-mapped array.
+    '''
+
+    for start in range(0,len(vis),chunksize):
+        s = slice(start,start+chunksize)
+        vis[s] = apply_antenna_gains(vis[s],ant1[s],ant2[s],gains, \
+                                     None if interval is None else interval[s], \
+                                     None if spw is None else spw[s])
+
+    return vis
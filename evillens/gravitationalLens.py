@@ -763,6 +763,33 @@ class GravitationalLens(object):
                             
         return
 
+# ---------------------------------------------------------------------
+
+    def add_point_masses(self, M, positions, **kwargs):
+        '''
+        Add the deflection of point masses (stars, planets, MACHOs) to the
+        deflection angles of the lens, on the image grid.  Any number of
+        point masses are added at once (see evil.point_mass_deflection,
+        which is passed any kwargs).
+        
+        Takes:
+        
+        - M:          masses of the point masses (in solar masses)
+        
+        - positions:  [N,2] positions of the point masses (in arcsec)
+        '''
+        if self.alpha_x is None:
+            raise Exception('Need main lens deflection angles \n')
+        
+        positions = np.atleast_2d(positions)
+        thetaE2 = evil.point_mass_thetaE2(M,self.Dd,self.Ds,self.Dds)
+        alpha_x,alpha_y = evil.point_mass_deflection(self.image_x,self.image_y, \
+                                                     positions[:,0],positions[:,1],thetaE2,**kwargs)
+        self.alpha_x = self.alpha_x + alpha_x
+        self.alpha_y = self.alpha_y + alpha_y
+        
+        return
+
 # ---------------------------------------------------------------------
 
     def __add__(self,right):
@@ -0,0 +1,189 @@
+"""
+Magnification maps of microlenses by inverse ray shooting.
+
+Rays are shot on a regular grid through the image plane of the lens,
+deflected, and binned onto a grid of source plane pixels.  The number of
+rays landing in a pixel, relative to the number that would land there
+without the lens, is the magnification of a point source in that pixel
+(averaged over the pixel).  Once the map is made, the magnification of
+a source of any size along any trajectory is just the map convolved with
+the source profile, looked up along the trajectory:  a whole light
+curve takes milliseconds, instead of raytracing the source at every
+point.
+
+Most rays land far from a small source plane map (e.g. a strip around
+the trajectory of a light curve), so rays are shot in two levels:  the
+image plane is divided into cells of refine x refine rays, the corners
+of each cell are deflected first, and only the cells whose corners land
+near the map, and their neighbours, are filled with rays.  The rays are
+those of the uniform grid (refine=1), aligned with the map pixels, so
+the map is that of the uniform grid at a fraction of the cost, unless a
+cell folds onto the map across a caustic while the corners of it and of
+all its neighbours land away from it (smaller refine makes this less
+likely;  refine=1 shoots every ray).
+
+The deflection is any function of x,y, e.g. that of a star and its
+planets from evil.point_mass_deflection.
+"""
+# ======================================================================
+
+import numpy as np
+from scipy import ndimage
+
+# ======================================================================
+
+def shoot_rays(deflection, image_extent, map_extent, map_shape, Nrays=4, refine=16, chunksize=2**22):
+    '''
+    Point source magnification map, by inverse ray shooting.
+
+    Takes:
+
+    deflection:    function of image plane x,y returning alpha_x,alpha_y
+
+    image_extent:  [xmin,xmax,ymin,ymax] of the image plane region to
+                   shoot rays through (must contain every image of the
+                   map)
+
+    map_extent:    [xmin,xmax,ymin,ymax] of the source plane map
+
+    map_shape:     [NY,NX] pixels of the map
+
+    Nrays:         rays per map pixel side (Nrays**2 rays per pixel,
+                   without the lens)
+
+    refine:        rays per side of the cells used to find the parts of
+                   the image plane that land on the map (1 shoots every
+                   ray)
+
+    chunksize:     maximum number of rays deflected at once
+
+    Returns:
+
+    magnification: [NY,NX] map
+    '''
+    NY , NX = map_shape
+    xmin , xmax , ymin , ymax = map_extent
+    pix_x = (xmax-xmin)/float(NX)
+    pix_y = (ymax-ymin)/float(NY)
+    ray_dx = pix_x/Nrays
+    ray_dy = pix_y/Nrays
+
+    # cells of refine x refine rays, covering the image plane region (with
+    # one cell to spare).  The grid is aligned with the map pixels, so that
+    # every ray is a half-integer number of ray spacings from the map edge:
+    # no ray lands on a pixel edge without deflection, and every refine
+    # shoots the same rays.
+    Ncx = int(np.ceil((image_extent[1]-image_extent[0])/(refine*ray_dx)))+1
+    Ncy = int(np.ceil((image_extent[3]-image_extent[2])/(refine*ray_dy)))+1
+    x0 = 0.5*(image_extent[0]+image_extent[1]) - 0.5*Ncx*refine*ray_dx
+    y0 = 0.5*(image_extent[2]+image_extent[3]) - 0.5*Ncy*refine*ray_dy
+    x0 = xmin - np.round((xmin-x0)/ray_dx)*ray_dx
+    y0 = ymin - np.round((ymin-y0)/ray_dy)*ray_dy
+
+    if refine > 1:
+        # deflect the cell corners, and keep the cells whose corners land
+        # within two cell sizes (in the source plane) of the map, and their
+        # neighbours (a cell folded across a caustic can land on the map
+        # between its corners)
+        cx , cy = np.meshgrid(x0+np.arange(Ncx+1)*refine*ray_dx,y0+np.arange(Ncy+1)*refine*ray_dy)
+        ax , ay = deflection(cx,cy)
+        with np.errstate(invalid='ignore'):
+            bx , by = cx-ax , cy-ay
+            corners_x = np.array([bx[:-1,:-1],bx[1:,:-1],bx[:-1,1:],bx[1:,1:]])
+            corners_y = np.array([by[:-1,:-1],by[1:,:-1],by[:-1,1:],by[1:,1:]])
+            lox , hix = corners_x.min(axis=0) , corners_x.max(axis=0)
+            loy , hiy = corners_y.min(axis=0) , corners_y.max(axis=0)
+            wx , wy = hix-lox , hiy-loy
+            keep = (hix+2*wx >= xmin) & (lox-2*wx <= xmax) & (hiy+2*wy >= ymin) & (loy-2*wy <= ymax)
+        # cells containing a singularity (nan or inf corners) are kept
+        keep |= ~(np.isfinite(wx) & np.isfinite(wy))
+        keep = ndimage.binary_dilation(keep,np.ones([3,3],bool))
+        celly , cellx = np.nonzero(keep)
+    else:
+        celly , cellx = np.nonzero(np.ones([Ncy,Ncx],bool))
+
+    # offsets of the rays within a cell
+    ox , oy = np.meshgrid((np.arange(refine)+0.5)*ray_dx,(np.arange(refine)+0.5)*ray_dy)
+    ox , oy = ox.ravel() , oy.ravel()
+
+    counts = np.zeros(NX*NY)
+    step = max(chunksize//refine**2,1)
+    for start in range(0,len(cellx),step):
+        s = slice(start,start+step)
+        X = (x0 + cellx[s]*refine*ray_dx)[:,None] + ox
+        Y = (y0 + celly[s]*refine*ray_dy)[:,None] + oy
+        ax , ay = deflection(X,Y)
+
+        with np.errstate(invalid='ignore'):
+            fx = (X-ax-xmin)/pix_x
+            fy = (Y-ay-ymin)/pix_y
+            inside = (fx >= 0) & (fx < NX) & (fy >= 0) & (fy < NY)
+        counts += np.bincount(fy[inside].astype(int)*NX+fx[inside].astype(int),minlength=NX*NY)
+
+    return counts.reshape(NY,NX) * (ray_dx*ray_dy)/(pix_x*pix_y)
+
+# ----------------------------------------------------------------------
+
+def image_plane_extent(map_extent, xl, yl, thetaE2, margin=1.1):
+    '''
+    A square image plane region containing all images of the source
+    plane map_extent, for point masses at xl,yl with squared Einstein
+    radii thetaE2:  the images of a point at distance R from a point lens
+    of the total mass are within (R+sqrt(R^2+4 thetaE^2))/2 of it, and
+    the point masses are spread around their center of mass.
+    '''
+    xl , yl , thetaE2 = np.atleast_1d(xl) , np.atleast_1d(yl) , np.atleast_1d(thetaE2)
+    xc = np.sum(xl*thetaE2)/np.sum(thetaE2)
+    yc = np.sum(yl*thetaE2)/np.sum(thetaE2)
+    R = np.max(np.hypot(np.array(map_extent[:2])[:,None]-xc,np.array(map_extent[2:])[None,:]-yc))
+    halfwidth = margin*(R+np.sqrt(R**2+4*np.sum(thetaE2)))/2.0 + np.max(np.hypot(xl-xc,yl-yc))
+    return [xc-halfwidth,xc+halfwidth,yc-halfwidth,yc+halfwidth]
+
+# ======================================================================
+
+class MagnificationMap(object):
+    '''
+    A point source magnification map over extent [xmin,xmax,ymin,ymax],
+    from which light curves of sources of any size are looked up.
+    '''
+    def __init__(self, magnification, extent):
+
+        self.magnification = np.asarray(magnification,float)
+        self.extent = [float(e) for e in extent]
+        self.NY , self.NX = self.magnification.shape
+        self.pix_x = (self.extent[1]-self.extent[0])/self.NX
+        self.pix_y = (self.extent[3]-self.extent[2])/self.NY
+
+        # maps convolved with sources of each size so far
+        self.convolved_maps = {}
+
+        return
+
+# ----------------------------------------------------------------------
+
+    def convolved(self, sigma):
+        '''
+        The map convolved with a circular gaussian source of width sigma
+        (normalized to unit flux).
+        '''
+        sigma = float(sigma)
+        if sigma <= 0:
+            return self.magnification
+        if sigma not in self.convolved_maps:
+            self.convolved_maps[sigma] = ndimage.gaussian_filter(self.magnification, \
+                                         [sigma/self.pix_y,sigma/self.pix_x],mode='nearest')
+        return self.convolved_maps[sigma]
+
+# ----------------------------------------------------------------------
+
+    def light_curve(self, x, y, sigma=0.0):
+        '''
+        Magnification of a gaussian source of width sigma centered at
+        each x,y (bilinear interpolation between pixel centers).
+        '''
+        mu = self.convolved(sigma)
+        i = (np.asarray(y,float)-self.extent[2])/self.pix_y - 0.5
+        j = (np.asarray(x,float)-self.extent[0])/self.pix_x - 0.5
+        return ndimage.map_coordinates(mu,[np.ravel(i),np.ravel(j)],order=1,mode='nearest').reshape(np.shape(i))
+
+# ======================================================================
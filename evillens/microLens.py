@@ -78,10 +78,24 @@ class MicroLens(evil.GravitationalLens):
         '''
         compute deflection angles for both image grids.
         '''
-        self.alpha_x1 = self.thetaE**2*(self.imx1-self.centroid[0])/((self.imx1-self.centroid[0])**2+(self.imy1-self.centroid[1])**2)
-        self.alpha_y1 = self.thetaE**2*(self.imy1-self.centroid[1])/((self.imx1-self.centroid[0])**2+(self.imy1-self.centroid[1])**2)
-        self.alpha_x2 = self.thetaE**2*(self.imx2-self.centroid[0])/((self.imx2-self.centroid[0])**2+(self.imy2-self.centroid[1])**2)
-        self.alpha_y2 = self.thetaE**2*(self.imy2-self.centroid[1])/((self.imx2-self.centroid[0])**2+(self.imy2-self.centroid[1])**2)
+        self.alpha_x1,self.alpha_y1 = evil.point_mass_deflection(self.imx1,self.imy1,[self.centroid[0]],[self.centroid[1]],self.thetaE**2)
+        self.alpha_x2,self.alpha_y2 = evil.point_mass_deflection(self.imx2,self.imy2,[self.centroid[0]],[self.centroid[1]],self.thetaE**2)
+        
+        return
+        
+    def add_point_masses(self,M,positions,**kwargs):
+        '''
+        add the deflection of any number of point masses M (in solar
+        masses) at positions ([N,2], in arcsec) to both image grids at once
+        (see evil.point_mass_deflection, which is passed any kwargs).
+        '''
+        positions = np.atleast_2d(positions)
+        thetaE2 = evil.point_mass_thetaE2(M,self.Dd,self.Ds,self.Dds)
+        for grid in ['1','2']:
+            alpha_x,alpha_y = evil.point_mass_deflection(getattr(self,'imx'+grid),getattr(self,'imy'+grid), \
+                                                         positions[:,0],positions[:,1],thetaE2,**kwargs)
+            setattr(self,'alpha_x'+grid,getattr(self,'alpha_x'+grid)+alpha_x)
+            setattr(self,'alpha_y'+grid,getattr(self,'alpha_y'+grid)+alpha_y)
         
         return
         
@@ -89,14 +103,9 @@ class MicroLens(evil.GravitationalLens):
         '''
         add exoplanet to deflection angles
         '''
-        tEp = ((4*np.pi*constants.G*Mp*units.solMass/constants.c**2 * self.Dds /(self.Dd*self.Ds) )**(1/2.0)).decompose().value*3600*180/np.pi
-        self.alpha_x1 += tEp**2*(self.imx1-cent[0])/((self.imx1-cent[0])**2+(self.imy1-cent[1])**2)
-        self.alpha_y1 += tEp**2*(self.imy1-cent[1])/((self.imx1-cent[0])**2+(self.imy1-cent[1])**2)
-        self.alpha_x2 += tEp**2*(self.imx2-cent[0])/((self.imx2-cent[0])**2+(self.imy2-cent[1])**2)
-        self.alpha_y2 += tEp**2*(self.imy2-cent[1])/((self.imx2-cent[0])**2+(self.imy2-cent[1])**2)
-        
-        #self.alpha_x1[(np.sqrt((self.imx1-cent[0])**2+(self.imy1-cent[1])**2)<0.05*tEp)] *=0
-        #self.alpha_y1[(np.sqrt((self.imx1-cent[0])**2+(self.imy1-cent[1])**2)<0.05*tEp)] *=0
+        self.add_point_masses([Mp],[cent])
+        
+        return
             
         
     def raytrace(self):
@@ -113,13 +122,10 @@ class MicroLens(evil.GravitationalLens):
         
         f_interpolation = interpolate.RectBivariateSpline(self.src_beta_y[:,0],self.src_beta_x[0,:],self.src_intensity,kx=1,ky=1) 
         
-        for i in range(len(self.im1[:,0])):
-            for j in range(len(self.im1[0,:])):                    
-               self.im1[i,j] = f_interpolation(self.beta_y1[i,j],self.beta_x1[i,j])
-               self.im2[i,j] = f_interpolation(self.beta_y2[i,j],self.beta_x2[i,j])
-        
-        #self.im1 = f_interpolation(self.beta_y1.flatten(),self.beta_x1.flatten()).reshape(self.NY,self.NX)
-        #self.im2 = f_interpolation(self.beta_y2.flatten(),self.beta_x2.flatten()).reshape(self.NY,self.NX)           
+        # evaluate the spline at every pixel at once (same values as one
+        # pixel at a time)
+        self.im1 = f_interpolation(self.beta_y1,self.beta_x1,grid=False)
+        self.im2 = f_interpolation(self.beta_y2,self.beta_x2,grid=False)
         
         
     def get_magnification(self):
@@ -184,7 +190,108 @@ class MicroLens(evil.GravitationalLens):
         
         self.simulation_setup = True
         
-    def run_simulation(self,x=None,y=None, animate=False, folder=None):
+        # any magnification map is of the previous lens
+        self.magnification_map = None
+        
+    def lens_components(self):
+        '''
+        Positions and squared Einstein radii (in arcsec) of the star and
+        of any exoplanets.
+        '''
+        xl = [self.centroid[0]]
+        yl = [self.centroid[1]]
+        thetaE2 = [self.thetaE**2]
+        if getattr(self,'Exoplanets',False) is True:
+            for j in range(len(self.Mp)):
+                xl.append(self.pos[j][0])
+                yl.append(self.pos[j][1])
+                thetaE2.append(self.thetaE**2*self.Mp[j]/self.M.value)
+        return np.array(xl) , np.array(yl) , np.array(thetaE2)
+        
+    def source_width(self):
+        '''
+        Width (sigma, in arcsec) of the gaussian source of srcL solar radii.
+        '''
+        return (self.srcL*constants.R_sun/self.Ds).decompose().value * 3600*180/np.pi
+        
+    def build_magnification_map(self,extent=None,Npix=1000,Nrays=4,refine=16,image_extent=None):
+        '''
+        Make the point source magnification map of the star and planets
+        by inverse ray shooting (see evil.shoot_rays), after
+        setup_simulation.  Accepts the following parameters:
+        - extent of the map [xmin,xmax,ymin,ymax] in arcsec.  By default,
+          the source trajectory plus a margin of 5 source widths.
+        - Number of map pixels along its longest side
+        - Number of rays per map pixel side
+        - Number of rays per side of the cells used to skip the parts of
+          the image plane that do not land on the map
+        - Image plane region to shoot rays through.  By default, a box
+          around the lenses containing all of the images of the map.
+        
+        The map is stored in self.magnification_map, and returned.
+        '''
+        xl , yl , thetaE2 = self.lens_components()
+        
+        if extent is None:
+            span = max(np.ptp(self.x),np.ptp(self.y)) + 10*self.source_width()
+            pad = 5*self.source_width() + 2*span/Npix
+            extent = [np.min(self.x)-pad,np.max(self.x)+pad,np.min(self.y)-pad,np.max(self.y)+pad]
+        pixscale = max(extent[1]-extent[0],extent[3]-extent[2])/Npix
+        shape = [max(int(np.ceil((extent[3]-extent[2])/pixscale)),1),max(int(np.ceil((extent[1]-extent[0])/pixscale)),1)]
+        extent = [extent[0],extent[0]+shape[1]*pixscale,extent[2],extent[2]+shape[0]*pixscale]
+        
+        if image_extent is None:
+            image_extent = evil.image_plane_extent(extent,xl,yl,thetaE2)
+        
+        deflection = lambda x,y: evil.point_mass_deflection(x,y,xl,yl,thetaE2)
+        magnification = evil.shoot_rays(deflection,image_extent,extent,shape,Nrays,refine)
+        
+        self.magnification_map = evil.MagnificationMap(magnification,extent)
+        
+        return self.magnification_map
+        
+    def light_curve(self,x=None,y=None,**kwargs):
+        '''
+        Magnification of the source (srcL solar radii) at each point of
+        its trajectory (by default, that of setup_simulation), looked up
+        from the magnification map convolved with the source.  The map is
+        made with build_magnification_map(**kwargs) if there is none yet,
+        if the trajectory leaves it, or if any kwargs are given.
+        '''
+        if self.simulation_setup != True:
+            raise Exception("need to setup simulation \n")
+        if x is not None:
+            self.x = x
+            self.y = y
+        
+        mu_map = getattr(self,'magnification_map',None)
+        if mu_map is None or len(kwargs) > 0 \
+           or np.min(self.x) < mu_map.extent[0] or np.max(self.x) > mu_map.extent[1] \
+           or np.min(self.y) < mu_map.extent[2] or np.max(self.y) > mu_map.extent[3]:
+            mu_map = self.build_magnification_map(**kwargs)
+        
+        return mu_map.light_curve(self.x,self.y,self.source_width())
+
+    def light_curve_sweep(self,b,q,d,phi,outputdir,**kwargs):
+        '''
+        Light curves of this star (and source) with one planet, over every
+        combination of impact parameter b, mass ratio q, separation d (in
+        Einstein radii) and angle phi, in parallel and checkpointed to
+        outputdir (see evil.light_curve_sweep), after setup_simulation.
+        '''
+        if self.simulation_setup != True:
+            raise Exception("need to setup simulation \n")
+
+        return evil.light_curve_sweep(b,q,d,phi,outputdir,M=self.M.value,Dd=self.Dd.value,Ds=self.Ds.value, \
+                                      srcL=self.srcL,Nsamples=len(self.x),**kwargs)
+
+    def run_simulation(self,x=None,y=None, animate=False, folder=None, movie=None, fps=20, Nprocesses=None):
+        '''
+        Raytrace the source at each point of its trajectory.  With
+        animate=True, a frame of each step is drawn (in a pool of
+        Nprocesses worker processes, see evil.FrameWriter) and written to
+        folder as frame_{i}.png, or encoded to the movie file.
+        '''
         
         if self.simulation_setup != True:
             print "need to setup simulation"
@@ -201,78 +308,37 @@ class MicroLens(evil.GravitationalLens):
             Img2_x = []
             Img2_y = []
             
+            if animate == True:
+                planets = self.pos if self.Exoplanets is True else []
+                layout = {'thetaE':self.thetaE,'x':np.array(self.x),'y':np.array(self.y),'planets':planets}
+                writer = evil.FrameWriter(layout,folder,movie,fps,Nprocesses)
+            
             # start simulation
-            for i in range(len(self.x)):
-                self.build_source(1,self.srcL,[self.x[i],self.y[i]])
-                cent1, cent2 = self.setup_grids(self.lens_pix,self.lens_pix)
-                self.deflect()
-                if self.Exoplanets is True:
-                    for j in range(len(self.Mp)):
-                        self.add_exoplanet(self.Mp[j],self.pos[j])
-                self.raytrace()
-    
-                magnification.append(self.get_magnification())
-                Img1_x.append(cent1[0])
-                Img1_y.append(cent1[1])
-                Img2_x.append(cent2[0])
-                Img2_y.append(cent2[1])
-                
-                if animate == True:
-                    plt.clf()
-                    fig = plt.figure()
-                    plt.subplot2grid([2,3],[0,0],1,1)
-                    plt.imshow(self.im1,animated=True,vmin=0,vmax=np.max(self.src_intensity),origin='lower',cmap='hot',extent=(np.min(self.imx1),np.max(self.imx1),np.min(self.imy1),np.max(self.imy1)))
-                    plt.xticks([])
-                    plt.yticks([])
+            try:
+                for i in range(len(self.x)):
+                    self.build_source(1,self.srcL,[self.x[i],self.y[i]])
+                    cent1, cent2 = self.setup_grids(self.lens_pix,self.lens_pix)
+                    self.deflect()
                     if self.Exoplanets is True:
-                        for j in range(len(self.Mp)):
-                            plt.plot(self.pos[j][0],self.pos[j][1],'wo')
-                    plt.xlim(np.min(self.imx1),np.max(self.imx1))
-                    plt.ylim(np.min(self.imy1),np.max(self.imy1))
-                            
-                    
-                    plt.subplot2grid([2,3],[0,1],1,1)
-                    plt.plot([0],[0],'ko',label = 'star')
-                    einrad=plt.Circle((0,0),self.thetaE,color='k',fill=False)
-                    if self.Exoplanets is True:
-                        for j in range(len(self.Mp)):
-                            plt.plot(self.pos[j][0],self.pos[j][1],'bo',label='planets')
-                    plt.plot(Img1_x,Img1_y,'k-')
-                    plt.plot(Img2_x,Img2_y,'k-')
-                    plt.plot(self.x[:i],self.y[:i],'k--')
-                    #plt.plot(Img2_x[-1],Img2_y[-1],'co',label='Image Position')
-                    #plt.plot(Img1_x[-1],Img1_y[-1],'co',label='Image Position')
-                    plt.plot(self.x[i],self.y[i],'mo')
-                    plt.imshow(self.im1,animated=True,vmin=0,vmax=np.max(self.src_intensity),origin='lower',cmap='hot',extent=(np.min(self.imx1),np.max(self.imx1),np.min(self.imy1),np.max(self.imy1)))
-                    plt.imshow(self.im2,animated=True,vmin=0,vmax=np.max(self.src_intensity),origin='lower',cmap='hot',extent=(np.min(self.imx2),np.max(self.imx2),np.min(self.imy2),np.max(self.imy2)))
-       #             img1 = plt.Rectangle([Img1_x[-1]-50*self.src_size,Img1_y[-1]-50*self.src_size],100*self.src_size,100*self.src_size,fill=False,color='k')
-        #            img2 = plt.Rectangle([Img2_x[-1]-50*self.src_size,Img2_y[-1]-50*self.src_size],100*self.src_size,100*self.src_size,fill=False,color='k')
-                    fig.gca().add_artist(einrad)
-         #           fig.gca().add_artist(img1)
-          #          fig.gca().add_artist(img2)
-                    plt.xlim(-1.5*self.thetaE,1.5*self.thetaE)
-                    plt.ylim(-1.5*self.thetaE,1.5*self.thetaE)
-                    plt.yticks([])
-                    plt.xticks([])
-                    plt.subplot2grid([2,3],[0,2],1,1)
-                    plt.imshow(self.im2,animated=True,vmin=0,vmax=np.max(self.src_intensity),origin='lower',cmap='hot',extent=(np.min(self.imx2),np.max(self.imx2),np.min(self.imy2),np.max(self.imy2)))
-                    plt.xticks([])
-                    plt.yticks([])
-                    if self.Exoplanets is True:
-                        for j in range(len(self.Mp)):
-                            plt.plot(self.pos[j][0],self.pos[j][1],'wo',label='planets')
-                    plt.xlim(np.min(self.imx2),np.max(self.imx2))
-                    plt.ylim(np.min(self.imy2),np.max(self.imy2))
-                    
-                    plt.subplot2grid([2,3],[1,0],3,3)
-                    plt.plot(self.x[:len(magnification)]/self.thetaE,magnification,'k-')
-                    plt.plot(self.x[len(magnification)-1]/self.thetaE,magnification[-1],'ko')
-                    plt.xlim(-1.25,1.25)
-                    plt.ylim(1,np.max([6,np.max(magnification)]))
-                    plt.ylabel('Magnification',fontsize=18)
-                    plt.xlabel(r'Time ($t_{E}$)',fontsize=18)
-                    plt.savefig(folder+'frame_{0}.png'.format(i))
+                        self.add_point_masses(self.Mp,self.pos)
+                    self.raytrace()
+        
+                    magnification.append(self.get_magnification())
+                    Img1_x.append(cent1[0])
+                    Img1_y.append(cent1[1])
+                    Img2_x.append(cent2[0])
+                    Img2_y.append(cent2[1])
                     
+                    if animate == True:
+                        writer.write({'i':i,'im1':np.array(self.im1),'im2':np.array(self.im2), \
+                                      'extent1':[np.min(self.imx1),np.max(self.imx1),np.min(self.imy1),np.max(self.imy1)], \
+                                      'extent2':[np.min(self.imx2),np.max(self.imx2),np.min(self.imy2),np.max(self.imy2)], \
+                                      'vmax':np.max(self.src_intensity), \
+                                      'Img1':np.array([Img1_x,Img1_y]),'Img2':np.array([Img2_x,Img2_y]), \
+                                      'magnification':np.array(magnification)})
+            finally:
+                if animate == True:
+                    writer.close()
         
         return magnification ,Img1_x,Img1_y,Img2_x,Img2_y
                 
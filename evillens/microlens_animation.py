@@ -0,0 +1,294 @@
+"""
+Streaming animation frames of MicroLens simulations.
+
+Each frame of MicroLens.run_simulation(animate=True) shows the two
+images of the source, the source plane (trajectory, lens and planets,
+images), and the light curve so far.  Rather than a new figure per
+frame, one figure is made (per worker) and its artists are updated in
+place (set_data, set_extent) for each frame, and the frames are drawn
+by a pool of worker processes while the simulation carries on.  At most
+max_pending frames are in flight at once, so memory stays flat however
+long the animation, and the frames are either written as a PNG sequence
+(folder/frame_{i}.png) or piped in order to a movie encoder (ffmpeg).
+"""
+# ======================================================================
+
+import os
+import collections
+import subprocess
+import multiprocessing
+import numpy as np
+from matplotlib import gridspec
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.patches import Circle
+
+# The figure of each worker process
+_worker_figure = {}
+
+# ======================================================================
+
+class MicroLensFigure(object):
+    '''
+    The figure of a MicroLens animation, drawn without pyplot.
+
+    layout holds what is the same in every frame:
+
+        thetaE:    Einstein radius (arcsec)
+        x,y:       source trajectory (arcsec)
+        planets:   list of planet positions [x,y] (arcsec)
+    '''
+    def __init__(self, layout, figsize=(8,6), dpi=100):
+
+        self.layout = layout
+        self.figure = Figure(figsize=figsize,dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.figure)
+        grid = gridspec.GridSpec(2,3)
+        thetaE = layout['thetaE']
+        planets = np.reshape(np.array(layout['planets'],float),[-1,2])
+        blank = np.zeros([2,2])
+        options = dict(vmin=0,vmax=1,origin='lower',cmap='hot',animated=True)
+
+        # the two images
+        self.image1 = self.figure.add_subplot(grid[0,0])
+        self.image2 = self.figure.add_subplot(grid[0,2])
+        self.im1 = self.image1.imshow(blank,**options)
+        self.im2 = self.image2.imshow(blank,**options)
+        for ax in [self.image1,self.image2]:
+            ax.plot(planets[:,0],planets[:,1],'wo')
+            ax.set_xticks([])
+            ax.set_yticks([])
+
+        # the source plane
+        self.plane = self.figure.add_subplot(grid[0,1])
+        self.plane.plot([0],[0],'ko',label='star')
+        self.plane.plot(planets[:,0],planets[:,1],'bo',label='planets')
+        self.plane.add_artist(Circle((0,0),thetaE,color='k',fill=False))
+        self.track1, = self.plane.plot([],[],'k-')
+        self.track2, = self.plane.plot([],[],'k-')
+        self.trajectory, = self.plane.plot([],[],'k--')
+        self.source, = self.plane.plot([],[],'mo')
+        self.plane_im1 = self.plane.imshow(blank,**options)
+        self.plane_im2 = self.plane.imshow(blank,**options)
+        self.plane.set_xlim(-1.5*thetaE,1.5*thetaE)
+        self.plane.set_ylim(-1.5*thetaE,1.5*thetaE)
+        self.plane.set_xticks([])
+        self.plane.set_yticks([])
+
+        # the light curve
+        self.curve_axes = self.figure.add_subplot(grid[1,:])
+        self.curve, = self.curve_axes.plot([],[],'k-')
+        self.point, = self.curve_axes.plot([],[],'ko')
+        self.curve_axes.set_xlim(-1.25,1.25)
+        self.curve_axes.set_ylabel('Magnification',fontsize=18)
+        self.curve_axes.set_xlabel(r'Time ($t_{E}$)',fontsize=18)
+
+        return
+
+# ----------------------------------------------------------------------
+
+    def update(self, frame):
+        '''
+        Set the artists to frame i, from the frame dictionary:
+
+            i:             frame number
+            im1,im2:       the two images
+            extent1,2:     their extents [xmin,xmax,ymin,ymax] (arcsec)
+            vmax:          peak surface brightness of the source
+            Img1,Img2:     image positions so far ([x,y] arrays)
+            magnification: light curve so far
+        '''
+        i = frame['i']
+        x , y = self.layout['x'] , self.layout['y']
+
+        for artist,im,extent in [(self.im1,frame['im1'],frame['extent1']), \
+                                 (self.plane_im1,frame['im1'],frame['extent1']), \
+                                 (self.im2,frame['im2'],frame['extent2']), \
+                                 (self.plane_im2,frame['im2'],frame['extent2'])]:
+            artist.set_data(im)
+            artist.set_extent(extent)
+            artist.set_clim(0,frame['vmax'])
+        self.image1.set_xlim(frame['extent1'][:2])
+        self.image1.set_ylim(frame['extent1'][2:])
+        self.image2.set_xlim(frame['extent2'][:2])
+        self.image2.set_ylim(frame['extent2'][2:])
+
+        self.track1.set_data(frame['Img1'][0],frame['Img1'][1])
+        self.track2.set_data(frame['Img2'][0],frame['Img2'][1])
+        self.trajectory.set_data(x[:i],y[:i])
+        self.source.set_data([x[i]],[y[i]])
+
+        mu = frame['magnification']
+        self.curve.set_data(x[:len(mu)]/self.layout['thetaE'],mu)
+        self.point.set_data([x[len(mu)-1]/self.layout['thetaE']],[mu[-1]])
+        self.curve_axes.set_ylim(1,np.max([6,np.max(mu)]))
+
+        return
+
+# ----------------------------------------------------------------------
+
+    def render(self, frame, filename=None):
+        '''
+        Draw frame, and save it as a PNG to filename (returned), or return
+        its [NY,NX,4] RGBA pixels.
+        '''
+        self.update(frame)
+        if filename is not None:
+            self.figure.savefig(filename)
+            return filename
+        self.canvas.draw()
+        return np.array(self.canvas.buffer_rgba())
+
+# ======================================================================
+
+def init_frame_worker(layout, figsize, dpi):
+    '''
+    Make the figure of a worker process.
+    '''
+    _worker_figure['figure'] = MicroLensFigure(layout,figsize,dpi)
+    return
+
+# ----------------------------------------------------------------------
+
+def render_frame(args):
+    '''
+    Draw a frame on the figure of this worker process.  Takes a tuple
+    (frame,filename), as MicroLensFigure.render.
+    '''
+    frame , filename = args
+    return _worker_figure['figure'].render(frame,filename)
+
+# ======================================================================
+
+class FrameWriter(object):
+    '''
+    Draws the frames of a MicroLens animation in a pool of worker
+    processes, and writes them as they are done, in order.
+
+    Takes:
+
+    layout:       what is the same in every frame (see MicroLensFigure)
+
+    folder:       directory of the PNG sequence frame_{i}.png
+
+    movie:        filename of a movie to encode instead (with encoder)
+
+    fps:          frames per second of the movie
+
+    Nprocesses:   worker processes (defaults to the number of cpus; with
+                  one, frames are drawn in this process)
+
+    max_pending:  largest number of frames in flight (defaults to twice
+                  Nprocesses)
+
+    encoder:      the ffmpeg executable
+    '''
+    def __init__(self, layout, folder=None, movie=None, fps=20, Nprocesses=None, max_pending=None, \
+                 figsize=(8,6), dpi=100, encoder='ffmpeg'):
+
+        if (folder is None) == (movie is None):
+            raise Exception("give either a folder for the frames or a movie filename \n")
+        if folder is not None and not os.path.isdir(folder):
+            os.makedirs(folder)
+
+        self.folder = folder
+        self.movie = movie
+        self.fps = fps
+        self.encoder = encoder
+        self.process = None
+        self.Nframes = 0
+
+        if Nprocesses is None:
+            Nprocesses = multiprocessing.cpu_count()
+        if max_pending is None:
+            max_pending = 2*Nprocesses
+        self.max_pending = max(max_pending,1)
+        self.pending = collections.deque()
+
+        if Nprocesses <= 1:
+            self.pool = None
+            self.figure = MicroLensFigure(layout,figsize,dpi)
+        else:
+            self.pool = multiprocessing.Pool(Nprocesses,init_frame_worker,(layout,figsize,dpi))
+
+        return
+
+# ----------------------------------------------------------------------
+
+    def write(self, frame):
+        '''
+        Queue a frame (see MicroLensFigure.update), waiting for the oldest
+        frames to be done if max_pending are already in flight.
+        '''
+        if self.folder is not None:
+            args = (frame,os.path.join(self.folder,'frame_{0}.png'.format(frame['i'])))
+        else:
+            args = (frame,None)
+        self.Nframes += 1
+
+        if self.pool is None:
+            self.finish(self.figure.render(*args))
+            return
+
+        self.pending.append(self.pool.apply_async(render_frame,(args,)))
+        while len(self.pending) >= self.max_pending:
+            self.finish(self.pending.popleft().get())
+
+        return
+
+# ----------------------------------------------------------------------
+
+    def finish(self, result):
+        '''
+        Hand a drawn frame to the encoder (PNG frames are already saved).
+        '''
+        if self.movie is None:
+            return
+
+        if self.process is None:
+            NY , NX = result.shape[:2]
+            command = [self.encoder,'-y','-loglevel','error','-f','rawvideo','-pix_fmt','rgba', \
+                       '-s','{0}x{1}'.format(NX,NY),'-r',str(self.fps),'-i','-', \
+                       '-pix_fmt','yuv420p','-vcodec','libx264',self.movie]
+            try:
+                self.process = subprocess.Popen(command,stdin=subprocess.PIPE)
+            except OSError:
+                raise IOError("could not run the movie encoder {0} \n".format(self.encoder))
+        self.process.stdin.write(result.tobytes())
+
+        return
+
+# ----------------------------------------------------------------------
+
+    def close(self):
+        '''
+        Wait for the remaining frames, and close the pool and encoder.
+        '''
+        try:
+            while len(self.pending) > 0:
+                self.finish(self.pending.popleft().get())
+        finally:
+            if self.pool is not None:
+                self.pool.close()
+                self.pool.join()
+                self.pool = None
+            if self.process is not None:
+                self.process.stdin.close()
+                self.process.wait()
+                self.process = None
+
+        return
+
+# ----------------------------------------------------------------------
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if exc[0] is not None and self.pool is not None:
+            self.pool.terminate()
+            self.pending.clear()
+        self.close()
+        return False
+
+# ======================================================================
@@ -0,0 +1,188 @@
+"""
+Sweeps of MicroLens light curves over grids of exoplanet parameters
+(e.g. for detection efficiency maps).
+
+A star with one planet of mass ratio q at separation d (in Einstein
+radii), and a source crossing it along x at impact parameter b, at an
+angle phi to the star-planet axis (as in MicroLens.setup_simulation).
+Rotating the trajectory by -phi instead of the planet by phi, one
+magnification map (convolved with the source) serves every (b,phi) of
+the same (q,d), so a sweep is run in two stages over a pool of worker
+processes:
+
+    1)  maps:    one magnification map per (q,d), by inverse ray
+                 shooting (evil.shoot_rays), saved as a .npy file.
+
+    2)  curves:  light curves of chunks of (b,phi), looked up from the
+                 maps, which every worker memory-maps read-only (so they
+                 are shared through the page cache, not copied).
+
+Each map and each chunk of light curves is written to outputdir as soon
+as it is done, and is not redone if the sweep is run again, so long
+sweeps can be interrupted and resumed.  Everything is in units of the
+Einstein radius of the star.
+"""
+# ======================================================================
+
+import os
+import json
+import itertools
+import numpy as np
+from astropy import units, constants
+import evillens as evil
+
+# ======================================================================
+
+def sweep_grid(b, q, d, phi):
+    '''
+    Structured array of every combination of b, q, d, phi, ordered so
+    that the rows of each (q,d) are together.
+    '''
+    rows = [(bi,qi,di,phii) for qi,di in itertools.product(np.atleast_1d(q),np.atleast_1d(d)) \
+                            for bi,phii in itertools.product(np.atleast_1d(b),np.atleast_1d(phi))]
+    return np.array(rows,dtype=[('b',float),('q',float),('d',float),('phi',float)])
+
+# ----------------------------------------------------------------------
+
+def save_atomic(filename, array):
+    '''
+    np.save to filename, so that an interrupted write leaves no file.
+    '''
+    np.save(filename+'.tmp.npy',array)
+    os.rename(filename+'.tmp.npy',filename)
+    return
+
+# ----------------------------------------------------------------------
+
+def build_sweep_map(args):
+    '''
+    Make (or find) the convolved magnification map of one (q,d).
+
+    Takes a tuple (filename,q,d,halfwidth,sigma,Npix,Nrays) so that it
+    can be mapped over a pool of worker processes.
+    '''
+    filename,q,d,halfwidth,sigma,Npix,Nrays = args
+
+    if not os.path.isfile(filename):
+        extent = [-halfwidth,halfwidth,-halfwidth,halfwidth]
+        xl , yl , thetaE2 = np.array([0.,d]) , np.array([0.,0.]) , np.array([1.,q])
+        deflection = lambda x,y: evil.point_mass_deflection(x,y,xl,yl,thetaE2)
+        magnification = evil.shoot_rays(deflection,evil.image_plane_extent(extent,xl,yl,thetaE2), \
+                                        extent,[Npix,Npix],Nrays)
+        save_atomic(filename,evil.MagnificationMap(magnification,extent).convolved(sigma))
+
+    return filename
+
+# ----------------------------------------------------------------------
+
+def sweep_light_curves(args):
+    '''
+    Make (or find) the light curves of one chunk of the sweep.
+
+    Takes a tuple (filename,mapfile,halfwidth,b,phi,x) so that it can be
+    mapped over a pool of worker processes.
+    '''
+    filename,mapfile,halfwidth,b,phi,x = args
+
+    if not os.path.isfile(filename):
+        mu_map = evil.MagnificationMap(np.load(mapfile,mmap_mode='r'),[-halfwidth,halfwidth,-halfwidth,halfwidth])
+        # trajectories along x at y=b, in the frame of the star-planet axis
+        xr =  np.cos(phi)[:,None]*x[None,:] + np.sin(phi)[:,None]*b[:,None]
+        yr = -np.sin(phi)[:,None]*x[None,:] + np.cos(phi)[:,None]*b[:,None]
+        save_atomic(filename,mu_map.light_curve(xr,yr))
+
+    return filename
+
+# ======================================================================
+
+def light_curve_sweep(b, q, d, phi, outputdir, M=1.0, Dd=5., Ds=10., srcL=1.0, Nsamples=100, \
+                      Npix=1000, Nrays=4, Nprocesses=None, chunksize=1000):
+    '''
+    Light curves of a star with one planet, over every combination of
+    the parameters (see the module docstring).
+
+    Takes:
+
+    b,q,d,phi:    impact parameters (in Einstein radii), planet mass
+                  ratios, separations (in Einstein radii) and angles
+                  (radians)
+
+    outputdir:    directory of the maps, light curves and checkpoints
+
+    M,Dd,Ds:      mass of the star (solar masses) and distances (kpc)
+
+    srcL:         size of the source (solar radii)
+
+    Nsamples:     points of each light curve, from -1.5 to 1.5 Einstein
+                  radii (as in MicroLens.setup_simulation)
+
+    Npix,Nrays:   pixels per side of the maps, and rays per pixel side
+
+    Nprocesses:   worker processes (defaults to the number of cpus)
+
+    chunksize:    light curves per task
+
+    Returns:
+
+    curves:       structured array with fields b,q,d,phi and
+                  magnification (length Nsamples)
+
+    x:            positions of the source along its trajectory (in
+                  Einstein radii)
+    '''
+    if not outputdir.endswith('/'):
+        outputdir += '/'
+    if not os.path.isdir(outputdir):
+        os.makedirs(outputdir)
+
+    grid = sweep_grid(b,q,d,phi)
+    x = np.linspace(-1.5,1.5,Nsamples)
+
+    # source width, in Einstein radii
+    Dd , Ds = Dd*units.kpc , Ds*units.kpc
+    thetaE = np.sqrt(evil.point_mass_thetaE2(M,Dd,Ds,Ds-Dd))
+    sigma = (srcL*constants.R_sun/Ds).decompose().value*3600*180/np.pi / thetaE
+
+    # every trajectory (of any angle) fits in the same square map
+    halfwidth = np.sqrt(1.5**2+np.max(np.abs(grid['b']))**2) + 5*sigma + 0.05
+
+    # a resumed sweep must be the same sweep
+    settings = {'b':np.atleast_1d(b).tolist(),'q':np.atleast_1d(q).tolist(),'d':np.atleast_1d(d).tolist(), \
+                'phi':np.atleast_1d(phi).tolist(),'M':M,'Dd':Dd.value,'Ds':Ds.value,'srcL':srcL, \
+                'Nsamples':Nsamples,'Npix':Npix,'Nrays':Nrays,'chunksize':chunksize}
+    settingsfile = outputdir+'sweep.json'
+    if os.path.isfile(settingsfile):
+        with open(settingsfile) as f:
+            if json.load(f) != json.loads(json.dumps(settings)):
+                raise Exception("{0} holds a different sweep \n".format(outputdir))
+    else:
+        with open(settingsfile,'w') as f:
+            json.dump(settings,f)
+
+    # stage 1:  one map per (q,d)
+    qd , group = np.unique(np.array([grid['q'],grid['d']]).T,axis=0,return_inverse=True)
+    group = np.ravel(group)
+    mapfiles = [outputdir+'map_{0}.npy'.format(k) for k in range(len(qd))]
+    evil.map_channels(build_sweep_map,[(mapfiles[k],qd[k,0],qd[k,1],halfwidth,sigma,Npix,Nrays) \
+                                       for k in range(len(qd))],Nprocesses)
+
+    # stage 2:  light curves, in chunks of rows of the same map
+    tasks , rows = [] , []
+    for k in range(len(qd)):
+        members = np.nonzero(group == k)[0]
+        for c,start in enumerate(range(0,len(members),chunksize)):
+            chunk = members[start:start+chunksize]
+            tasks.append((outputdir+'curves_{0}_{1}.npy'.format(k,c),mapfiles[k],halfwidth, \
+                          grid['b'][chunk],grid['phi'][chunk],x))
+            rows.append(chunk)
+    curvefiles = evil.map_channels(sweep_light_curves,tasks,Nprocesses)
+
+    curves = np.zeros(len(grid),dtype=grid.dtype.descr+[('magnification',float,(Nsamples,))])
+    for name in grid.dtype.names:
+        curves[name] = grid[name]
+    for chunk,filename in zip(rows,curvefiles):
+        curves['magnification'][chunk] = np.load(filename)
+
+    return curves , x
+
+# ======================================================================
@@ -18,28 +18,35 @@ def Sersic(x,y,x0,y0,q,r_eff,phi,n,bn):
     
 
     
+# b_n of every Sersic index solved for so far
+_bn_cache = {}
+
 def Compute_bn(n,error=10**-8):
-    def fx(n,bn):
-        return(2*sp.gammainc(2*n,bn)-1)
-    
-    #initial guess follows approximation from Capaccioli 1989
-    x0 = 1.9992*n - 0.3271
-    x1 = x0 + 0.01
-    j = 0
-    epsilon = abs(x1-x0)
-    while epsilon > error and j<100000:
-        fx0 = fx(n,x0)
-        fx1 = fx(n,x1)
-        x0,x1 = x1 , x1 - fx1*(x1-x0) / (fx1-fx0)
-        epsilon = abs(x1-x0)
-        j+=1
-    if j ==100000:
-        #solution didn't converge, lets just approximate it.
-        bn = 1.9992*n-0.3271
-        print 'solution didn"t converge'
-    else:
-        bn = x1
-        
+    '''
+    The Sersic constant b_n, for which r_eff is the half light radius,
+    i.e. the solution of gammainc(2n,b_n) = 1/2.  n may be a number or
+    an array; all new values of n are solved in one call to
+    gammaincinv (accurate to ~1e-15, so error is no longer used), and
+    memoised.
+    '''
+    n_array = np.asarray(n,float)
+    unique,inverse = np.unique(n_array,return_inverse=True)
+    
+    new = np.array([m for m in unique if m not in _bn_cache])
+    if len(new) > 0:
+        bn = sp.gammaincinv(2*new,0.5)
+        # no solution (n <= 0), so fall back to the approximation of
+        # Capaccioli 1989
+        bad = ~np.isfinite(bn)
+        if np.any(bad):
+            print('solution didn"t converge')
+            bn[bad] = 1.9992*new[bad]-0.3271
+        _bn_cache.update(zip(new.tolist(),bn.tolist()))
+    
+    bn = np.array([_bn_cache[m] for m in unique.tolist()])[inverse].reshape(n_array.shape)
+    
+    if bn.ndim == 0:
+        return float(bn)
     return bn
     
 def Subhalo_cumulative_mass_function(subhalo_mass,halo_mass):
@@ -65,4 +72,35 @@ def Subhalo_Mass_function(subhalo_mass,halo_mass):
     return((b*(mu/mu_cut)**b -a) * Subhalo_cumulative_mass_function(subhalo_mass,halo_mass))
 
 def Einasto(r,alpha,scale):
-    return(np.exp(-(2/alpha)*((r/scale)**alpha-1.))*scale)
\ No newline at end of file
+    return(np.exp(-(2/alpha)*((r/scale)**alpha-1.))*scale)
+def time_interval_index(time,NUM_TIME_STEPS=1,trange=None):
+    '''
+    Assign each integration to one of NUM_TIME_STEPS equal length time
+    intervals, using the same cuts as Build_dOdp (the start and end of
+    the observation are padded by 1 second to guarantee the number of
+    intervals).
+    
+    Takes:
+    
+    time:            The time stamp of each integration
+    
+    NUM_TIME_STEPS:  Number of time intervals
+    
+    trange:          [tmin,tmax] of the full observation.  Pass this when
+                     time is only a chunk of the data, so that every chunk
+                     uses the same interval boundaries.
+    
+    Returns:
+    
+    index:           Integer interval ID of each integration
+    '''
+    
+    time = np.asarray(time,float)
+    if trange is None:
+        trange = [np.min(time),np.max(time)]
+    
+    tstart  = trange[0]-1.0
+    tend    = trange[1]+1.0
+    tswitch = (tend-tstart)/float(NUM_TIME_STEPS)
+    
+    return np.floor_divide(time-tstart,tswitch).astype(int)
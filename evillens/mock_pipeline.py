@@ -0,0 +1,332 @@
+"""
+A pure python (CASA free) pipeline for making mock ALMA observations of
+strong lenses, written straight to the binary files read by Ripples.
+
+It replaces the simobserve / mstransform / ms tool steps of
+Blind_data_challenge/Simulate_ALMA_Observation.py with:
+
+    1)  draw_lens_parameters:  random lens and source parameters
+    2)  build_lens:            PowerKappa lens and sersic clump source,
+                               raytraced to the lensed image
+    3)  MockObservation:       uv tracks from Earth rotation of an antenna
+                               configuration (computed once, and shared by
+                               every dataset made with it)
+    4)  NUFFTPlan:             visibility prediction
+    5)  get_phase_grid:        phase screen blown over the array, with
+                               the mock WVR calibration
+    6)  add_noise_in_chunks:   thermal noise
+    7)  Build_dOdp:            the dOdphase matrix
+
+The per-visibility stages (4-6) work on chunks of rows, which are
+written straight into memory-mapped output files, so the memory used
+does not grow with the size of the dataset.  Every random draw comes
+from its own stream of the dataset's seed (see evillens.random_streams),
+so each dataset can be reproduced from its seed alone.
+"""
+# ======================================================================
+
+import numpy as np
+import os
+from scipy.interpolate import RectBivariateSpline
+import evillens as evil
+from evillens.simulations import get_phase_grid, Mock_WVR_correction, Build_dOdp, \
+                                 write_xml_file, write_blinded_parameters
+
+# Ranges of the uniformly drawn lens and source parameters
+MOCK_PARAMETER_RANGES = {'Gamma':     [0.4,1.8],
+                         'logM':      [1.12,1.13],
+                         'elp':       [0.0,0.25],
+                         'angle':     [-np.pi,np.pi],
+                         'x':         [-0.1,0.1],
+                         'y':         [-0.1,0.1],
+                         'shear':     [-0.05,0.05],
+                         'multipole': [-0.05,0.05],
+                         'Nnuclei':   [1,5],
+                         'Nclumps':   [100,500],
+                         'q_src':     [0.3,1.0],
+                         'phi_src':   [0.0,np.pi],
+                         'r_hl_src':  [0.02,0.05],
+                         'n_src':     [0.25,1.0],
+                         'src_center':[-0.4,0.4]}
+
+# ======================================================================
+
+def draw_lens_parameters(seed,ranges=MOCK_PARAMETER_RANGES,SIE=True,Multipoles=False):
+    '''
+    Draw the parameters of a mock lens and its source.
+
+    Takes:
+
+    seed:        random seed of the dataset
+
+    ranges:      dict of parameter ranges (see MOCK_PARAMETER_RANGES)
+
+    SIE:         if True, Gamma = 1, otherwise it is drawn
+
+    Multipoles:  if True, m = 3 and m = 4 multipoles are drawn, otherwise
+                 they are zero (and only shear is added)
+
+    Returns:
+
+    params:      dict of lens and source parameters
+    '''
+    rng = evil.random_stream(seed,'mock_parameters')
+
+    def uniform(name):
+        return rng.uniform(ranges[name][0],ranges[name][1])
+
+    params = {}
+    params['Gamma'] = 1.0 if SIE else uniform('Gamma')
+    params['logM']  = uniform('logM')
+    params['q']     = 1-uniform('elp')
+    params['angle'] = uniform('angle')
+    params['centroid'] = [uniform('x'),uniform('y')]
+    params['Multipoles'] = [[uniform('shear'),uniform('shear')], \
+                            [Multipoles*uniform('multipole'),Multipoles*uniform('multipole')], \
+                            [Multipoles*uniform('multipole'),Multipoles*uniform('multipole')]]
+
+    params['Nnuclei']   = int(rng.integers(ranges['Nnuclei'][0],ranges['Nnuclei'][1]))
+    params['Nclumps']   = int(rng.integers(ranges['Nclumps'][0],ranges['Nclumps'][1]))
+    params['q_src']     = uniform('q_src')
+    params['phi_src']   = uniform('phi_src')
+    params['r_hl_src']  = uniform('r_hl_src')
+    params['n_src']     = uniform('n_src')
+    params['src_center'] = [uniform('src_center'),uniform('src_center')]
+
+    return params
+
+# ----------------------------------------------------------------------
+
+def build_lens(params,seed,zlens=0.14,zsrc=4.0,NX=160,NY=160,pixscale=0.025, \
+               NX_src=160,NY_src=160,pixscale_src=0.00625):
+    '''
+    Build a PowerKappa lens with a sersic clump source from params (see
+    draw_lens_parameters), and raytrace it.
+
+    Returns:
+
+    lens:        the lens, with lens.image the lensed image
+    '''
+    lens = evil.PowerKappa(zlens,zsrc)
+    lens.setup_grid(NX=NX,NY=NY,pixscale=pixscale)
+    lens.build_kappa_map(logM=params['logM'],q=params['q'],angle=params['angle'], \
+                         centroid=params['centroid'],Gamma=params['Gamma'])
+    lens.deflect()
+    lens.add_multipoles(params['Multipoles'])
+
+    lens.source = evil.Source(zsrc)
+    lens.source.setup_grid(NX=NX_src,NY=NY_src,pixscale=pixscale_src)
+    lens.source.build_sersic_clumps(Nnuclei=params['Nnuclei'],NclumpsPerNucleus=params['Nclumps'], \
+                                    x0=0.0,y0=0.0,q=params['q_src'],phi=params['phi_src'], \
+                                    r_hl=params['r_hl_src'],n=params['n_src'],seed1=seed)
+
+    # shift the source grid (and thus, the position of the source)
+    lens.source.beta_x += params['src_center'][0]
+    lens.source.beta_y += params['src_center'][1]
+
+    lens.raytrace()
+
+    return lens
+
+# ======================================================================
+
+class MockObservation(object):
+    '''
+    An ALMA observation of a lens, simulated without CASA.  Everything
+    that doesn't depend on the lens (the uv tracks, the antenna layout,
+    and the dOdphase matrix) is computed once here, and then reused by
+    every dataset made with observe().
+
+    Takes:
+
+    antennaconfig:      simobserve antenna configuration file
+
+    dec:                declination of the source (radians)
+
+    hour_angle_range:   [start,end] hour angle of the observation (radians)
+
+    integration_time:   length of one integration (seconds)
+
+    chanfreqs:          channel frequencies (Hz)
+
+    noise_rms:          rms of the real and imaginary parts of the
+                        noise of each visibility (Jy)
+
+    Flux:               total flux of the lensed image (Jy)
+
+    add_phase_errors:   if True, blow a phase screen over the array
+
+    Mock_calibration:   if True, apply the mock WVR phase calibration
+
+    wind_speed:         velocity of the phase screen (m/s)
+
+    Phase_amp:          amplitude of the phase screen (degrees)
+
+    pwv_mean:           mean pwv column height (m)
+
+    proportional_error: proportional error of the WVR calibration
+
+    NUM_TIME_STEPS:     number of phase intervals in the dOdphase matrix
+
+    chunksize:          number of visibilities per chunk
+    '''
+
+    def __init__(self, antennaconfig, dec, hour_angle_range, integration_time, chanfreqs, \
+                 noise_rms=1.0e-3, Flux=0.15, add_phase_errors=True, Mock_calibration=True, \
+                 wind_speed=6.0, Phase_amp=100.0, pwv_mean=0.001, proportional_error=0.1, \
+                 NUM_TIME_STEPS=1, chunksize=10**5):
+
+        self.noise_rms = noise_rms
+        self.Flux = Flux
+        self.add_phase_errors = add_phase_errors
+        self.Mock_calibration = Mock_calibration
+        self.wind_speed = wind_speed
+        self.Phase_amp = Phase_amp
+        self.pwv_mean = pwv_mean
+        self.proportional_error = proportional_error
+        self.NUM_TIME_STEPS = NUM_TIME_STEPS
+        self.chunksize = chunksize
+        self.chanfreqs = np.atleast_1d(np.asarray(chanfreqs,float))
+
+        # antenna layout (the phase screen uses East and North)
+        enu,diam = evil.read_antenna_config(antennaconfig)
+        self.antX = enu[:,0] - np.mean(enu[:,0])
+        self.antY = enu[:,1] - np.mean(enu[:,1])
+        self.Nantennas = len(enu)
+
+        # uv tracks, in meters, one row per baseline and integration
+        u,v,w,ant1,ant2,time = evil.synthesise_uv_coverage(enu,dec,hour_angle_range,integration_time)
+
+        self.Nbaselines = self.Nantennas*(self.Nantennas-1)//2
+        self.Nrows = len(time)
+        self.Ntsteps = self.Nrows//self.Nbaselines
+        self.Nvis = self.Nrows*len(self.chanfreqs)
+        self.u = u
+        self.v = v
+        self.antenna1 = ant1
+        self.antenna2 = ant2
+        self.time = time
+        self.tsteps = time[::self.Nbaselines]
+        self.tstep = np.repeat(np.arange(self.Ntsteps),self.Nbaselines)
+
+        # dOdphase matrix of one channel, tiled over the channels
+        r1,c1,rm,cm = Build_dOdp(self.antenna1.copy(),self.antenna2.copy(),self.time,NUM_TIME_STEPS)
+        offsets = self.Nrows*np.arange(len(self.chanfreqs))[:,None]
+        self.dOdphase = [(r1+offsets).ravel(),np.tile(c1,len(self.chanfreqs)), \
+                         (rm+offsets).ravel(),np.tile(cm,len(self.chanfreqs))]
+
+        return
+
+# ----------------------------------------------------------------------
+
+    def antenna_phases(self, seed):
+        '''
+        Phase of each antenna in each integration ([Nantennas,Ntsteps]),
+        minus the mock WVR correction if Mock_calibration.  The phases
+        are electrical path lengths, divide by the wavelength to get the
+        phase in radians.
+        '''
+        PhaseGrid,phase_x,phase_y = get_phase_grid(self.antX,self.antY,self.time,self.Phase_amp, \
+                                                   self.wind_speed,10.0,seed)
+        f_interp = RectBivariateSpline(phase_y,phase_x,PhaseGrid.real,kx=1,ky=1)
+        antennaphases = f_interp.ev(self.antY[:,None]*np.ones(self.Ntsteps), \
+                                    self.antX[:,None]+self.wind_speed*self.tsteps)
+
+        if self.Mock_calibration:
+            antennaphases = antennaphases - Mock_WVR_correction(antennaphases,self.pwv_mean, \
+                                                                self.proportional_error,seed)
+
+        return antennaphases
+
+# ----------------------------------------------------------------------
+
+    def observe(self, lens, seed, outputdir):
+        '''
+        Observe a raytraced lens, and write the dataset to outputdir.
+        '''
+        # Every visibility is predicted from the same FFT of the image
+        image = lens.image * self.Flux/np.sum(lens.image)
+        x = lens.image_x[0,:] / 3600. / 180. * np.pi
+        y = lens.image_y[:,0] / 3600. / 180. * np.pi
+        plan = evil.NUFFTPlan(image,x,y)
+
+        if self.add_phase_errors:
+            antennaphases = self.antenna_phases(seed)
+
+        files = evil.ripples_memmaps(outputdir,self.Nvis)
+        Vis = files['vis_chan_0'].view(complex)
+
+        for i,freq in enumerate(self.chanfreqs):
+            wavelength = 3.0*10**8 / freq
+            for start in range(0,self.Nrows,self.chunksize):
+                s = slice(start,min(start+self.chunksize,self.Nrows))
+                out = slice(i*self.Nrows+s.start,i*self.Nrows+s.stop)
+
+                u = self.u[s] / wavelength
+                v = self.v[s] / wavelength
+                vis = plan.predict(u,v)
+
+                if self.add_phase_errors:
+                    t = self.tstep[s]
+                    phase = antennaphases[self.antenna1[s],t] - antennaphases[self.antenna2[s],t]
+                    vis *= np.exp(1j*phase/wavelength)
+
+                Vis[out] = vis
+                files['u'][out] = u
+                files['v'][out] = v
+                files['ant1'][out] = self.antenna1[s]
+                files['ant2'][out] = self.antenna2[s]
+                files['time'][out] = self.time[s]
+                files['chan'][out] = i
+
+        evil.add_noise_in_chunks(Vis,self.noise_rms,seed,self.chunksize)
+        files['sigma_squared_inv'][:] = self.noise_rms**-2.
+        evil.write_dOdphase(outputdir,*self.dOdphase)
+
+        for f in files.values():
+            f.flush()
+
+        return
+
+# ======================================================================
+
+def generate_mock_datasets(observation,seeds,outputroot,SIE=True,Multipoles=False, \
+                           write_parameters=True,**lens_kwargs):
+    '''
+    Make one mock dataset per seed, each written to outputroot/mock_<seed>/.
+    The datasets are made one at a time, and the output directory of each
+    is yielded as soon as it has been written, so thousands can be made
+    in a single process, and used (or shipped elsewhere) as they arrive.
+
+    Takes:
+
+    observation:        a MockObservation
+
+    seeds:              iterable of integer random seeds
+
+    outputroot:         directory to write the datasets to
+
+    SIE,Multipoles:     see draw_lens_parameters
+
+    write_parameters:   if True, also write the Ripples xml file and the
+                        blinded parameters (to Top_secret/)
+
+    lens_kwargs:        passed on to build_lens
+
+    Yields:
+
+    outputdir:          the directory of each dataset
+    '''
+    for seed in seeds:
+        outputdir = os.path.join(outputroot,'mock_{0}'.format(seed))+'/'
+
+        params = draw_lens_parameters(seed,SIE=SIE,Multipoles=Multipoles)
+        lens = build_lens(params,seed,**lens_kwargs)
+        observation.observe(lens,seed,outputdir)
+
+        if write_parameters:
+            write_blinded_parameters(lens,outputdir+'Top_secret/')
+            write_xml_file(lens,'mock_{0}/'.format(seed),3.0*10**8/np.mean(observation.chanfreqs), \
+                           observation.NUM_TIME_STEPS,outputdir+'parameters.xml')
+
+        yield outputdir
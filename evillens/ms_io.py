@@ -0,0 +1,328 @@
+"""
+Readers for the columns of a CASA measurement set.
+
+Every reader has the same small interface, so that code which converts or
+sabotages measurement sets does not need to know where the data come from:
+
+    reader.nspw()            number of spectral windows
+    reader.chanfreqs(spw)    channel frequencies of a spw (in Hz)
+    reader.nrows(spw)        number of rows (integrations) in a spw
+    reader.read_spw(spw)     dict of the columns of a spw, named as in
+                             ms.getdata:  uvw [3,Nrow], data [Npol,Nchan,Nrow],
+                             sigma [Npol,Nrow], antenna1, antenna2, time,
+                             scan_number
+
+CasaToolReader wraps the ms and msmd tools of a running CASA session.
+DrivecasaReader has a separate CASA session (through drivecasa) dump the
+columns as .npy files to a temporary directory.  CasacoreReader reads the
+measurement set directly with python-casacore.  NpyMSReader reads the
+columns from a directory of .npy files (one subdirectory per spw), so
+that everything downstream can be run and tested without CASA.
+"""
+# ======================================================================
+
+import numpy as np
+import os
+import shutil
+import tempfile
+try:
+    import drivecasa
+except ImportError:
+    pass
+try:
+    from casacore import tables
+except ImportError:
+    pass
+
+# columns read from each spw
+MS_COLUMNS = ["uvw","data","sigma","antenna1","antenna2","time","scan_number"]
+
+# ======================================================================
+
+class CasaToolReader(object):
+    '''
+    Read a measurement set with the CASA ms and msmd tools.  These only
+    exist inside a CASA session, so they are passed in by the caller.
+    '''
+
+    def __init__(self, MeasurementSet, ms, msmd):
+
+        self.path = str(MeasurementSet)
+        self.ms = ms
+        self.msmd = msmd
+        return
+
+# ----------------------------------------------------------------------
+
+    def nspw(self):
+        self.msmd.open(self.path)
+        NSPW = self.msmd.nspw()
+        self.msmd.close()
+        return NSPW
+
+# ----------------------------------------------------------------------
+
+    def chanfreqs(self, spw):
+        self.msmd.open(self.path)
+        freqs = np.array(self.msmd.chanfreqs(spw))
+        self.msmd.close()
+        return freqs
+
+# ----------------------------------------------------------------------
+
+    def nrows(self, spw):
+        self.ms.open(self.path)
+        self.ms.msselect({'spw':str(spw)})
+        N = self.ms.nrow(True)
+        self.ms.close()
+        return N
+
+# ----------------------------------------------------------------------
+
+    def read_spw(self, spw):
+        '''
+        Read all of the columns of a spw with a single getdata call.
+        '''
+        self.ms.open(self.path)
+        self.ms.msselect({'spw':str(spw)})
+        columns = self.ms.getdata(MS_COLUMNS)
+        self.ms.close()
+        return columns
+
+# ======================================================================
+
+class NpyMSReader(object):
+    '''
+    Read measurement set columns from a directory of .npy files, laid out
+    as <directory>/spw_<i>/<column>.npy (with the channel frequencies in
+    chan_freq.npy).  Columns are memory-mapped, so nothing is read until
+    it is used.  Write this layout with write_npy_spw.
+    '''
+
+    def __init__(self, directory):
+
+        self.directory = str(directory)
+        return
+
+# ----------------------------------------------------------------------
+
+    def spw_dir(self, spw):
+        return os.path.join(self.directory,'spw_{0}'.format(spw))
+
+# ----------------------------------------------------------------------
+
+    def nspw(self):
+        return len([d for d in os.listdir(self.directory) if d.startswith('spw_')])
+
+# ----------------------------------------------------------------------
+
+    def chanfreqs(self, spw):
+        return np.load(os.path.join(self.spw_dir(spw),'chan_freq.npy'))
+
+# ----------------------------------------------------------------------
+
+    def nrows(self, spw):
+        return len(np.load(os.path.join(self.spw_dir(spw),'time.npy'),mmap_mode='r'))
+
+# ----------------------------------------------------------------------
+
+    def read_spw(self, spw):
+        columns = {}
+        for name in MS_COLUMNS:
+            filename = os.path.join(self.spw_dir(spw),name+'.npy')
+            if os.path.exists(filename):
+                columns[name] = np.load(filename,mmap_mode='r')
+        return columns
+
+# ======================================================================
+
+def write_npy_spw(directory, spw, columns, chan_freq):
+    '''
+    Write the columns of one spw (a dict named as in MS_COLUMNS) and its
+    channel frequencies in the layout read by NpyMSReader.
+    '''
+    spwdir = os.path.join(str(directory),'spw_{0}'.format(spw))
+    if not os.path.exists(spwdir):
+        os.makedirs(spwdir)
+
+    np.save(os.path.join(spwdir,'chan_freq.npy'),np.asarray(chan_freq))
+    for name in columns:
+        np.save(os.path.join(spwdir,name+'.npy'),np.asarray(columns[name]))
+
+    return
+
+# ======================================================================
+
+class DrivecasaReader(NpyMSReader):
+    '''
+    Read a measurement set from outside of CASA.  A drivecasa session
+    dumps every column of every spw as binary .npy files to a temporary
+    directory, which is then memory-mapped (no text is passed between
+    CASA and python).  Call close() to remove the temporary directory
+    (a tempdir given by the caller is left in place).
+    '''
+
+    def __init__(self, MeasurementSet, tempdir=None):
+
+        self.path = str(MeasurementSet)
+        self.owns_directory = tempdir is None
+        if self.owns_directory:
+            tempdir = tempfile.mkdtemp(prefix='evillens_ms_')
+        super(DrivecasaReader, self).__init__(tempdir)
+
+        try:
+            self.dump()
+        except:
+            self.close()
+            raise
+        return
+
+# ----------------------------------------------------------------------
+
+    def dump(self):
+        '''
+        Run the CASA script that writes the .npy files.
+        '''
+        script = ['import numpy as np', 'import os' \
+                  , 'path = "%(path)s"' % {"path": self.path} \
+                  , 'outdir = "%(outdir)s"' % {"outdir": self.directory} \
+                  , 'msmd.open(path)' \
+                  , 'for spw in range(msmd.nspw()):' \
+                  , '    spwdir = os.path.join(outdir,"spw_"+str(spw))' \
+                  , '    os.makedirs(spwdir)' \
+                  , '    np.save(os.path.join(spwdir,"chan_freq.npy"),msmd.chanfreqs(spw))' \
+                  , '    ms.open(path)' \
+                  , '    ms.msselect({"spw":str(spw)})' \
+                  , '    rec = ms.getdata(%(columns)s)' % {"columns": str(MS_COLUMNS)} \
+                  , '    ms.close()' \
+                  , '    for name in rec.keys():' \
+                  , '        np.save(os.path.join(spwdir,name+".npy"),rec[name])' \
+                  , 'msmd.close()']
+
+        casa = drivecasa.Casapy()
+        casa.run_script(script)
+
+        if self.nspw() == 0:
+            raise Exception("CASA did not write any data for {0} \n".format(self.path))
+
+        return
+
+# ----------------------------------------------------------------------
+
+    def close(self):
+        if self.owns_directory:
+            shutil.rmtree(self.directory,ignore_errors=True)
+        return
+
+# ======================================================================
+
+class CasacoreReader(object):
+    '''
+    Read a measurement set directly with python-casacore (no CASA needed).
+    Columns are returned with the same axis order as the CASA ms tool.
+    '''
+
+    def __init__(self, MeasurementSet):
+
+        self.path = str(MeasurementSet)
+        return
+
+# ----------------------------------------------------------------------
+
+    def nspw(self):
+        t = tables.table(self.path+'/SPECTRAL_WINDOW',ack=False)
+        NSPW = t.nrows()
+        t.close()
+        return NSPW
+
+# ----------------------------------------------------------------------
+
+    def chanfreqs(self, spw):
+        t = tables.table(self.path+'/SPECTRAL_WINDOW',ack=False)
+        freqs = t.getcell('CHAN_FREQ',spw)
+        t.close()
+        return freqs
+
+# ----------------------------------------------------------------------
+
+    def select_spw(self, spw):
+        '''
+        Open the main table, selecting the rows of a spw.
+        '''
+        t = tables.table(self.path+'/DATA_DESCRIPTION',ack=False)
+        ddids = np.flatnonzero(t.getcol('SPECTRAL_WINDOW_ID') == spw)
+        t.close()
+
+        main = tables.table(self.path,ack=False)
+        selection = main.query('DATA_DESC_ID IN {0}'.format(list(ddids)))
+        main.close()
+        return selection
+
+# ----------------------------------------------------------------------
+
+    def nrows(self, spw):
+        t = self.select_spw(spw)
+        N = t.nrows()
+        t.close()
+        return N
+
+# ----------------------------------------------------------------------
+
+    def read_spw(self, spw):
+        t = self.select_spw(spw)
+        columns = {}
+        columns['uvw']         = t.getcol('UVW').T
+        columns['data']        = t.getcol('DATA').transpose(2,1,0)
+        columns['sigma']       = t.getcol('SIGMA').T
+        columns['antenna1']    = t.getcol('ANTENNA1')
+        columns['antenna2']    = t.getcol('ANTENNA2')
+        columns['time']        = t.getcol('TIME')
+        columns['scan_number'] = t.getcol('SCAN_NUMBER')
+        t.close()
+        return columns
+
+# ======================================================================
+
+def put_visibilities(MeasurementSet, vis, chunksize=10**6, tempdir=None):
+    '''
+    Overwrite the data column (first polarization, first channel) of a
+    measurement set with vis.  The visibilities are handed to a drivecasa
+    session as a single binary .npy blob, which CASA memory-maps and
+    applies chunksize rows at a time with putdata.  The blob is written
+    to tempdir if given (and removed from it afterwards), or else to a
+    temporary directory of our own.
+    '''
+    owns_directory = tempdir is None
+    if owns_directory:
+        tempdir = tempfile.mkdtemp(prefix='evillens_ms_')
+    blobfile = os.path.join(tempdir,'vis.npy')
+
+    script = ['import numpy as np' \
+              , 'vis = np.load("%(blob)s",mmap_mode="r")' % {"blob": blobfile} \
+              , 'ms.open("%(path)s",nomodify=False)' % {"path": str(MeasurementSet)} \
+              , 'ms.selectinit(datadescid=0)' \
+              , 'ms.iterinit(maxrows=%(chunksize)d,adddefaultsortcolumns=False)' % {"chunksize": chunksize} \
+              , 'ms.iterorigin()' \
+              , 'start = 0' \
+              , 'more = True' \
+              , 'while more:' \
+              , '    rec = ms.getdata(["data"])' \
+              , '    n = rec["data"].shape[2]' \
+              , '    rec["data"][0,0,:] = vis[start:start+n]' \
+              , '    ms.putdata(rec)' \
+              , '    start += n' \
+              , '    more = ms.iternext()' \
+              , 'ms.close()' \
+              , 'print("rows written: "+str(start))']
+
+    try:
+        np.save(blobfile,np.asarray(vis,complex))
+        casa = drivecasa.Casapy()
+        output = casa.run_script(script)
+    finally:
+        if owns_directory:
+            shutil.rmtree(tempdir,ignore_errors=True)
+        elif os.path.isfile(blobfile):
+            os.remove(blobfile)
+
+    return output
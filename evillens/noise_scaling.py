@@ -0,0 +1,117 @@
+"""
+Empirical estimate of the noise level in visibility data.
+
+Visibilities that fall in the same 12m uv cell measure (nearly) the same
+signal, so the difference of two of them is (nearly) pure noise.  Within
+each cell the visibilities are paired up in the order they appear in the
+data, (0,1), (2,3), ..., with the last one discarded if the cell holds an
+odd number, and cells holding a single visibility are skipped.  Comparing
+the scatter of the differences to the expected noise gives the amount
+the system temperature based sigmas must be scaled by.
+
+Rather than searching the whole dataset for the members of every cell,
+each visibility is assigned to its cell once, and the data are sorted by
+cell, so the cost is O(N log N).
+"""
+# ======================================================================
+
+import numpy as np
+
+# ======================================================================
+
+def pair_visibilities_by_cell(u,v,cellsize=12.0):
+    '''
+    Find the pairs of visibilities that are differenced to estimate the
+    noise.
+
+    Takes:
+
+    u,v:       The uv coordinates of the data (in meters)
+
+    cellsize:  The size of the uv cells (in meters)
+
+    Returns:
+
+    I,J:       Indices of the paired visibilities (vis[I]-vis[J] is noise)
+
+    Nskipped:  Number of occupied cells with only one visibility
+
+    Ncells:    Number of occupied cells
+    '''
+
+    u = np.asarray(u)
+    v = np.asarray(v)
+
+    UVMAX = np.max([abs(u),abs(v)]) * 1.01
+    Bins  = np.arange(-UVMAX,UVMAX+cellsize,cellsize)
+    Nbins = len(Bins)
+
+    # Integer cell of each visibility, with Bins[k] <= u < Bins[k+1]
+    iu = np.searchsorted(Bins,u,side='right') - 1
+    iv = np.searchsorted(Bins,v,side='right') - 1
+    cell = iu.astype(np.int64) * Nbins + iv
+
+    # Sort by cell, keeping the data order within each cell
+    order = np.argsort(cell,kind='mergesort')
+    cell  = cell[order]
+
+    # Start and length of each cell's segment of the sorted data
+    start  = np.flatnonzero(np.r_[True,cell[1:] != cell[:-1]])
+    length = np.diff(np.r_[start,len(cell)])
+
+    # Position of each visibility within its segment.  Even positions
+    # are paired with the next visibility, if the segment has one.
+    position = np.arange(len(cell)) - np.repeat(start,length)
+    first = (position % 2 == 0) & (position+1 < np.repeat(length,length))
+
+    k = np.flatnonzero(first)
+    I = order[k]
+    J = order[k+1]
+
+    Nskipped = np.sum(length == 1)
+
+    return I , J , Nskipped , len(start)
+
+# ----------------------------------------------------------------------
+
+def estimate_sigma_scaling(u,v,vis,sigma,cellsize=12.0,atol=0.0,verbose=True):
+    '''
+    Calculate the amplitude A that the system temperatures must be
+    scaled by in order to reflect the true noise in the data.
+
+    Takes:
+
+    u,v:       The uv coordinates of the data (in meters)
+
+    vis:       The visibility data, complex format
+
+    sigma:     The unscaled noise expectation of each visibility
+
+    cellsize:  The size of the uv cells (in meters)
+
+    atol:      Differences whose real part is within atol of zero are
+               not used.
+
+    Returns:
+
+    A:         The noise scaling.
+    '''
+
+    I , J , Nskipped , Ncells = pair_visibilities_by_cell(u,v,cellsize)
+
+    noise_r = (vis[I]-vis[J]).real
+
+    # keep only noise != 0
+    keep = np.abs(noise_r) > atol
+    noise_r = noise_r[keep]
+    I = I[keep]
+    J = J[keep]
+    N = len(I)
+
+    A = np.sqrt(N / np.sum((noise_r/np.sqrt(sigma[I]**2+sigma[J]**2))**2))
+
+    if verbose:
+        print("Total number of visibilities used was {0} out of {1}".format(2*len(keep),len(vis)))
+        print("{0} bins out of {1} had only one visibility and were skipped".format(Nskipped,Ncells))
+
+    return A
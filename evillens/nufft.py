@@ -0,0 +1,132 @@
+"""
+Visibility prediction with a non-uniform FFT.
+
+The visibilities of an image on a regular pixel grid are
+
+    V(u,v) = sum_jk I[j,k] exp(-2 pi i (x_k u + y_j v))
+
+which costs Npix operations per visibility when summed directly.  Here
+the sum is done with Gaussian gridding (Greengard & Lee 2004):  the image
+is divided by the Fourier transform of a Gaussian kernel and FFT'd onto
+a grid oversampled by a factor R, and each visibility is then a Gaussian
+weighted sum over the 2*Msp x 2*Msp grid cells around it.  The cost is
+one FFT per image, plus (2*Msp)^2 operations per visibility, and the
+relative error is about exp(-pi*Msp*(R-0.5)/R):  ~1e-6 for the default
+R=2, Msp=6 (far below the thermal noise of any real dataset), and ~1e-12
+for Msp=12.
+
+The FFT only has to be done once per image (by NUFFTPlan), after which
+the visibilities can be predicted in chunks of any size.
+"""
+# ======================================================================
+
+import numpy as np
+
+# ======================================================================
+
+class NUFFTPlan(object):
+    '''
+    Precomputed oversampled FFT of an image, from which visibilities at
+    arbitrary u,v can be predicted.
+
+    Takes:
+
+    image:   2D image, image[j,k] at (x[k],y[j])
+
+    x,y:     1D, regularly spaced pixel coordinates (in radians)
+
+    R:       oversampling factor of the FFT grid
+
+    Msp:     half width of the gridding kernel (in oversampled cells)
+    '''
+
+    def __init__(self, image, x, y, R=2, Msp=6):
+
+        image = np.asarray(image,float)
+        x = np.asarray(x,float)
+        y = np.asarray(y,float)
+        Ny,Nx = image.shape
+
+        self.R = R
+        self.Msp = Msp
+        self.dx = x[1]-x[0]
+        self.dy = y[1]-y[0]
+
+        # pixel offsets are measured from the pixel nearest the middle
+        self.x0 = x[Nx//2]
+        self.y0 = y[Ny//2]
+        kx = np.arange(Nx) - Nx//2
+        ky = np.arange(Ny) - Ny//2
+
+        self.Mrx = int(R*Nx)
+        self.Mry = int(R*Ny)
+        self.taux = np.pi*Msp/(Nx**2*R*(R-0.5))
+        self.tauy = np.pi*Msp/(Ny**2*R*(R-0.5))
+
+        # deconvolve the kernel, then FFT onto the oversampled grid
+        deconv = np.outer(np.exp(self.tauy*ky**2),np.exp(self.taux*kx**2)) \
+                 *np.pi/np.sqrt(self.taux*self.tauy)
+        grid = np.zeros([self.Mry,self.Mrx],complex)
+        grid[np.ix_(ky % self.Mry,kx % self.Mrx)] = image*deconv
+        self.grid = np.fft.fft2(grid).ravel()
+
+        return
+
+# ----------------------------------------------------------------------
+
+    def kernel(self, omega, Mr, tau):
+        '''
+        Indices of the oversampled grid cells around each frequency
+        omega (in radians per pixel), and their gaussian weights.
+        '''
+        omega = np.mod(omega,2*np.pi)
+        m0 = np.floor(omega*Mr/(2*np.pi)).astype(int)
+        m = m0[:,None] + np.arange(-self.Msp+1,self.Msp+1)
+        weights = np.exp(-(omega[:,None]-2*np.pi*m/Mr)**2/(4*tau))
+        return m % Mr , weights
+
+# ----------------------------------------------------------------------
+
+    def predict(self, u, v, chunksize=4096):
+        '''
+        Predict the visibilities at u,v (in wavelengths).
+        '''
+        u = np.asarray(u,float).ravel()
+        v = np.asarray(v,float).ravel()
+        vis = np.empty(len(u),complex)
+
+        for start in range(0,len(u),chunksize):
+            s = slice(start,start+chunksize)
+            mx,wx = self.kernel(2*np.pi*u[s]*self.dx,self.Mrx,self.taux)
+            my,wy = self.kernel(2*np.pi*v[s]*self.dy,self.Mry,self.tauy)
+
+            cells = self.grid[my[:,:,None]*self.Mrx + mx[:,None,:]]
+            vis[s] = np.sum(np.matmul(cells,wx[:,:,None])[:,:,0]*wy,axis=1)
+
+        # normalization of the rectangle rule, and the phase of the
+        # image center
+        vis *= np.exp(-2j*np.pi*(u*self.x0+v*self.y0)) / (self.Mrx*self.Mry)
+
+        return vis
+
+# ======================================================================
+
+def nufft_visibilities(image, x, y, u, v, R=2, Msp=6):
+    '''
+    Predict the visibilities of image (with 1D pixel coordinates x,y in
+    radians) at u,v (in wavelengths) with a single NUFFTPlan.
+    '''
+    return NUFFTPlan(image,x,y,R,Msp).predict(u,v)
+
+# ----------------------------------------------------------------------
+
+def direct_visibilities(image, x, y, u, v):
+    '''
+    The direct sum over pixels, as in Saboteur.Simulate_observation.
+    Slow (Npix operations per visibility), but exact.
+    '''
+    X,Y = np.meshgrid(x,y)
+    vis = np.zeros(len(u),complex)
+    for i in range(len(u)):
+        vis[i] = np.sum(image*np.exp(-2j*np.pi*(X*u[i]+Y*v[i])))
+    return vis
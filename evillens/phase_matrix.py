@@ -0,0 +1,116 @@
+"""
+The dOdphase matrix used by Ripples for phase calibration.
+
+Each visibility on baseline (i,j) depends on the phase of antenna i
+(with derivative +1) and of antenna j (with derivative -1), in the phase
+interval that the visibility was observed in.  The phase of antenna 0 is
+our reference phase (fixed to 0), so it has no column in the matrix, and
+antenna k >= 1 in phase interval t has column (k-1) + t*NUM_ANT.
+
+The matrix is stored by Ripples as four index files, ROWisone.bin,
+COLisone.bin, ROWisminusone.bin and COLisminusone.bin, containing the
+row and column labels of the +1 and -1 entries.
+"""
+# ======================================================================
+
+import numpy as np
+from scipy import sparse
+import evillens as evil
+
+# ======================================================================
+
+def phase_intervals_from_time(time,NUM_TIME_STEPS=1):
+    '''
+    Break the observation into NUM_TIME_STEPS approximately equal length
+    phase intervals, and return the interval ID of each visibility.
+    '''
+    return evil.time_interval_index(time,NUM_TIME_STEPS)
+
+# ----------------------------------------------------------------------
+
+def phase_intervals_from_scan(scan):
+    '''
+    Use the scan number of each visibility (from the measurement set) to
+    assign the phase intervals, so that each scan gets its own phases.
+    '''
+    scans = np.unique(scan)
+    return np.searchsorted(scans,scan)
+
+# ----------------------------------------------------------------------
+
+def build_dOdphase_indices(ant1,ant2,interval,NUM_ANT=None):
+    '''
+    Build the index labels of the +1 and -1 entries of the dOdphase matrix.
+
+    Rows whose first antenna is the reference antenna (0) have no +1
+    entry.  The original loop masked with ROWisone != 0 instead, which
+    also dropped the +1 entry of visibility 0 whatever its antenna, so
+    ROWisone/COLisone files written before this have one entry fewer.
+
+    Takes:
+
+    ant1:      The first antenna used in each baseline
+
+    ant2:      The second antenna used in each baseline
+
+    interval:  The phase interval ID of each visibility
+
+    NUM_ANT:   The column stride between phase intervals (defaults to the
+               largest antenna ID, i.e. the number of non-reference
+               antennas)
+
+    Returns:
+
+    rowisone, colisone, rowisminusone, colisminusone:  integer arrays
+    '''
+
+    ant1 = np.asarray(ant1).astype(int)
+    ant2 = np.asarray(ant2).astype(int)
+    interval = np.asarray(interval).astype(int)
+
+    if NUM_ANT is None:
+        NUM_ANT = int(max(np.max(ant1),np.max(ant2)))
+
+    offset = interval*NUM_ANT - 1
+
+    # every visibility has a -1 entry for its second antenna
+    rowisminusone = np.arange(len(ant1))
+    colisminusone = ant2 + offset
+
+    # First antenna phase is always fixed to zero, so mask its rows
+    rowisone = np.flatnonzero(ant1 != 0)
+    colisone = ant1[rowisone] + offset[rowisone]
+
+    return rowisone , colisone , rowisminusone , colisminusone
+
+# ----------------------------------------------------------------------
+
+def dOdphase_matrix(rowisone,colisone,rowisminusone,colisminusone,shape=None):
+    '''
+    Assemble the dOdphase index labels into a scipy.sparse COO matrix
+    (with shape Nvisibilities by Nphases).
+    '''
+
+    rows = np.concatenate([rowisone,rowisminusone])
+    cols = np.concatenate([colisone,colisminusone])
+    vals = np.concatenate([np.ones(len(rowisone)),-np.ones(len(rowisminusone))])
+
+    if shape is None:
+        shape = (int(np.max(rows))+1,int(np.max(cols))+1)
+
+    return sparse.coo_matrix((vals,(rows,cols)),shape=shape)
+
+# ----------------------------------------------------------------------
+
+def write_dOdphase(datadir,rowisone,colisone,rowisminusone,colisminusone):
+    '''
+    Write the index labels to the legacy ROWisone.bin, COLisone.bin,
+    ROWisminusone.bin and COLisminusone.bin files (as doubles).
+    '''
+
+    np.asarray(rowisone,float).tofile(str(datadir)+'ROWisone.bin')
+    np.asarray(colisone,float).tofile(str(datadir)+'COLisone.bin')
+    np.asarray(rowisminusone,float).tofile(str(datadir)+'ROWisminusone.bin')
+    np.asarray(colisminusone,float).tofile(str(datadir)+'COLisminusone.bin')
+
+    return
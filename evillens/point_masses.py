@@ -0,0 +1,217 @@
+"""
+Deflection angles of many point masses (stars, planets, MACHOs) at once.
+
+In complex notation (z = x + iy), the deflection of point masses with
+squared Einstein radii m_i at z_i is
+
+    alpha(z) = conj( sum_i m_i / (z - z_i) )
+
+Up to threshold point masses this is summed directly, for all positions
+and all point masses at once (in chunks).  Beyond that, the point masses
+are binned onto a hierarchy of grids of cells (as in a quadtree), each
+cell with the multipole expansion
+
+    sum_i m_i / (z - z_i) = sum_k a_k / (z - z_c)^(k+1),
+    a_k = sum_i m_i (z_i - z_c)^k
+
+about its center z_c.  Cells far enough from a position (their radius
+is at most opening times their distance) contribute through their
+expansion (the largest such cells are used), and the rest are summed
+directly.  The order of the expansions is chosen so that the error of
+each cell is below tol of its monopole, and the cost grows as
+~ Npositions*log(Npointmasses) rather than Npositions*Npointmasses.
+"""
+# ======================================================================
+
+from astropy import units, constants
+import numpy as np
+
+# ======================================================================
+
+def point_mass_thetaE2(M, Dd, Ds, Dds):
+    '''
+    Squared Einstein radii (in arcsec^2) of point masses M (in solar
+    masses), with astropy distances Dd, Ds, Dds.
+    '''
+    thetaE2 = (4*np.pi*constants.G*np.asarray(M,float)*units.solMass/constants.c**2 * Dds/(Dd*Ds)).decompose().value
+    return thetaE2 * (3600*180/np.pi)**2
+
+# ----------------------------------------------------------------------
+
+def direct_field(z, zl, m, chunksize=2**22):
+    '''
+    sum_i m_i / (z - zl_i) at each z, summed directly.
+    '''
+    f = np.zeros(len(z),complex)
+    with np.errstate(divide='ignore',invalid='ignore'):
+        if len(zl) <= 32:
+            # a few point masses (e.g. a star and its planets), one at a time
+            for i in range(len(zl)):
+                f += m[i]/(z-zl[i])
+        else:
+            step = max(chunksize//len(zl),1)
+            for start in range(0,len(z),step):
+                s = slice(start,start+step)
+                f[s] = np.dot(1.0/(z[s,None]-zl[None,:]),m)
+    return f
+
+# ----------------------------------------------------------------------
+
+def multipole_order(tol, opening):
+    '''
+    Order of the cell expansions for a relative error below tol, when
+    cells are at most opening times their distance in radius.
+    '''
+    return max(int(np.ceil(np.log(tol*(1-opening))/np.log(opening)))-1,0)
+
+# ----------------------------------------------------------------------
+
+def multipole_field(z, zl, m, tol=1.0e-6, opening=0.5, leaf=64, chunksize=2**22):
+    '''
+    sum_i m_i / (z - zl_i) at each z, with the multipole expansions of
+    cells far from each position.
+
+    The cells form a hierarchy of grids (as in a quadtree), level l
+    having 2^l x 2^l cells, down to cells of ~leaf point masses.  For each
+    cell of positions on the finest level, the cells of each level are
+    opened from the coarsest down:  cells far enough away are expanded,
+    and the children of the rest are tried on the next level.  Cells still
+    too close on the finest level are summed directly.
+    '''
+    # square region containing all positions and point masses
+    allx = np.concatenate([z.real,zl.real])
+    ally = np.concatenate([z.imag,zl.imag])
+    xmin , ymin = allx.min() , ally.min()
+    side = max(allx.max()-xmin,ally.max()-ymin)*(1+1e-9)
+    if side == 0:
+        side = 1.0
+    Lmax = max(int(np.log2(np.sqrt(len(zl)/float(leaf)))),0)
+    p = multipole_order(tol,opening)
+
+    def cell_of(x,y,l):
+        N = 2**l
+        ix = np.clip((N*(x-xmin)/side).astype(int),0,N-1)
+        iy = np.clip((N*(y-ymin)/side).astype(int),0,N-1)
+        return iy*N+ix
+
+    def center_of(cell,l):
+        N = 2**l
+        return xmin+(cell % N+0.5)*side/N + 1j*(ymin+(cell//N+0.5)*side/N)
+
+    def children(cell,l):
+        N = 2**l
+        ix , iy = 2*(cell % N) , 2*(cell//N)
+        return (np.array([iy*2*N+ix,iy*2*N+ix+1,(iy+1)*2*N+ix,(iy+1)*2*N+ix+1])).T.ravel()
+
+    # radius and expansion of every cell of every level (radius -1 for
+    # empty cells)
+    radius , coeffs = [] , []
+    for l in range(Lmax+1):
+        cell = cell_of(zl.real,zl.imag,l)
+        dz = zl - center_of(cell,l)
+        r = np.full(4**l,-1.0)
+        np.maximum.at(r,cell,np.abs(dz))
+        a = np.empty([p+1,4**l],complex)
+        term = m.astype(complex)
+        for k in range(p+1):
+            a[k] = np.bincount(cell,term.real,4**l) + 1j*np.bincount(cell,term.imag,4**l)
+            term = term*dz
+        radius.append(r)
+        coeffs.append(a)
+
+    # point masses sorted by finest cell
+    lens_cell = cell_of(zl.real,zl.imag,Lmax)
+    order = np.argsort(lens_cell,kind='stable')
+    zl , m = zl[order] , m[order]
+    first = np.searchsorted(lens_cell[order],np.arange(4**Lmax+1))
+
+    # positions, one finest cell at a time
+    target_cell = cell_of(z.real,z.imag,Lmax)
+    torder = np.argsort(target_cell,kind='stable')
+    tbounds = np.searchsorted(target_cell[torder],np.arange(4**Lmax+1))
+    hT = side/2**Lmax/np.sqrt(2)
+
+    f = np.zeros(len(z),complex)
+    with np.errstate(divide='ignore',invalid='ignore'):
+        for T in np.nonzero(np.diff(tbounds))[0]:
+            zT = center_of(T,Lmax)
+
+            # interaction list, from the coarsest level down
+            zc_far , a_far = [] , []
+            cand = np.array([0])
+            for l in range(Lmax+1):
+                cand = cand[radius[l][cand] >= 0]
+                far = radius[l][cand] <= opening*(np.abs(center_of(cand,l)-zT)-hT)
+                zc_far.append(center_of(cand[far],l))
+                a_far.append(coeffs[l][:,cand[far]])
+                cand = cand[~far]
+                if l < Lmax:
+                    cand = children(cand,l)
+            zc_far = np.concatenate(zc_far)
+            a_far = np.concatenate(a_far,axis=1)
+            lenses = np.concatenate([np.arange(first[c],first[c+1]) for c in cand]+[np.zeros(0,int)])
+
+            step = max(chunksize//max(len(zc_far),len(lenses),1),1)
+            for s0 in range(tbounds[T],tbounds[T+1],step):
+                idx = torder[s0:min(s0+step,tbounds[T+1])]
+                zt = z[idx]
+
+                # far cells, by Horner's rule
+                w = 1.0/(zt[:,None]-zc_far[None,:])
+                acc = np.broadcast_to(a_far[p],w.shape)
+                for k in range(p-1,-1,-1):
+                    acc = a_far[k] + w*acc
+                ft = np.sum(w*acc,axis=1)
+
+                # near cells, directly
+                if len(lenses) > 0:
+                    ft += np.dot(1.0/(zt[:,None]-zl[lenses][None,:]),m[lenses])
+                f[idx] = ft
+
+    return f
+
+# ----------------------------------------------------------------------
+
+def point_mass_deflection(x, y, xl, yl, thetaE2, threshold=2000, tol=1.0e-6, opening=0.5, \
+                          leaf=64, chunksize=2**22):
+    '''
+    Deflection angles at x,y of point masses at xl,yl with squared
+    Einstein radii thetaE2 (all in the same angular units).
+
+    Takes:
+
+    x,y:          positions (any shape)
+
+    xl,yl:        positions of the point masses
+
+    thetaE2:      squared Einstein radii of the point masses
+
+    threshold:    largest number of point masses summed directly
+
+    tol:          relative error of each cell expansion (beyond threshold)
+
+    opening:      largest ratio of cell radius to distance for a cell to
+                  be expanded (beyond threshold)
+
+    leaf:         mean number of point masses per finest cell (beyond
+                  threshold)
+
+    chunksize:    largest number of position-point mass pairs at once
+
+    Returns:
+
+    alpha_x,alpha_y:  deflection angles, with the shape of x
+    '''
+    shape = np.shape(x)
+    z = np.ravel(np.asarray(x,float)) + 1j*np.ravel(np.asarray(y,float))
+    zl = np.ravel(np.asarray(xl,float)) + 1j*np.ravel(np.asarray(yl,float))
+    m = np.ravel(np.broadcast_to(np.asarray(thetaE2,float),zl.shape))
+
+    if len(zl) <= threshold:
+        f = direct_field(z,zl,m,chunksize)
+    else:
+        f = multipole_field(z,zl,m,tol,opening,leaf,chunksize)
+
+    return f.real.reshape(shape) , -f.imag.reshape(shape)
+
+# ======================================================================
@@ -0,0 +1,185 @@
+"""
+Independent, reproducible random number streams.
+
+Every stochastic stage (noise, phase screens, WVR calibration, subhalo
+populations, source clumps, antenna gains, mock lens parameters) draws from its own numpy.random.Generator
+rather than reseeding the global numpy random state.  The stream of a
+stage is derived from the user's seed with a SeedSequence, using the
+stage's ID as the spawn key,
+
+    SeedSequence(seed, spawn_key=(STAGES[stage],))
+
+which is the same as SeedSequence(seed).spawn(...)[STAGES[stage]].  A
+stage that works on its data in chunks spawns one further stream per
+chunk, (STAGES[stage], chunk), so that each chunk's numbers depend only
+on the seed and the chunk index.  Stages therefore never disturb each
+other, and the chunks can be drawn in any order, or in parallel, with
+exactly the same result as a serial run.
+
+numpy.random.Generator and SeedSequence only exist from numpy 1.17 on
+(which has no Python 2 build).  With older numpy, each stream is instead
+a LegacyStream:  a RandomState seeded with the words of the seed followed
+by the spawn key (with the Generator methods used here added), which is
+just as independent and reproducible, but gives different numbers than
+the same seed does with numpy 1.17 or later.
+"""
+# ======================================================================
+
+import numpy as np
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+
+# Spawn keys of the stochastic stages.  Never renumber these, or old
+# seeds will no longer reproduce old results.
+STAGES = {'noise': 0,
+          'phase_screen': 1,
+          'wvr': 2,
+          'subhalo_masses': 3,
+          'subhalo_positions': 4,
+          'source_clumps': 5,
+          'gains': 6,
+          'mock_parameters': 7}
+
+# ======================================================================
+
+class LegacyStream(np.random.RandomState):
+    '''
+    A RandomState with the names of the numpy.random.Generator methods
+    used by the stochastic stages, for numpy older than 1.17.
+    '''
+    def random(self, size=None):
+        return self.random_sample(size)
+
+    def integers(self, low, high=None, size=None):
+        return self.randint(low,high,size)
+
+# ----------------------------------------------------------------------
+
+def legacy_seed(seed,spawn_key):
+    '''
+    The 32 bit words seeding the LegacyStream of seed and spawn_key (the
+    number of words of the seed first, so that no two seeds and keys
+    give the same words).
+    '''
+    seed = int(seed)
+    if seed < 0:
+        raise Exception("random seeds must not be negative \n")
+    words = []
+    while True:
+        words.append(seed & 0xffffffff)
+        seed >>= 32
+        if seed == 0:
+            break
+    return [len(words)] + words + [int(k) for k in spawn_key]
+
+# ----------------------------------------------------------------------
+
+if hasattr(np.random,'Generator'):
+    STREAM_TYPES = (np.random.Generator,np.random.RandomState)
+else:
+    STREAM_TYPES = (np.random.RandomState,)
+
+# ======================================================================
+
+def random_stream(seed=None,stage=None,chunk=None):
+    '''
+    Get the random number generator of a stage (and optionally of one
+    chunk of that stage).
+
+    Takes:
+
+    seed:    integer seed (None draws fresh entropy from the OS).  If a
+             Generator (or RandomState) is passed, it is returned as it is, so functions
+             can accept either a seed or an already running stream.
+
+    stage:   name of the stage (a key of STAGES)
+
+    chunk:   index of the chunk, for stages that work in chunks
+
+    Returns:
+
+    rng:     a numpy.random.Generator (or a LegacyStream, see above)
+    '''
+    if isinstance(seed,STREAM_TYPES):
+        return seed
+
+    spawn_key = ()
+    if stage is not None:
+        spawn_key += (STAGES[stage],)
+    if chunk is not None:
+        spawn_key += (int(chunk),)
+
+    if not hasattr(np.random,'Generator'):
+        if seed is None:
+            return LegacyStream()
+        return LegacyStream(legacy_seed(seed,spawn_key))
+
+    return np.random.default_rng(np.random.SeedSequence(seed,spawn_key=spawn_key))
+
+# ----------------------------------------------------------------------
+
+def draw_noise_chunk(seed,chunk,size):
+    '''
+    Draw the unit variance gaussian noise of one chunk, as a [2,size]
+    array of real and imaginary parts.
+    '''
+    rng = random_stream(seed,'noise',chunk)
+    return rng.standard_normal((2,size))
+
+# ----------------------------------------------------------------------
+
+def add_noise_in_chunks(vis,rms,seed=1,chunksize=10**6,Nthreads=1):
+    '''
+    Add complex gaussian noise to visibilities in place, chunksize
+    visibilities at a time.  Each chunk has its own stream, so the result
+    depends on seed and chunksize only, and not on Nthreads, or on the
+    order in which the chunks are done.  vis may be a memory-mapped array.
+
+    Takes:
+
+    vis:         complex visibilities
+
+    rms:         rms of the real and imaginary parts of the noise (a
+                 number, or an array with one value per visibility)
+
+    seed:        random seed
+
+    chunksize:   number of visibilities per chunk (and per stream)
+
+    Nthreads:    number of worker threads (None uses one per cpu)
+
+    Returns:
+
+    vis:         the noisy visibilities
+    '''
+    N = len(vis)
+    rms = np.broadcast_to(np.asarray(rms,float),(N,))
+    Nchunks = (N+chunksize-1)//chunksize
+
+    def add_chunk(i):
+        s = slice(i*chunksize,min((i+1)*chunksize,N))
+        noise = draw_noise_chunk(seed,i,s.stop-s.start)
+        chunk = vis[s]
+        chunk.real += rms[s]*noise[0]
+        chunk.imag += rms[s]*noise[1]
+
+    if Nthreads is None:
+        Nthreads = multiprocessing.cpu_count()
+    Nthreads = min(Nthreads,Nchunks)
+
+    if Nthreads <= 1:
+        for i in range(Nchunks):
+            add_chunk(i)
+    else:
+        # numpy releases the GIL while drawing and adding, so threads run
+        # in parallel and write straight into vis (no copies between
+        # processes).  The chunks don't overlap, so the order they are
+        # done in doesn't matter.
+        pool = ThreadPool(Nthreads)
+        try:
+            pool.map(add_chunk,range(Nchunks))
+        finally:
+            pool.close()
+            pool.join()
+
+    return vis
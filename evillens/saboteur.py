@@ -51,7 +51,7 @@ class Saboteur(object):
     
 # ---------------------------------------------------------------------------
 
-    def Simulate_observation(self,lens,u,v,ant1,ant2,antennaconfig):
+    def Simulate_observation(self,lens,u,v,ant1,ant2,antennaconfig,dec=None,hour_angle_range=None):
         '''
         Takes in a lens object, as well as uv configuration files 
         (with u and v in meters) and the name of the antenna configuration
@@ -61,15 +61,20 @@ class Saboteur(object):
         location in the object.  Meant to simulate the read_data_from 
         function but without having to use CASA.
         
-        
-        TO DO: Build the u and v list from the antenna configuration file. 
-        This will require some edits to the get_antenna_coordinates
-        function that will disturb other functionality.  Leave as it is for 
-        now.
+        If u is None, the u and v list (and the antennas) are instead 
+        built from the antenna configuration file, by synthesising the 
+        uv tracks of a source at declination dec observed over 
+        hour_angle_range (both in radians), with the integration time and
+        wavelength of the Saboteur.
         '''
         
         assert issubclass(type(lens),evil.GravitationalLens)
         
+        if u is None:
+            u,v,w,ant1,ant2,time = evil.synthesise_uv_coverage(antennaconfig,dec,hour_angle_range, \
+                                                       self.integration_time,3.0*10**8/self.wavelength)
+            u = u[0]
+            v = v[0]
         if (type(u) == str):
             u = evil.load_binary(u)
             u /= self.wavelength
@@ -103,7 +108,7 @@ class Saboteur(object):
         
 # ---------------------------------------------------------------------------
     
-    def read_data_from(self, MeasurementSet, antennaconfig,Blueberry=False):
+    def read_data_from(self, MeasurementSet, antennaconfig,Blueberry=False,reader=None):
         '''
         Reads data from a measurement set, and stores visibilties, 
         uv coordinates, and the corresponding antennas.  Also loads in
@@ -113,33 +118,30 @@ class Saboteur(object):
         - MeasurementSet is the directory of the data (either *.ms or */)
         - Setting Blueberry flag to True reads binary files written in Blueberry
           format.
+        - reader is the measurement set reader to use (see evillens.ms_io).
+          By default CASA is run through drivecasa to dump the columns to
+          binary files, but e.g. evil.CasacoreReader or evil.NpyMSReader
+          can be given instead.
         '''
         if Blueberry is False:
-            casa=drivecasa.Casapy()
-        
             self.path = str(MeasurementSet)        
-        
-            script = ['ms.open("%(path)s",nomodify=False)' % {"path": self.path}\
-                  , 'recD=ms.getdata(["data"])', 'aD=recD["data"]', 'UVW=ms.getdata(["UVW"])', 'uvpoints=UVW["uvw"]'\
-                  ,'u=uvpoints[0]', 'v=uvpoints[1]'\
-                  , 'antD1=ms.getdata(["antenna1"])'\
-                  , 'antD1=antD1["antenna1"]'\
-                  ,'antD2=ms.getdata(["antenna2"])'\
-                  , 'antD2=antD2["antenna2"]', 'ms.close()'\
-                  ,'print([" "+str(v[i])+" " for i in range(len(v)) ])'\
-                  ,'print([" "+str(u[i])+" "for i in range(len(u))])'\
-                  ,'print([" "+str(aD[0][i][j])+" "  for i in range(len(aD[0])) for j in range(len(aD[0][0]))])'\
-                  ,'print([" "+str(antD1[i])+" " for i in range(len(antD1))])'\
-                  ,'print([" "+str(antD2[i])+" " for i in range(len(antD2))])']
-        
-            data = casa.run_script(script)
-              
-        
-            self.v = np.array((data[0][25].split())[1::3],float)
-            self.u = np.array((data[0][28].split())[1::3],float)
-            self.Visibilities = np.array(np.array((data[0][31].split())[1::3]),complex)
-            self.antenna1 = np.array((data[0][34].split())[1::3],int)
-            self.antenna2 = np.array((data[0][37].split())[1::3],int)
+            
+            # a reader we create for ourselves is closed when we're done
+            close_reader = reader is None
+            if close_reader:
+                reader = evil.DrivecasaReader(self.path)
+            
+            try:
+                columns = reader.read_spw(0)
+                
+                self.u = np.array(columns["uvw"][0],float)
+                self.v = np.array(columns["uvw"][1],float)
+                self.Visibilities = np.array(columns["data"][0],complex).ravel()
+                self.antenna1 = np.array(columns["antenna1"])
+                self.antenna2 = np.array(columns["antenna2"])
+            finally:
+                if close_reader:
+                    reader.close()
             
         else:
             with open(MeasurementSet+'v.bin', mode='rb') as file:
@@ -305,60 +307,14 @@ class Saboteur(object):
         
         '''
         
-        UVMAX = np.max([abs(u),abs(v)])*1.01
-
-        Nbins = 256
-        
-        # Count number of visibilities in each bin.
-        Bins = np.arange(-UVMAX,UVMAX+12,12.0)
-        P,reject1,reject2 = np.histogram2d(u,v,bins=Bins)
-        
-#        B1 = interp1d(Bins,range(Nbins),'nearest')
-#        iB1 = B1(u)
-#        iB2 = B1(v)
-        
-        # Keep only bins with visiblities in them.
-        [row,col] = np.where(P!=0)
-
-        # Keep track of noise estimation stats
-        NumSkippedBins = 0
-        total=0 
-        
-        # Real and imaginary noise arrays.
-        noise_r = np.zeros(u.shape)
-        noise_i = np.zeros(v.shape)
-        
-        indI = np.zeros(u.shape,int)
-
-        for icount in range(len(row)):
-            inds = np.where((v>=Bins[col[icount]])&(v<Bins[col[icount]+1])&(u>=Bins[row[icount]])&(u<Bins[row[icount]+1]))[0]
-            
-            if len(inds) ==1:
-                NumSkippedBins += 1
-                continue
-            elif len(inds)%2 ==1:
-                inds = inds[:-1]
-            I = inds[::2]
-            J = inds[1::2]
-            noise_r[I] = (vis[I]-vis[J]).real
-            noise_i[I] = (vis[I]-vis[J]).imag
-            indI[I] = J
-            total += len(inds)
-        
-        iI = np.where(noise_r != 0)[0]
-        
-        N = len(iI)
-        SIGMA_SCALING = np.sqrt(N/np.sum((noise_r[iI]/np.sqrt(sigma[iI]**2+sigma[indI[iI]]**2))**2)) 
-        
-        print "Total number of visibilities used was", total 
-        print NumSkippedBins , "bins out of" , len(row), "had only one visibility and were skipped."
+        SIGMA_SCALING = evil.estimate_sigma_scaling(u,v,vis,sigma,cellsize=12.0)
         
         return SIGMA_SCALING 
         
 
 # ---------------------------------------------------------------------------
 
-    def build_dOdphase(self, ant1, ant2,time,NUM_TIME_STEPS=1):
+    def build_dOdphase(self, ant1, ant2,time,NUM_TIME_STEPS=1,scan=None):
         
         '''
         Create matrix files Rowisone.bin, Colisone.bin, Rowisminusone.bin
@@ -366,44 +322,27 @@ class Saboteur(object):
         values in the dtheta/dphi matrix.  Takes 2 lists of antenna numbers
         ant1 and ant2 (contained in a measurement set).
             
-        Right now it breaks the observation into approximately equal length
-        chunks (the last one may be slightly shorter).  In the future, we 
-        could upgrade by specifying the intervals where the phase is expected
-        to change.
+        By default it breaks the observation into approximately equal length
+        chunks (the last one may be slightly shorter).  If the scan number
+        of each visibility is given, each scan gets its own phase interval
+        instead.
     
         We'll also specify that the phase of the zeroth antenna is our 
         reference phase (so we set it to 0).
+        
+        The sparse matrix itself is kept as self.dOdphase.
         '''
-    
-        NUM_ANT = int(np.max([np.max(ant1),np.max(ant2)]))
-        NUM_BL  = (NUM_ANT*(NUM_ANT-1))/2
-        NUM_TIME_STEPS = int(NUM_TIME_STEPS)
-        
-        # Determine time cuts (-1 and +1 to guarantee # of intervals)
-        tstart  = np.min(time)-1.0
-        tend    = np.max(time)+1.0
-        tdiff   = tend-tstart
-        tswitch = tdiff/float(NUM_TIME_STEPS)
-
-        rowisone      = np.zeros(len(ant1),int)
-        colisone      = np.zeros(len(ant1),int)
-        rowisminusone = np.zeros(len(ant2),int)
-        colisminusone = np.zeros(len(ant2),int)
-        
-        for i in range(len(rowisone)):
-            if ant1[i] == 0: # First antenna phase is always fixed to zero
-                rowisminusone[i] = i
-                colisminusone[i] = ant2[i]-1 + int((time[i]-tstart)//tswitch)*(NUM_ANT)
-            else:
-                rowisone[i]      = i 
-                colisone[i]      = ant1[i]-1 + int((time[i]-tstart)//tswitch)*(NUM_ANT)
-                rowisminusone[i] = i 
-                colisminusone[i] = ant2[i]-1 + int((time[i]-tstart)//tswitch)*(NUM_ANT)
-                
-        # clip where antenna1 is present from this list
-        colisone = colisone[(rowisone !=0)]
-        rowisone = rowisone[(rowisone !=0)]        
         
+        if scan is None:
+            interval = evil.phase_intervals_from_time(time,NUM_TIME_STEPS)
+        else:
+            interval = evil.phase_intervals_from_scan(scan)
+        
+        rowisone,colisone,rowisminusone,colisminusone = evil.build_dOdphase_indices(ant1,ant2,interval)
+        
+        NUM_ANT = int(np.max([np.max(ant1),np.max(ant2)]))
+        self.dOdphase = evil.dOdphase_matrix(rowisone,colisone,rowisminusone,colisminusone, \
+                                             shape=(len(ant1),NUM_ANT*(np.max(interval)+1)))
         
         return rowisone , colisone , rowisminusone , colisminusone
 
@@ -459,25 +398,7 @@ class Saboteur(object):
             file.write(data)
         file.close()
         
-        with open(OUTPUTDIR+'ROWisone.bin','wb') as file:
-            data = struct.pack('d'*len(rowisone),*rowisone)
-            file.write(data)
-        file.close()
-        
-        with open(OUTPUTDIR+'COLisone.bin','wb') as file:
-            data = struct.pack('d'*len(colisone),*colisone)
-            file.write(data)
-        file.close()
-        
-        with open(OUTPUTDIR+'ROWisminusone.bin','wb') as file:
-            data = struct.pack('d'*len(rowisminusone),*rowisminusone)
-            file.write(data)
-        file.close()
-        
-        with open(OUTPUTDIR+'COLisminusone.bin','wb') as file:
-            data = struct.pack('d'*len(colisminusone),*colisminusone)
-            file.write(data)
-        file.close()
+        evil.write_dOdphase(OUTPUTDIR,rowisone,colisone,rowisminusone,colisminusone)
         
         # Clean up (remove temporary files)
         garbagelist = os.listdir(OUTPUTDIR+'temp')
@@ -491,7 +412,17 @@ class Saboteur(object):
         return
         
 # ----------------------------------------------------------------------------
-    def prepare_data(self, direct,Nspw,Nchan, bintime=None,NUM_TIME_STEPS=1):
+    def prepare_data(self, direct,Nspw,Nchan, bintime=None,NUM_TIME_STEPS=1,Nprocesses=None):
+        '''
+        Load the binary files written by ms_to_bin (all channels, all spws),
+        scale the noise of each channel, and build the dOdphase matrix.
+        
+        The antenna and time columns are shared by all channels, so they 
+        are read once.  The per-channel files are memory-mapped and copied
+        straight into the flattened output arrays, and the noise scaling of
+        the channels is computed in parallel on Nprocesses worker processes
+        (defaults to the number of cpus).
+        '''
         
         wav = np.loadtxt(direct+'chan_wav.txt')
         if len(wav.shape)==0:
@@ -499,84 +430,58 @@ class Saboteur(object):
         elif len(wav.shape)==1:
             wav = np.array([wav])    # bug fix for single spw case
         
+        if bintime is not None:  # function doesn't work for now, but this is where it'll happen.
+            raise Exception("Cannot bin data this way yet.  Set bintime=None in your function call. \n")
+        
         print("Loading data located at:  {0}".format(direct))
-        #  load all of the data (all channels, all spws)
-        for i in range(Nspw):
-            for j in range(Nchan):
-                if (i==0) & (j==0):
-                    ut = evil.load_binary(direct+'u_spw_0_chan_0.bin')
-                    vt = evil.load_binary(direct+'v_spw_0_chan_0.bin')
-                    vist = evil.load_binary(direct+'vis_spw_0_chan_0.bin')
-                    sigmat = evil.load_binary(direct+'sigma_spw_0_chan_0.bin')
-                    ant1t = np.rint(evil.load_binary(direct+'ant_1.bin')).astype(int)
-                    ant2t = np.rint(evil.load_binary(direct+'ant_2.bin')).astype(int)
-                    timet = evil.load_binary(direct+'time.bin')
-                    u     = np.zeros([Nspw,Nchan,   len(ut)   ], float )
-                    v     = np.zeros([Nspw,Nchan,   len(vt)   ], float )
-                    vis   = np.zeros([Nspw,Nchan, len(vist)/2 ],complex)
-                    sigma = np.zeros([Nspw,Nchan, len(sigmat) ], float )
-                    ant1  = np.zeros([Nspw,Nchan,   len(ut)   ],  int  )
-                    ant2  = np.zeros([Nspw,Nchan,   len(ut)   ],  int  )
-                    chan  = np.zeros([Nspw,Nchan,   len(ut)   ],  int  ) 
-                    time  = np.zeros([Nspw,Nchan,   len(ut)   ], float )
-                    
-                    u[i,j,:]     = ut*wav[i,j]
-                    v[i,j,:]     = vt*wav[i,j]
-                    vis[i,j,:]   = vist[::2]+1j*vist[1::2]
-                    sigma[i,j,:] = sigmat
-                    ant1[i,j,:]  = ant1t
-                    ant2[i,j,:]  = ant2t
-                    time[i,j,:]  = timet
-                    chan[i,j,:]  +=j+Nchan*i
-                    ut = 0
-                    vt = 0
-                    vist = 0
-                    sigmat = 0
-                    ant1t = 0
-                    ant2t = 0
-                    sigmascl = self.get_sigma_scaling(u[i,j,:],v[i,j,:],vis[i,j,:],sigma[i,j,:])
-                    sigma[i,j,:] /= sigmascl
-                    u[i,j,:] /= wav[i,j]
-                    v[i,j,:] /= wav[i,j]
-                else:  
-                    u[i,j,:]    = evil.load_binary(direct+'u_spw_{0}_chan_{1}.bin'.format(i,j))*wav[i,j]
-                    v[i,j,:]    = evil.load_binary(direct+'v_spw_{0}_chan_{1}.bin'.format(i,j))*wav[i,j]
-                    vist  = evil.load_binary(direct+'vis_spw_{0}_chan_{1}.bin'.format(i,j))
-                    vis[i,j,:] = vist[::2]+1j*vist[1::2]
-                    sigma[i,j,:]= evil.load_binary(direct+'sigma_spw_{0}_chan_{1}.bin'.format(i,j))
-                    ant1[i,j,:] = np.rint(evil.load_binary(direct+'ant_1.bin')).astype(int)
-                    ant2[i,j,:] = np.rint(evil.load_binary(direct+'ant_2.bin')).astype(int)
-                    chan[i,j,:] +=j+Nchan*i
-                    sigmascl = self.get_sigma_scaling(u[i,j,:],v[i,j,:],vis[i,j,:],sigma[i,j,:])
-                    sigma[i,j,:] /= sigmascl
-                    u[i,j,:] /= wav[i,j]
-                    v[i,j,:] /= wav[i,j]
-                    time[i,j,:] = evil.load_binary(direct+'time.bin')
-                    
+        
+        # columns shared by all of the channels
+        ant1 = np.rint(evil.read_binary(direct+'ant_1.bin')).astype(int)
+        ant2 = np.rint(evil.read_binary(direct+'ant_2.bin')).astype(int)
+        time = evil.read_binary(direct+'time.bin')
+        Nvis = len(ant1)
+        
+        blocks = [(i,j) for i in range(Nspw) for j in range(Nchan)]
+        Nblocks = len(blocks)
+        
+        # noise scaling of each channel, in parallel
+        sigmascl = evil.map_channels(evil.channel_sigma_scaling, \
+                        [(direct,i,j,wav[i,j]) for (i,j) in blocks],Nprocesses)
+        
+        Vis    = np.empty(2*Nblocks*Nvis,float)
+        ssqinv = np.empty(2*Nblocks*Nvis,float)
+        u      = np.empty(Nblocks*Nvis,float)
+        v      = np.empty(Nblocks*Nvis,float)
+        chan   = np.empty(Nblocks*Nvis,int)
+        
+        for k,(i,j) in enumerate(blocks):
+            s  = slice(k*Nvis,(k+1)*Nvis)
+            s2 = slice(2*k*Nvis,2*(k+1)*Nvis)
+            
+            u[s]    = evil.memmap_binary(evil.channel_file(direct,'u',i,j))
+            v[s]    = evil.memmap_binary(evil.channel_file(direct,'v',i,j))
+            Vis[s2] = evil.memmap_binary(evil.channel_file(direct,'vis',i,j))
+            chan[s] = j+Nchan*i
+            
+            sigma = evil.memmap_binary(evil.channel_file(direct,'sigma',i,j)) / sigmascl[k]
+            ssqinv[s2][::2]  = sigma**(-2)
+            ssqinv[s2][1::2] = sigma**(-2)
+        
         print "loaded all necessary files \n"
-        if bintime is not None:  # function doesn't work for now, but this is where it'll happen.
-            print "binning visibilities in intervals of {0} seconds".format(bintime)
-            u,v,vis,sigma,ant1,ant2 = self.bin_data(u,v,wav,vis,sigma,ant1,ant2,time,bintime)
-         
         print "building dOdphase \n"
         
-        ant1 = np.rint(ant1.flatten()).astype('int')
-        ant2 = np.rint(ant2.flatten()).astype('int')
-        time = time.flatten()
-        rowisone,colisone,rowisminusone,colisminusone = self.build_dOdphase(ant1,ant2,time,NUM_TIME_STEPS)
+        # The antennas and times are the same in every channel, so the 
+        # matrix of one channel is repeated, with its rows offset.
+        interval = evil.phase_intervals_from_time(time,NUM_TIME_STEPS)
+        r1,c1,rm1,cm1 = evil.build_dOdphase_indices(ant1,ant2,interval)
+        offsets = Nvis*np.arange(Nblocks)[:,np.newaxis]
+        
+        rowisone      = (r1+offsets).ravel()
+        colisone      = np.tile(c1,Nblocks)
+        rowisminusone = (rm1+offsets).ravel()
+        colisminusone = np.tile(cm1,Nblocks)
+        
         print "dOdphase built, writing data to disk"
-        sigma = sigma.flatten()
-        u = u.flatten()
-        v = v.flatten()
-        vis = vis.flatten()
-        chan=chan.flatten()
-        
-        Vis = np.zeros(2*len(vis),float)
-        Vis[::2] = vis.real
-        Vis[1::2]= vis.imag
-        ssqinv = np.zeros(2*len(sigma),float)
-        ssqinv[::2] = sigma**(-2)
-        ssqinv[1::2]= sigma**(-2)
                 
         return Vis , ssqinv , u , v , rowisone , colisone , rowisminusone , colisminusone , chan
 
@@ -662,10 +567,12 @@ class Saboteur(object):
 # ---------------------------------------------------------------------------
         
     def get_antenna_coordinates(self, antennaconfig):
-        casa = drivecasa.Casapy()        
-        
-        CASAdir = casa.run_script(['print(" "+os.getenv("CASAPATH").split(" ")[0]+"/data/alma/simmos/")'])[0][0].split()[0]
-        antennaparams = np.genfromtxt(str(CASAdir)+str(antennaconfig))
+        '''
+        Load the antenna positions of antennaconfig (a simobserve .cfg
+        file, or its name) from the antenna registry.  The CASA simmos
+        directory is searched through $CASAPATH, without starting CASA.
+        '''
+        antennaparams = evil.load_antenna_config(antennaconfig)
         self.antennaX = antennaparams[:,0]
         self.antennaY = antennaparams[:,1]
         self.antennaZ = antennaparams[:,2]
@@ -783,19 +690,44 @@ class Saboteur(object):
 
 # ---------------------------------------------------------------------------
     
-    def add_amplitude_errors(self, rms_error):
+    def add_amplitude_errors(self, rms_error, seed=1):
         '''
         Add amplitude errors to the visibilities.  Each antenna gets gaussian
         random amplitude error centered around 1 with rms equal to input rms. 
         '''
-        errors_real = np.random.normal(1.0, rms_error, int(max(self.antenna2)+1))
-        errors_imag = np.random.normal(1.0,rms_error,int(max(self.antenna2)+1))
-    
+        self.add_gain_errors(rms_error, 0.0, seed=seed)
         
-    
-        for i in range(len(self.Visibilities)):
-            self.Visibilities[i] = self.Visibilities[i].real*errors_real[self.antenna1[i]]*errors_real[self.antenna2[i]] \
-                                    +1j*self.Visibilities[i].imag*errors_imag[self.antenna1[i]]*errors_imag[self.antenna2[i]]
+        return
+# ---------------------------------------------------------------------------
+
+    def add_gain_errors(self, amp_rms, phase_rms, NUM_TIME_STEPS=1, seed=1, chunksize=10**6):
+        '''
+        Corrupt the visibilities with complex antenna gains.  Each antenna
+        gets a gain with gaussian random amplitude (centered on 1, rms 
+        amp_rms) and phase (rms phase_rms, in radians), which is held
+        constant over each of NUM_TIME_STEPS equal length time intervals.
+        
+        The gains are drawn once from seed, and applied chunksize 
+        visibilities at a time, so the result does not depend on chunksize.
+        Only antenna1 and antenna2 are needed:  the time intervals are cut
+        by row order (integrations are listed in the standard CASA
+        simobserve order, one row per baseline), not by time stamps, and
+        all visibilities are taken to be in a single spw.
+        '''
+        Nantennas = int(max(np.max(self.antenna1),np.max(self.antenna2))+1)
+        self.gains = evil.draw_antenna_gains(Nantennas, NUM_TIME_STEPS, 1, amp_rms, phase_rms, seed)
+        
+        if NUM_TIME_STEPS == 1:
+            interval = None
+        else:
+            # the baselines are the distinct antenna pairs in the data
+            pairs = np.asarray(self.antenna1,int)*Nantennas + np.asarray(self.antenna2,int)
+            Nbaselines = len(np.unique(pairs))
+            integration = np.arange(len(self.Visibilities)) // Nbaselines
+            interval = evil.time_interval_index(integration, NUM_TIME_STEPS)
+        
+        evil.apply_antenna_gains_in_chunks(self.Visibilities, self.antenna1, self.antenna2, \
+                                           self.gains, interval, chunksize=chunksize)
         
         return
 # ---------------------------------------------------------------------------
@@ -819,8 +751,8 @@ class Saboteur(object):
         y = np.arange(minY,maxY+cellsize,cellsize)
         
         #generate pseudo random numbers
-        np.random.seed(randseed)
-        phases = np.random.normal(0.0,1.0,(len(y),len(x))) 
+        rng = evil.random_stream(randseed,'phase_screen')
+        phases = rng.normal(0.0,1.0,(len(y),len(x))) 
         
         p2 = np.fft.fft2(phases) /self.cellsize
         FreqX = np.fft.fftfreq(len(x), 1.0/float(len(x)) )*2.0*np.pi/(x[-1]-x[0])
@@ -927,7 +859,7 @@ class Saboteur(object):
         self.assign_phases_to_antennas( v, fast, cellsize, convolution, randseed)
         
         if wvr_calibration == True:
-            self.wvr_calibration(pwvmean,proportional_error)
+            self.wvr_calibration(pwvmean,proportional_error,randseed)
         
         self.Visibilities *= np.exp(1j*(self.phase_errors1-self.phase_errors2))   
         
@@ -935,7 +867,7 @@ class Saboteur(object):
 
 # -------------------------------------------------------------------------
 
-    def wvr_calibration(self,pwvmean,proportional_error):
+    def wvr_calibration(self,pwvmean,proportional_error,seed=1):
         '''
         Mock the ALMA water vapor radiometer phase calibration to remove
         large scale phase variations from the data, and make it more 
@@ -946,15 +878,18 @@ class Saboteur(object):
         pwvmean -       The mean thickness (in m) of the water vapor column
         
         proportional_error  - proportional error scale
+        
+        seed -          random seed of the radiometer errors
         '''
+        rng = evil.random_stream(seed,'wvr')
         
         # first get phase corrections using the antennaphases array
         pwv = self.antennaphases * self.wavelength /(2*np.pi) + pwvmean
-        pwv_meas = pwv + 1.0e-5 * np.random.normal(0.0,abs(1+pwv/0.001))
+        pwv_meas = pwv + 1.0e-5 * rng.normal(0.0,abs(1+pwv/0.001))
         WVR_correction = 2*np.pi*(pwv_meas-pwvmean) / self.wavelength
         
         # Get proportional error size for each antenna
-        PE = np.random.normal(0.0,proportional_error,self.antennaphases.shape[0])
+        PE = rng.normal(0.0,proportional_error,self.antennaphases.shape[0])
         PE = np.outer(PE,np.ones(self.antennaphases.shape[1]))
         
         # Total WVR estimated phase
@@ -1010,15 +945,16 @@ class Saboteur(object):
         self.Nsteps_binning = Nsteps
 # -------------------------------------------------------------------------
     
-    def add_noise(self,rms,seed=1):
+    def add_noise(self,rms,seed=1,chunksize=10**6,Nthreads=1):
+        '''
+        Add gaussian noise with rms (per real and imaginary part) to the 
+        visibilities.  The noise is drawn chunksize visibilities at a time,
+        each chunk from its own random stream, so the result only depends 
+        on seed and chunksize (and not on Nthreads).
+        '''
         self.noise_rms = rms
-        np.random.seed(seed)
-        
-        self.noise = np.random.normal(0.0,rms,len(self.Visibilities))+1j*np.random.normal(0.0,rms,len(self.Visibilities))
-        self.Visibilities += self.noise
+        evil.add_noise_in_chunks(self.Visibilities,rms,seed,chunksize,Nthreads)
 
-#        for i in range(len(self.Visibilities)):
-#            self.Visibilities[i]+= np.random.normal(0.0,rms)+1j*np.random.normal(0.0,rms)
         return
 
 # -------------------------------------------------------------------------
@@ -1052,147 +988,58 @@ class Saboteur(object):
         # number of visibility points in each phase interval
         ObsperInterval = IntperInterval * self.Nbaselines
         
-    
-        rowisone = np.zeros(len(self.Visibilities))
-        colisone = np.zeros(len(self.Visibilities))
-        rowisminusone = np.zeros(len(self.Visibilities))
-        colisminusone = np.zeros(len(self.Visibilities))
-    
-        for i in range(len(rowisone)):
-            if self.antenna1[i] ==0: #exclude antenna 0
-                rowisminusone[i] = i
-                colisminusone[i] = self.antenna2[i]-1+(i//ObsperInterval)*(self.Nantennas-1)
-            else:
-                rowisone[i] = i
-                colisone[i] = self.antenna1[i]-1 +(i//ObsperInterval)*(self.Nantennas-1)
-                rowisminusone[i] = i
-                colisminusone[i] = self.antenna2[i]-1+(i//ObsperInterval)*(self.Nantennas-1)
+        interval = np.floor_divide(np.arange(len(self.Visibilities)),ObsperInterval)
+        rowisone,colisone,rowisminusone,colisminusone = \
+                evil.build_dOdphase_indices(self.antenna1,self.antenna2,interval,self.Nantennas-1)
         
-        # clip where antenna1 is present from this list
-        colisone = colisone[(rowisone !=0)]
-        rowisone = rowisone[(rowisone !=0)]
+        self.dOdphase = evil.dOdphase_matrix(rowisone,colisone,rowisminusone,colisminusone, \
+                                             shape=(len(self.Visibilities),(self.Nantennas-1)*Numphaseintervals))
         
         # have the matrices we want, now write to data.
-        f = open(str(datadir)+'ROWisone.bin','wb')
-        data = struct.pack('d'*len(rowisone),*rowisone)
-        f.write(data)
-        f.close()
-        
-        g = open(str(datadir)+'COLisone.bin','wb')
-        data = struct.pack('d'*len(colisone),*colisone)
-        g.write(data)
-        g.close()
-        
-        h = open(str(datadir)+'ROWisminusone.bin','wb')
-        data = struct.pack('d'*len(rowisminusone),*rowisminusone)
-        h.write(data)
-        h.close()
-        
-        i = open(str(datadir)+'COLisminusone.bin','wb')
-        data = struct.pack('d'*len(colisminusone),*colisminusone)
-        i.write(data)
-        i.close()
+        evil.write_dOdphase(datadir,rowisone,colisone,rowisminusone,colisminusone)
     
         return
     
 # -------------------------------------------------------------------------
     
-    def sabotage_measurement_set(self,lenstool=False):
+    def sabotage_measurement_set(self,lenstool=False,chunksize=10**6):
         '''
         Write the corrupted visibilities back to the original measurement set.
         For this copy measurement set into new set 
-        /path/measurementset_sabotaged.ms
+        /path/measurementset_sabotaged.ms, and write the visibilities to it
+        in blocks of chunksize rows.
         
-        Alternative method for large data sets.  Write visibilities to file 
-        individually.  Make new directory for these with name 
-        /path/measurement_sabotaged/.        
+        Alternatively (lenstool=True), skip the measurement set entirely and
+        write the binary files read by Ripples to the new directory 
+        /path/measurementset_sabotaged/.
         '''        
         if lenstool == True:
             '''
             Place data in format for use with lens tool code.
             that means uv data in wavelengths, visibilties 
             and sigma squared inverse in single column vectors,
-            and all data saved as doubles using struct.pack
+            and all data saved as doubles
             '''
             
             u = self.u / self.wavelength
             v = self.v / self.wavelength
-            sigma_squared_inv = 1.0/self.noise_rms**2 *np.ones(2*len(self.Visibilities),float)
-            vis = np.empty(2*len(self.Visibilities),float)
-            vis[0::2] = self.Visibilities.real
-            vis[1::2] = self.Visibilities.imag
+            sigma = self.noise_rms*np.ones(len(self.Visibilities),float)
             
             # Can only do single channel data now.
             chan = np.zeros(len(self.u),float)
             
             self.path_new = self.path[:-3]+'_sabotaged/'
-            command = ['mkdir' , self.path_new]
-            subprocess.call(command)
-            
-            f = open(self.path_new+'u.bin','wb')
-            data = struct.pack('d'*len(u),*u)
-            f.write(data)
-            f.close()
-            g = open(self.path_new+'v.bin','wb')
-            data = struct.pack('d'*len(v),*v)
-            g.write(data)
-            g.close()
-            h = open(self.path_new+'chan.bin','wb')
-            data = struct.pack('d'*len(chan),*chan)
-            h.write(data)
-            h.close()
-            i = open(self.path_new+'vis_chan_0.bin','wb')
-            data = struct.pack('d'*len(vis),*vis)
-            i.write(data)
-            i.close()
-            j = open(self.path_new+'sigma_squared_inv.bin','wb')
-            data = struct.pack('d'*len(sigma_squared_inv),*sigma_squared_inv)
-            j.write(data)
-            j.close()
+            evil.write_ripples_binary(self.path_new,self.Visibilities,u,v,sigma,chan)
             
         else:
-        
-            if len(self.Visibilities)<10**6:
-                #create location for new ms, and copy old ms to new location
-                self.path_new = self.path[:-3]+'_sabotaged.ms'
-                command = ['cp','-R', self.path+'/', self.path_new+'/']
-                subprocess.call(command)
-        
-                visibilities_new = [] #new visibilities to be passed to CASA as a list
-                for i in range(len(self.Visibilities)):
-                    visibilities_new.append(self.Visibilities[i])
-            
-        
-                script = ['ms.open("%(path)s",nomodify=False)' % {"path": self.path_new}\
-                          ,'recD=ms.getdata(["data"])']
-                script.append('vis_new ='+str(visibilities_new))
-                script.append("recD['data'][0,0,:]=vis_new")
-                script.append("ms.putdata(recD)")
-                script.append("ms.close()")
-        
-                casa=drivecasa.Casapy()
-                output = casa.run_script(script)
-                print(output)
-        
-            else:
-                self.path_new = self.path[:-3]+'_sabotaged/'
-                command = ['mkdir', self.path_new]
-                subprocess.call(command)
-            
-                f = open(self.path_new+'Vis_real.txt', 'w')
-                for i in range(len(self.Visibilities)):
-                    f.write(str(self.Visibilities[i].real))
-                    f.write('\n')
-                    f.close()
-            
-                f = open(self.path_new+'Vis_imag.txt', 'w')
-                for i in range(len(self.Visibilities)):
-                    f.write(str(self.Visibilities[i].imag))
-                    f.write('\n')
-                    f.close()
             
+            #create location for new ms, and copy old ms to new location
+            self.path_new = self.path[:-3]+'_sabotaged.ms'
+            command = ['cp','-R', self.path+'/', self.path_new+'/']
+            subprocess.call(command)
             
-                
+            output = evil.put_visibilities(self.path_new,self.Visibilities,chunksize)
+            print(output)
         
         return
 # -------------------------------------------------------------------------
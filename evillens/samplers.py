@@ -0,0 +1,136 @@
+"""
+Random draws from the distributions of subhalos and source clumps, by
+inverse transform sampling.
+
+Each distribution is tabulated as a CDF once per set of parameters, and
+the inverse CDF tables are cached for the rest of the session, so that
+drawing from a distribution is a single np.interp of uniform random
+numbers (the same linear interpolation as the interp1d tables they
+replace).  Where the inverse CDF is analytic (power laws) no table is
+needed at all.
+
+    InverseCDF:                 linear interpolation of a tabulated CDF
+
+    subhalo_mass_sampler:       Springel et al. 2008 subhalo masses
+    einasto_radius_sampler:     Einasto radial distribution of subhalos
+    sersic_radius_sampler:      radii following a Sersic profile
+    powerlaw_inverse_cdf:       analytic inverse of a power-law table
+"""
+# ======================================================================
+
+import numpy as np
+import evillens as evil
+
+# Inverse CDFs built so far, keyed by distribution and parameters
+_sampler_cache = {}
+
+# ======================================================================
+
+class InverseCDF(object):
+    '''
+    The inverse of a tabulated CDF:  values of x at which the CDF is
+    cdf, with cdf monotonic (increasing or decreasing).
+    '''
+    def __init__(self, cdf, x):
+
+        cdf = np.asarray(cdf,float)
+        x = np.asarray(x,float)
+        order = np.argsort(cdf,kind='stable')
+        self.cdf = cdf[order]
+        self.x = x[order]
+
+        return
+
+# ----------------------------------------------------------------------
+
+    def __call__(self, u):
+        '''
+        x at each of the (uniform random) numbers u.
+        '''
+        return np.interp(u,self.cdf,self.x)
+
+# ======================================================================
+
+def cached_sampler(key, build):
+    '''
+    The sampler of key, made by build() the first time it is asked for.
+    '''
+    if key not in _sampler_cache:
+        _sampler_cache[key] = build()
+    return _sampler_cache[key]
+
+# ----------------------------------------------------------------------
+
+def clear_sampler_cache():
+    '''
+    Forget all cached samplers.
+    '''
+    _sampler_cache.clear()
+    return
+
+# ======================================================================
+
+def subhalo_mass_sampler(halo_mass, minimum_subhalo_mass):
+    '''
+    Inverse CDF of the subhalo mass function of a halo (including a
+    wider range than the allowed subhalo masses), and the total number
+    of subhalos to draw from it.
+    '''
+    def build():
+        Msubs = 10**np.linspace(np.log10(minimum_subhalo_mass)-3.,np.log10(halo_mass)+3.,4000)
+        CDF = evil.Subhalo_cumulative_mass_function(Msubs,halo_mass)
+        return InverseCDF(CDF/np.max(CDF),Msubs) , np.max(CDF).astype('int')
+
+    return cached_sampler(('subhalo_mass',float(halo_mass),float(minimum_subhalo_mass)),build)
+
+# ----------------------------------------------------------------------
+
+def einasto_radius_sampler(alpha=0.678, scale=199., rmax=10000., Nr=10**6):
+    '''
+    Inverse CDF of radii (in kpc) distributed as an Einasto profile.
+    '''
+    def build():
+        r_kpc = np.linspace(0,rmax,Nr)
+        pdf = evil.Einasto(r_kpc,alpha,scale)
+        cdf = np.flipud(np.cumsum(np.flipud(pdf)))
+        return InverseCDF(cdf/np.max(cdf),r_kpc)
+
+    return cached_sampler(('einasto_radius',float(alpha),float(scale),float(rmax),int(Nr)),build)
+
+# ----------------------------------------------------------------------
+
+def sersic_radius_sampler(n, rmax=5., Nr=100000):
+    '''
+    Inverse CDF of radii (in units of the half light radius, out to rmax)
+    distributed as a Sersic profile of index n.
+    '''
+    def build():
+        r = np.linspace(0,rmax,Nr)
+        bn = evil.Compute_bn(n)
+        Ir = evil.Sersic(r,0.*r,0.,0.,1.,1.,0.,n,bn)
+        Prob = np.flipud(np.cumsum(np.flipud(Ir)))
+        return InverseCDF(Prob/np.max(Prob),r)
+
+    return cached_sampler(('sersic_radius',float(n),float(rmax),int(Nr)),build)
+
+# ----------------------------------------------------------------------
+
+def powerlaw_inverse_cdf(u, min_size, max_size, index=-1):
+    '''
+    The analytic inverse of the normalized table x**index between
+    min_size and max_size (as used by Source.draw_clump_sizes_powerlaw):
+
+        u = (x**index - min(x**index)) / (max(x**index) - min(x**index))
+
+    For index = 0 this becomes the limit, log(x) uniform.
+    '''
+    u = np.asarray(u,float)
+    if index == 0:
+        return np.exp(np.log(max_size) + u*(np.log(min_size)-np.log(max_size)))
+
+    ymin = min(min_size**index,max_size**index)
+    ymax = max(min_size**index,max_size**index)
+
+    return (ymin + u*(ymax-ymin))**(1./index)
+
+# ======================================================================
@@ -11,6 +11,7 @@ are at the beginning of the __main__ function.  Otherwise everything
 should be left untouched or edited at the users own risk.
 '''
 
+from __future__ import print_function
 import numpy as np
 import os
 import struct
@@ -20,6 +21,7 @@ from xml.etree.ElementTree import Element , SubElement , Comment
 from xml.etree import ElementTree
 from xml.dom import minidom
 import json
+import evillens as evil
 
 
 # ------------------------------------------------------------------------
@@ -45,70 +47,11 @@ def get_sigma_scaling(u,v,vis,sigma):
     
     '''
     
-    UVMAX = np.max([abs(u),abs(v)]) * 1.01
-    Bins  = np.arange(-UVMAX,UVMAX+12.,12.)
-    
-    # Count number of visibilities in each bin
-    P,reject1,reject2 = np.histogram2d(u,v,bins=Bins)
-    
-    # Keep only bins that contain visibilities
-    [row,col] = np.where(P!=0)
-    
-    # Keep track of stats (just in case something weird is happening)
-    NumSkippedBins = 0
-    TotalUsed      = 0
-    
-    # Setup real and imaginary noise arrays
-    noise_r = np.zeros(u.shape)
-    noise_i = np.zeros(v.shape)
-    
-    # Array for the indices of the visibilities that are subtracted
-    indI = np.zeros(u.shape,int)
-    
-    
-    # loop over bins
-    for i in range(len(row)):
-        
-        # indices of visibilities in the bin
-        inds = np.where((v>=Bins[col[i]]) & (v<Bins[col[i]+1]) & \
-                        (u>=Bins[row[i]]) & (u<Bins[row[i]+1]))[0]
-        
-
-        # skip bins with only one visibility
-        if len(inds) == 1:
-            NumSkippedBins +=1
-            continue
-        
-        elif len(inds) % 2 == 1: # discard extra visibility if needed 
-            inds = inds[:-1]
-        
-        # get indices of visibilities to difference
-        I = inds[::2]
-        J = inds[1::2]
-        
-
-        # difference to get the noise
-        noise_r[I] = (vis[I]-vis[J]).real
-        noise_i[I] = (vis[I]-vis[J]).imag
-        
-        # record indices of subtracted visibilities
-        indI[I] = J
-        
-        # track how much visibilities have been used (cumulatively)
-        TotalUsed += len(inds)
-        
-    # keep only noise != 0 
-    iI = np.where(np.logical_not( np.isclose(noise_r, 0)))[0]
-    #iI = np.where(noise_r != 0)[0]
-    N = len(iI)
-    
-    # Get A
-    A = np.sqrt(N / np.sum((noise_r[iI]/np.sqrt(sigma[iI]**2+sigma[indI[iI]]**2))**2))
+    # Pair up visibilities in the same 12m uv cell, and difference them
+    A = evil.estimate_sigma_scaling(u,v,vis,sigma,cellsize=12.,atol=1e-8)
     
     # Verbose
-    print "Total number of visibilities used was", TotalUsed , "out of" , len(vis)
-    print NumSkippedBins , "bins out of" , len(row), "had only one visibility and were skipped"
-    print "Sigma Scaling:  " , A
+    print("Sigma Scaling:  " , A)
     
     return A
     
@@ -182,10 +125,10 @@ def Remove_missing_antennas(ant1,ant2):
         ant1[ant1>missing_antennas[-(i+1)]] -= 1
         ant2[ant2>missing_antennas[-(i+1)]] -= 1
     
-    print "these antennas are missing from your observation: " , missing_antennas
+    print("these antennas are missing from your observation: " , missing_antennas)
 # ------------------------------------------------------------------------
 
-def Build_dOdp(ant1,ant2,time,NUM_TIME_STEPS=1):
+def Build_dOdp(ant1,ant2,time,NUM_TIME_STEPS=1,scan=None):
     '''
     Set up the dOdp files with a user input number of
     phase parameters.
@@ -200,6 +143,10 @@ def Build_dOdp(ant1,ant2,time,NUM_TIME_STEPS=1):
     
     NUM_PHASE_PARS:   Number of phase intervals
     
+    scan:     The scan number of each integration.  If given, use the
+              scans from the ms to determine the phase intervals instead
+              of NUM_TIME_STEPS equal length intervals.
+    
     Returns:
     
     ID1:      The phase parameter IDs of the first antenna
@@ -211,59 +158,114 @@ def Build_dOdp(ant1,ant2,time,NUM_TIME_STEPS=1):
     # Get rid of antennas not included in the ms
     Remove_missing_antennas(ant1,ant2)
     
-    # reference numbers
-    NUM_ANT = int(np.max([np.max(ant1),np.max(ant2)]))
-    NUM_BL  = (NUM_ANT*(NUM_ANT-1))/2
-    NUM_TIME_STEPS = int(NUM_TIME_STEPS)
-    
     # to add:  Get rid of missing antennas in specific time interval 
     
-    colisone      = np.zeros(len(ant1))
-    rowisone      = np.zeros(len(ant1))
-    colisminusone = np.zeros(len(ant2))
-    rowisminusone = np.zeros(len(ant2))
+    if scan is None:
+        interval = evil.phase_intervals_from_time(time,NUM_TIME_STEPS)
+    else:
+        interval = evil.phase_intervals_from_scan(scan)
+    
+    return evil.build_dOdphase_indices(ant1,ant2,interval)
+    
+
+# ------------------------------------------------------------------------
+
+def stream_ms_to_bin(reader,outputdir,NUM_TIME_STEPS=1,use_scans=False):
+    '''
+    Convert a measurement set to the binary files read by Ripples.  Each
+    spw is read once, and its channels are written one block at a time
+    straight into output files that are preallocated from the row and 
+    channel counts.  The noise scaling is calculated and applied to each
+    channel.
+    
+    Takes:
     
-    # Time cuts?
-    tstart  = np.min(time)-1.0
-    tend    = np.max(time)+1.0
-    tdiff   = tend-tstart
-    tswitch = tdiff/float(NUM_TIME_STEPS)
+    reader:          A measurement set reader (see evillens.ms_io), e.g.
+                     evil.CasaToolReader inside CASA, or evil.NpyMSReader
     
+    outputdir:       The location to which the files will be written.
     
+    NUM_TIME_STEPS:  Number of phase intervals in the dOdp matrix
     
-    for i in range(len(rowisone)):
-        if ant1[i] == 0: # First antenna phase is always fixed to zero
-            rowisminusone[i] = i
-            colisminusone[i] = ant2[i]-1 + int((time[i]-tstart)//tswitch)*(NUM_ANT)
-        else:
-            rowisone[i]      = i
-            colisone[i]      = ant1[i]-1 + int((time[i]-tstart)//tswitch)*(NUM_ANT)
-            rowisminusone[i] = i
-            colisminusone[i] = ant2[i]-1 + int((time[i]-tstart)//tswitch)*(NUM_ANT)
+    use_scans:       If True, use the scans of the ms as phase intervals
+    
+    Returns:
+    
+    Nvis:            The total number of visibilities written
+    '''
+    
+    # Get the size of each spw before reading any data
+    NSPW   = reader.nspw()
+    Nrows  = [reader.nrows(i) for i in range(NSPW)]
+    Nchans = [len(reader.chanfreqs(i)) for i in range(NSPW)]
+    Nvis   = int(np.sum(np.multiply(Nrows,Nchans)))
+    
+    # Preallocate the output files
+    files = evil.ripples_memmaps(outputdir,Nvis)
+    Vis   = files["vis_chan_0"]
+    Sigma = files["sigma_squared_inv"]
+    u     = files["u"]
+    v     = files["v"]
+    ant1  = files["ant1"]
+    ant2  = files["ant2"]
+    time  = files["time"]
+    chan  = files["chan"]
+    if use_scans:
+        scan = np.empty(Nvis,int)
+    
+    start   = 0
+    channel = 0
+    
+    for i in range(NSPW):  # Iterate over spectral windows.
+        
+        columns = reader.read_spw(i)
+        chan_freqs = reader.chanfreqs(i)
+        
+        # polarization weights are the same for all channels of the spw
+        weights = np.asarray(columns["sigma"])**-2.
+        sigmai  = np.sum(weights,axis=0)**-0.5
+        
+        for j in range(Nchans[i]):  # Iterate over channels.
+            
+            s  = slice(start,start+Nrows[i])
+            freqij = chan_freqs[j]
             
+            # average the polarizations (weighted by noise to tease out the signal a bit better)
+            visij = np.average(columns["data"][:,j,:],weights=weights,axis=0)
             
-#   # ALTERNATIVE PHASE ASSIGNMENT.  USE SCAN FROM MS TO DETERMINE PHASE ASSOCIATION
-#   scans = np.unique(scan)
-#   for i in range(len(rowisone)):
-#       if ant1[i] == 0:
-#           rowisminusone[i] = i
-#           colisminusone[i] = ant2[i]-1 + NUM_ANT * np.argmin(abs(scan[i]-scans))
-#       else:
-#           rowisone[i]      = i
-#           colisone[i]      = ant1[i]-1 + NUM_ANT * np.argmin(abs(scan[i]-scans))
-#           rowisminusone[i] = i
-#           colisminusone[i] = ant2[i]-1 _ NUM_ANT * np.argmin(abs(scan[i]-scans))
+            # scale the noise
+            sigmaij = sigmai / get_sigma_scaling(columns["uvw"][0],columns["uvw"][1],visij,sigmai)
             
-    # Remove where ant1 is 0 from list
-    colisone = colisone[(rowisone != 0)]
-    rowisone = rowisone[(rowisone != 0)]
+            # write this channel's block
+            u[s]    = columns["uvw"][0] * freqij / (3.*10**8)
+            v[s]    = columns["uvw"][1] * freqij / (3.*10**8)
+            Vis[2*s.start:2*s.stop:2]   = visij.real
+            Vis[2*s.start+1:2*s.stop:2] = visij.imag
+            Sigma[2*s.start:2*s.stop:2]   = sigmaij**-2.
+            Sigma[2*s.start+1:2*s.stop:2] = sigmaij**-2.
+            ant1[s] = columns["antenna1"]
+            ant2[s] = columns["antenna2"]
+            time[s] = columns["time"]
+            chan[s] = channel
+            if use_scans:
+                scan[s] = columns["scan_number"]
+            
+            start   += Nrows[i]
+            channel += 1
+        
+        del columns
     
-    return rowisone , colisone , rowisminusone , colisminusone
+    # Build the DOdPhase matrix (this is for older versions of Ripples).
+    # Removing the missing antennas also updates the antenna files.
+    ROWisone , COLisone , ROWisminusone , COLisminusone = \
+            Build_dOdp(ant1,ant2,time,NUM_TIME_STEPS,scan if use_scans else None)
+    evil.write_dOdphase(outputdir,ROWisone,COLisone,ROWisminusone,COLisminusone)
     
+    for f in [Vis,Sigma,u,v,ant1,ant2,time,chan]:
+        f.flush()
     
-    return
+    return Nvis
     
-
 # ------------------------------------------------------------------------
 
 def get_phase_grid(antX,antY,time,amp,velocity,cellsize=10.0,randseed=1):
@@ -289,23 +291,22 @@ def get_phase_grid(antX,antY,time,amp,velocity,cellsize=10.0,randseed=1):
     y = np.arange(minY,maxY+cellsize,cellsize)
     
     # get the initial_phase_screen (white noise)
-    np.random.seed(randseed)
-    phases = np.random.normal(0.0,1.0,(len(y),len(x)))
+    rng = evil.random_stream(randseed,'phase_screen')
+    phases = rng.normal(0.0,1.0,(len(y),len(x)))
     
     # FFT the phase screen and get coordinates
     phases = np.fft.fft2(phases / cellsize)
     FreqX = np.fft.fftfreq(len(x),1.0/float(len(x)))*2.0*np.pi/(x[-1]-x[0])
     FreqY = np.fft.fftfreq(len(y),1.0/float(len(y)))*2.0*np.pi/(y[-1]-y[0])
     
-    # Slowly transform the FT phase screen by the power spectrum
-    for i in range(len(FreqX)):
-        for j in range(len(FreqY)):
-            if np.sqrt(FreqX[i]**2+FreqY[j]**2)>1.0/1000.0:
-                phases[j,i] *=(np.pi/180.)*amp*np.sqrt(0.0365)*(1000.0*np.sqrt(FreqX[i]**2+FreqY[j]**2))**(-11.0/6.0)
-            elif np.sqrt(FreqX[i]**2+FreqY[j]**2)<1.0/1000.0 and np.sqrt(FreqX[i]**2+FreqY[j]**2)>1.0/6000.:
-                phases[j,i] *= (np.pi/180.)*amp*np.sqrt(0.0365)*(1000.0*np.sqrt(FreqX[i]**2+FreqY[j]**2))**(-5.0/6.0)
-            else:
-                phases[j,i] *= (np.pi / 180.)*np.sqrt(0.0365)*(amp)*(6.0)**(-5.0/6.0)
+    # Transform the FT phase screen by the power spectrum
+    k = np.sqrt(FreqX[None,:]**2+FreqY[:,None]**2)
+    inner = k > 1.0/1000.0
+    outer = (k < 1.0/1000.0) & (k > 1.0/6000.)
+    with np.errstate(divide='ignore'):
+        phases *= np.where(inner,(np.pi/180.)*amp*np.sqrt(0.0365)*(1000.0*k)**(-11.0/6.0), \
+                  np.where(outer,(np.pi/180.)*amp*np.sqrt(0.0365)*(1000.0*k)**(-5.0/6.0), \
+                           (np.pi / 180.)*np.sqrt(0.0365)*(amp)*(6.0)**(-5.0/6.0)))
     
     phases = 4*np.pi*np.fft.ifft2(phases)
     return phases,x,y
@@ -334,20 +335,34 @@ def assign_phases_to_antennas(ant1,ant2,antX,antY,PhaseGrid,phase_x,phase_y,velo
     
 # ------------------------------------------------------------------------    
     
-def Mock_phase_calibration(antennaphases,ant1,ant2,pwv_mean,proportional_error):
+def Mock_WVR_correction(antennaphases,pwv_mean,proportional_error,randseed=1):
+    '''
+    Mock the ALMA water vapor radiometer estimate of the phase of each
+    antenna ([Nantennas,Ntsteps], like antennaphases).
+    '''
+    
+    rng = evil.random_stream(randseed,'wvr')
     
     # Change from electrical path length to meters and add the mean pwv
     pwv = antennaphases / (2*np.pi) + pwv_mean
-    pwv_meas = pwv + 1.0e-5 * np.random.normal(0.0,abs(1+pwv/0.001))
+    pwv_meas = pwv + 1.0e-5 * rng.normal(0.0,abs(1+pwv/0.001))
     WVR_correction = 2*np.pi*(pwv_meas-pwv_mean)
     
-    PE = np.random.normal(0.0,proportional_error,antennaphases.shape[0])
+    PE = rng.normal(0.0,proportional_error,antennaphases.shape[0])
     PE = np.outer(PE,np.ones(antennaphases.shape[1]))
     PE *= antennaphases
     
     # Total WVR estimated phase
     WVR_correction -= PE
     
+    return WVR_correction
+    
+# ------------------------------------------------------------------------    
+    
+def Mock_phase_calibration(antennaphases,ant1,ant2,pwv_mean,proportional_error,randseed=1):
+    
+    WVR_correction = Mock_WVR_correction(antennaphases,pwv_mean,proportional_error,randseed)
+    
     correction_ant1 = np.zeros(ant1.shape)
     correction_ant2 = np.zeros(ant2.shape)
     
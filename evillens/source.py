@@ -110,7 +110,7 @@ class Source(object):
         return        
 
 # ----------------------------------------------------------------------
-    def build_from_clumps(self,size=2.0,clump_size = 0.1,axis_ratio=1.0, orientation=0.0,center=[0,0], Nclumps=50, n = 1 , error =10**-8,singlesource=False,seeds=[1,2,3],Flux=1.0):
+    def build_from_clumps(self,size=2.0,clump_size = 0.1,axis_ratio=1.0, orientation=0.0,center=[0,0], Nclumps=50, n = 1 , error =10**-8,singlesource=False,seeds=[1,2,3],Flux=1.0,nsigma=9.0,batched=False,integrate=False):
         #raise Exception("cannot build source from clumps yet. \n")
         '''
         Build source from gaussian clumps centered about specified position.
@@ -126,6 +126,10 @@ class Source(object):
         - The standard deviation of the brightness for individual clumps.
            The clump brightness follows a lognormal distribution
         - Sersic index n
+        - nsigma, batched and integrate control the rendering of the
+           clumps (see evil.render_gaussian_clumps).  With integrate, the
+           clumps are integrated over the pixels, but the sersic envelope
+           is still evaluated at the pixel centers.
         '''
         
         self.axis_ratio = axis_ratio
@@ -141,48 +145,27 @@ class Source(object):
 #        rlist = np.sqrt(np.random.random(Nclumps))*4.0*self.size
 #        thetalist = np.random.random(Nclumps)*2*np.pi
         if singlesource ==False:
-            # seed random # generation
-            np.random.seed(seeds[0])
-            xpos_orig = np.random.exponential(self.size,Nclumps)/np.sqrt(self.axis_ratio)*np.random.choice([-1,1],Nclumps)
-            np.random.seed(seeds[1])
-            ypos_orig = np.random.exponential(self.size,Nclumps)*np.sqrt(self.axis_ratio)*np.random.choice([-1,1],Nclumps)
-            np.random.seed(seeds[2])
+            # one random stream for each of x and y
+            rng = evil.random_stream(seeds[0],'source_clumps',0)
+            xpos_orig = rng.exponential(self.size,Nclumps)/np.sqrt(self.axis_ratio)*rng.choice([-1,1],Nclumps)
+            rng = evil.random_stream(seeds[1],'source_clumps',1)
+            ypos_orig = rng.exponential(self.size,Nclumps)*np.sqrt(self.axis_ratio)*rng.choice([-1,1],Nclumps)
             self.xlist = xpos_orig*np.cos(self.orientation)-ypos_orig*np.sin(self.orientation) + self.center[0]
             self.ylist = xpos_orig*np.sin(self.orientation)+ypos_orig*np.cos(self.orientation) +self.center[1]
         else:
             self.xlist = np.array([center[0],100000000])
             self.ylist = np.array([center[1],100000000])   
         #determine constant b_n which allows us to use r as half light radius
-        def fx(n,bn):
-            return(2*sp.gammainc(2*n,bn)-1)
-        
-        #initial guess follows approximation from Capaccioli 1989
-        x0 = 1.9992*n - 0.3271
-        x1 = x0 + 0.01
-        j = 0
-        epsilon = abs(x1-x0)
-        while epsilon > error and j<100000:
-            fx0 = fx(n,x0)
-            fx1 = fx(n,x1)
-            x0,x1 = x1 , x1 - fx1*(x1-x0) / (fx1-fx0)
-            epsilon = abs(x1-x0)
-            j+=1
-        if j ==100000:
-            #solution didn't converge, lets just approximate it.
-            self.b_n = 1.9992*n-0.3271
-        else:
-            self.b_n = x1
+        self.b_n = evil.Compute_bn(n,error)
         
         #self.Blist = np.exp(-self.b_n*((np.sqrt((np.cos(self.orientation)*(self.xlist-self.center[0])-np.sin(self.orientation)*(self.ylist-self.center[1]))**2*self.axis_ratio+((self.xlist-self.center[0])*np.sin(self.orientation)+(self.ylist-self.center[1])*np.cos(self.orientation))**2/self.axis_ratio)/self.size)**(1/self.n)-1))   
-        np.random.seed(seeds[2])     
-        self.Slist = np.random.exponential(self.clump_size,self.Nclumps)
-        
-        for i in range(self.Nclumps):
-            if i==0:
-                self.intensity = (1.0/np.sqrt(2*np.pi))*np.exp(-0.5*((self.beta_x-self.xlist[i])**2+(self.beta_y-self.ylist[i])**2)/self.Slist[i]**2)
-            else:
-                self.intensity +=(1.0/np.sqrt(2*np.pi))*np.exp(-0.5*((self.beta_x-self.xlist[i])**2+(self.beta_y-self.ylist[i])**2)/self.Slist[i]**2)
+        rng = evil.random_stream(seeds[2],'source_clumps',2)
+        self.Slist = rng.exponential(self.clump_size,self.Nclumps)
         
+        self.intensity = evil.render_gaussian_clumps(self.beta_x,self.beta_y, \
+                                                     self.xlist[:self.Nclumps],self.ylist[:self.Nclumps], \
+                                                     self.Slist,1.0/np.sqrt(2*np.pi),nsigma,batched, \
+                                                     integrate=integrate)
 
         self.intensity *= np.exp(-self.b_n*((np.sqrt((np.cos(self.orientation)*(self.beta_x-self.center[0])+np.sin(self.orientation)*(self.beta_y-self.center[1]))**2*self.axis_ratio+(-(self.beta_x-self.center[0])*np.sin(self.orientation)+(self.beta_y-self.center[1])*np.cos(self.orientation))**2/self.axis_ratio)/self.size)**(1/self.n)-1))        
         
@@ -195,7 +178,7 @@ class Source(object):
 
     def build_sersic_clumps(self,Nnuclei=1,NclumpsPerNucleus=1,\
                             x0=0,y0=0,q=1.,phi=0.,r_hl=0.1,n=1.,
-                            seed1 = 0):
+                            seed1 = 0,nsigma=9.0,batched=False,integrate=False):
         '''
         Build a source that (generally) follows a sersic profile, 
         but with clumps that are broken into nuclei, allowing for
@@ -207,7 +190,9 @@ class Source(object):
         - Nnuclei:            Number of nuclei
         - NclumpsPerNucleus:  Number of clumps per nucleus
         - x0,y0,q,phi,r_hl,n: parameters of the sersic profile
-        - seed1-4:            random seeds
+        - seed1:              random seed
+        - nsigma,batched,     rendering of the clumps (see
+          integrate:          evil.render_gaussian_clumps)
                             
         Returns:
         
@@ -216,33 +201,32 @@ class Source(object):
                        
         bn = evil.Compute_bn(n)
                             
+        # all draws come from one stream, in a fixed order
+        rng = evil.random_stream(seed1,'source_clumps')
+        
         # create nuclei
-        np.random.seed(seed1)
-        xn,yn = self.draw_clump_nuclei_positions(Nnuclei,x0,y0,q,r_hl,phi,n)
-        sn    = self.draw_clump_nuclei_sizes(Nnuclei,r_hl)
+        xn,yn = self.draw_clump_nuclei_positions(Nnuclei,x0,y0,q,r_hl,phi,n,rng)
+        sn    = self.draw_clump_nuclei_sizes(Nnuclei,r_hl,rng)
         
         for i in range(len(sn)):
         
             if i ==0:
-                xc,yc = self.draw_clump_positions(NclumpsPerNucleus,sn[i],xn[i],yn[i])
-                sc    = self.draw_clump_sizes_powerlaw(NclumpsPerNucleus,0.05*sn[i],sn[i])
+                xc,yc = self.draw_clump_positions(NclumpsPerNucleus,sn[i],xn[i],yn[i],rng)
+                sc    = self.draw_clump_sizes_powerlaw(NclumpsPerNucleus,0.05*sn[i],sn[i],rng=rng)
             else:
-                xctemp,yctemp = self.draw_clump_positions(NclumpsPerNucleus,sn[i],xn[i],yn[i])
+                xctemp,yctemp = self.draw_clump_positions(NclumpsPerNucleus,sn[i],xn[i],yn[i],rng)
                 xc    = np.append(xc,xctemp)
                 yc    = np.append(yc,yctemp)
-                sc    = np.append(sc, self.draw_clump_sizes_powerlaw(NclumpsPerNucleus,0.01*sn[i],sn[i]))
+                sc    = np.append(sc, self.draw_clump_sizes_powerlaw(NclumpsPerNucleus,0.01*sn[i],sn[i],rng=rng))
         
         # add clumps to image
-        for i in range(len(sc)):
-            if i ==0:
-                self.intensity = np.exp(-0.5*((self.beta_x-xc[i])**2+(self.beta_y-yc[i])**2)/sc[i]**2)
-            else:
-                self.intensity += np.exp(-0.5*((self.beta_x-xc[i])**2+(self.beta_y-yc[i])**2)/sc[i]**2)
+        self.intensity = evil.render_gaussian_clumps(self.beta_x,self.beta_y,xc,yc,sc, \
+                                                     1.0,nsigma,batched,integrate=integrate)
     
         return
         
         
-    def draw_clump_sizes_powerlaw(self,Nclumps,min_size,max_size,index=-1):
+    def draw_clump_sizes_powerlaw(self,Nclumps,min_size,max_size,index=-1,rng=None):
         '''
         draw a list of clump radii (in arcsec) from a power-law
         distribution with a specified index, and between a minimum
@@ -254,7 +238,7 @@ class Source(object):
         - min_size: The minimum size of clumps
         - max_size: The maximum size of clumps
         - index:    The power-law index
-        - seed:     An integer specifying the random state
+        - rng:      A random seed, or numpy Generator to draw from
         
         Returns:
         
@@ -262,20 +246,13 @@ class Source(object):
                     power-law distribution
         '''
         
-        # setup interpolation function that will be used for generator
-        x = 10**np.linspace(np.log10(min_size),np.log10(max_size),100000)
-        y = x**index
-        y -= np.min(y)
-        y /= np.max(y)
-    
-        finterp = interp1d(y,x,'linear')
-    
-        draws = np.random.random(Nclumps)
-        sizes = finterp(draws)
+        # the inverse of the normalized power law is analytic
+        draws = evil.random_stream(rng).random(Nclumps)
+        sizes = evil.powerlaw_inverse_cdf(draws,min_size,max_size,index)
     
         return sizes
         
-    def draw_clump_nuclei_positions(self,Nnuclei,x0,y0,q,r_hl,phi,n):
+    def draw_clump_nuclei_positions(self,Nnuclei,x0,y0,q,r_hl,phi,n,rng=None):
         '''
         Draw a list of x and y coordinates for source nuclei
         from a sersic distribution.
@@ -287,28 +264,23 @@ class Source(object):
         q,phi:     the axis ratio and rotation angle of the source
         r_hl:      The half-light radius of the source
         n:         Sersic index
-        seed:      a seed to control the random generator
+        rng:       a seed, or numpy Generator, to control the random draws
         
         Returns:
         
         x,y:       Randomly drawn coordinates of nuclei'''
     
-        # first generate a sersic profile
-        r = np.linspace(0,5*r_hl,100000)
-        bn = evil.Compute_bn(n)
-        Ir = evil.Sersic(r*np.cos(0.),r*np.sin(0.),0.,0.,1.,r_hl,0.,n,bn)
-    
-        # Get CDF and normalize
-        Prob = np.flipud(np.cumsum(np.flipud(Ir)))
-        Prob /= np.max(Prob)
+        # inverse CDF of a sersic profile out to 5 half light radii
+        # (in units of r_hl, so it is cached for each n)
+        finterp = evil.sersic_radius_sampler(n,5.)
     
         # Interpolate random numbers to CDF to get sersic random numbers
-        finterp = interp1d(Prob,r,'linear')
-        draws = np.random.random(Nnuclei)
-        radius = finterp(draws)
+        rng = evil.random_stream(rng)
+        draws = rng.random(Nnuclei)
+        radius = r_hl*finterp(draws)
         
         # draw random angles
-        angle = np.random.random(Nnuclei)*2*np.pi
+        angle = rng.random(Nnuclei)*2*np.pi
     
         # transform radius and angle to x,y, position
         xp = radius*np.cos(angle)/q
@@ -324,7 +296,7 @@ class Source(object):
     
         return x,y
         
-    def draw_clump_nuclei_sizes(self,Nnuclei,src_size):
+    def draw_clump_nuclei_sizes(self,Nnuclei,src_size,rng=None):
         '''
         Arbitrarily defined nuclei size are taken to be 
         inversely proportional to source size.  randomly
@@ -334,14 +306,15 @@ class Source(object):
         mu = 2*src_size/np.sqrt(float(Nnuclei))
         sigma = 0.2*src_size/np.sqrt(float(Nnuclei))
         
-        return np.random.normal(mu,sigma,Nnuclei)
+        return evil.random_stream(rng).normal(mu,sigma,Nnuclei)
         
-    def draw_clump_positions(self,Nclumps,nuclei_size,x,y):
+    def draw_clump_positions(self,Nclumps,nuclei_size,x,y,rng=None):
         '''
         Draw gaussian random positions for clumps.
         '''
-        xc = np.random.normal(x,nuclei_size,Nclumps)
-        yc = np.random.normal(y,nuclei_size,Nclumps)
+        rng = evil.random_stream(rng)
+        xc = rng.normal(x,nuclei_size,Nclumps)
+        yc = rng.normal(y,nuclei_size,Nclumps)
         return xc,yc
 
 # ----------------------------------------------------------------------
@@ -0,0 +1,268 @@
+"""
+Rendering of many small profiles (e.g. the gaussian clumps of
+Source.build_from_clumps and Source.build_sersic_clumps) onto a source
+grid.
+
+Evaluating every clump over the full grid costs Nclumps*NX*NY exp()'s,
+which for the thousands of clumps of a challenge source is most of the
+time taken to build it.  A gaussian is separable, so on the regular
+(meshgrid) source grid each clump is the outer product of a profile in
+y and a profile in x, and only needs to be evaluated out to nsigma of
+its center:
+
+    boxes:    each clump is evaluated inside its nsigma bounding box, and
+              the boxes are accumulated onto the image with a scatter-add
+              (np.bincount), many clumps at a time.
+
+    batched:  the x and y profiles of all clumps are evaluated over the
+              whole grid, and summed with a single matrix product.  No
+              clump is truncated, and it is the faster of the two when
+              the grid is small or the clumps are large.
+
+Beyond nsigma = 9 a gaussian is below 3e-18 of its peak, so the two
+modes agree with the direct sum over the full grid to rounding.  Both
+need a regular, increasing grid:  on any other grid (e.g. a source grid
+that has been rotated or distorted in place) the clumps are summed
+directly over every pixel instead.
+
+Profiles are normally evaluated at the pixel centers, which is only a
+good approximation to the flux in each pixel when the profile is smooth
+on the scale of a pixel (hence the very fine source grids needed for
+highly magnified sources).  With integrate=True the pixels are instead
+given the mean of the profile over their area:
+
+    gaussians:  analytically, with the difference of two erf's in each
+                of x and y (render_gaussian_clumps, GaussianSource).
+
+    others:     by supersampling (pixel_integrated).  The error of the
+                pixel center value is estimated from the discrete
+                laplacian, and only pixels where it exceeds rtol (e.g.
+                the core of a Sersic profile) are supersampled, by 3x3,
+                9x9, ... samples until the mean converges to rtol.
+
+so that a coarser grid can be used for the same accuracy in flux.
+"""
+# ======================================================================
+
+import numpy as np
+import scipy.special as sp
+
+# ======================================================================
+
+def meshgrid_axes(xgrid, ygrid):
+    '''
+    The 1D axes of a grid np.meshgrid(xaxis,yaxis), given either as the
+    axes themselves or as the 2D grids, or None if the grid is not a
+    regular, increasing meshgrid.
+    '''
+    if xgrid.ndim == 2 or ygrid.ndim == 2:
+        if xgrid.shape != ygrid.shape or xgrid.ndim != 2 or np.any(xgrid != xgrid[:1,:]) \
+           or np.any(ygrid != ygrid[:,:1]):
+            return None
+        xgrid , ygrid = xgrid[0,:] , ygrid[:,0]
+
+    for axis in [xgrid,ygrid]:
+        step = np.diff(axis)
+        if len(axis) < 2 or np.any(step <= 0) or not np.allclose(step,step[0],rtol=1.0e-6,atol=0.0):
+            return None
+
+    return xgrid , ygrid
+
+# ----------------------------------------------------------------------
+
+def clump_boxes(grid, centers, halfwidths):
+    '''
+    First and last+1 index of the (increasing) 1D grid inside
+    centers +/- halfwidths.
+    '''
+    start = np.searchsorted(grid,centers-halfwidths,'left')
+    stop  = np.searchsorted(grid,centers+halfwidths,'right')
+    return start , np.maximum(stop,start)
+
+# ----------------------------------------------------------------------
+
+def gaussian_pixel_profile(x, xc, sigma, pixel=None):
+    '''
+    The 1D gaussian exp(-0.5*(x-xc)**2/sigma**2), either at x (if pixel
+    is None), or averaged over pixels of width pixel centered on x.
+    '''
+    if pixel is None:
+        return np.exp(-0.5*(x-xc)**2/sigma**2)
+
+    a = (x-0.5*pixel-xc)/(np.sqrt(2)*sigma)
+    b = (x+0.5*pixel-xc)/(np.sqrt(2)*sigma)
+
+    # erfc of the side farther from the center, so the tails do not
+    # cancel to zero
+    d = np.where(a > 0,sp.erfc(a)-sp.erfc(b),np.where(b < 0,sp.erfc(-b)-sp.erfc(-a),sp.erf(b)-sp.erf(a)))
+
+    return np.sqrt(np.pi/2)*sigma/pixel*d
+
+# ----------------------------------------------------------------------
+
+def pixel_integrated(profile, xgrid, ygrid, rtol=1.0e-3, max_factor=81, chunksize=2**22):
+    '''
+    Mean of profile(x,y) over each pixel of the grid
+    np.meshgrid(xgrid,ygrid), supersampling only where the value at the
+    pixel center is not accurate to rtol.
+
+    Takes:
+
+    profile:      vectorised function of x,y
+
+    xgrid,ygrid:  1D, regularly spaced pixel coordinates
+
+    rtol:         relative accuracy of each pixel
+
+    max_factor:   largest number of samples per pixel side (the pixels
+                  are sampled 3x3, 9x9, ... up to max_factor)
+
+    chunksize:    maximum number of samples evaluated at once
+
+    Returns:
+
+    image:        [len(ygrid),len(xgrid)] array
+    '''
+    xgrid = np.asarray(xgrid,float)
+    ygrid = np.asarray(ygrid,float)
+    dx = xgrid[1]-xgrid[0]
+    dy = ygrid[1]-ygrid[0]
+
+    X,Y = np.meshgrid(xgrid,ygrid)
+    image = np.asarray(profile(X,Y),float)
+
+    # the error of the pixel center value is ~ (dx^2 d2f/dx2 + dy^2 d2f/dy2)/24
+    padded = np.pad(image,1,mode='edge')
+    laplacian = padded[1:-1,2:]+padded[1:-1,:-2]+padded[2:,1:-1]+padded[:-2,1:-1]-4*image
+    pixels = np.flatnonzero(np.abs(laplacian)/24.0 > rtol*np.abs(image))
+
+    image = image.ravel()
+    x , y = X.ravel()[pixels] , Y.ravel()[pixels]
+    factor = 3
+    while len(pixels) > 0 and factor <= max_factor:
+        offsets = (np.arange(factor)+0.5)/factor-0.5
+        ox,oy = np.meshgrid(offsets*dx,offsets*dy)
+        ox , oy = ox.ravel() , oy.ravel()
+
+        mean = np.empty(len(pixels))
+        step = max(chunksize//factor**2,1)
+        for start in range(0,len(pixels),step):
+            s = slice(start,start+step)
+            mean[s] = np.mean(profile(x[s,None]+ox,y[s,None]+oy),axis=1)
+
+        converged = np.abs(mean-image[pixels]) <= rtol*np.abs(mean)
+        image[pixels] = mean
+        pixels , x , y = pixels[~converged] , x[~converged] , y[~converged]
+        factor *= 3
+
+    return image.reshape(X.shape)
+
+# ----------------------------------------------------------------------
+
+def render_gaussian_clumps(xgrid, ygrid, xc, yc, sigma, amplitude=1.0, \
+                           nsigma=9.0, batched=False, chunksize=2**22, integrate=False):
+    '''
+    Sum of circular gaussian clumps,
+
+        amplitude * exp(-0.5*((x-xc)**2+(y-yc)**2)/sigma**2)
+
+    on the grid np.meshgrid(xgrid,ygrid).  If the grid is not regular
+    and increasing, the clumps are summed directly over every pixel
+    (neither nsigma nor batched apply, and integrate is not possible).
+
+    Takes:
+
+    xgrid,ygrid:  1D pixel coordinates, or the 2D grids themselves
+
+    xc,yc:        clump centers
+
+    sigma:        clump widths
+
+    amplitude:    peak of each clump (one, or one per clump)
+
+    nsigma:       half width of the bounding box of each clump, in sigma
+
+    batched:      if True, evaluate every clump over the whole grid
+
+    chunksize:    maximum number of box pixels evaluated at once
+
+    integrate:    if True, each pixel is the mean of the clumps over its
+                  area rather than their value at its center
+
+    Returns:
+
+    image:        [len(ygrid),len(xgrid)] array (or of the 2D grids' shape)
+    '''
+    xgrid = np.asarray(xgrid,float)
+    ygrid = np.asarray(ygrid,float)
+    xc = np.atleast_1d(np.asarray(xc,float))
+    yc = np.atleast_1d(np.asarray(yc,float))
+    sigma = np.atleast_1d(np.asarray(sigma,float))
+    amplitude = np.broadcast_to(np.asarray(amplitude,float),xc.shape)
+
+    axes = meshgrid_axes(xgrid,ygrid)
+    if axes is None:
+        if integrate:
+            raise Exception("integrating the clumps over the pixels needs a regular, increasing grid \n")
+        if xgrid.ndim == 2 or ygrid.ndim == 2:
+            X , Y = np.broadcast_arrays(xgrid,ygrid)
+        else:
+            X , Y = np.meshgrid(xgrid,ygrid)
+        x , y = X.ravel() , Y.ravel()
+        image = np.zeros(len(x))
+        step = max(chunksize//max(len(x),1),1)
+        for start in range(0,len(xc),step):
+            s = slice(start,start+step)
+            image += np.dot(amplitude[s],np.exp(-0.5*((x[None,:]-xc[s,None])**2+(y[None,:]-yc[s,None])**2) \
+                                                /sigma[s,None]**2))
+        return image.reshape(X.shape)
+
+    xgrid , ygrid = axes
+    NX , NY = len(xgrid) , len(ygrid)
+
+    if integrate:
+        dx , dy = xgrid[1]-xgrid[0] , ygrid[1]-ygrid[0]
+    else:
+        dx , dy = None , None
+
+    if batched:
+        gx = gaussian_pixel_profile(xgrid[None,:],xc[:,None],sigma[:,None],dx)
+        gy = gaussian_pixel_profile(ygrid[None,:],yc[:,None],sigma[:,None],dy)
+        return np.dot((amplitude[:,None]*gy).T,gx)
+
+    ix0,ix1 = clump_boxes(xgrid,xc,nsigma*sigma+0.5*(dx or 0.0))
+    iy0,iy1 = clump_boxes(ygrid,yc,nsigma*sigma+0.5*(dy or 0.0))
+    wx , wy = ix1-ix0 , iy1-iy0
+
+    # clumps of similar box sizes are rendered together, so that little
+    # is wasted padding the boxes of each chunk to a common size
+    area = wx*wy
+    order = np.argsort(area,kind='stable')
+    order = order[area[order]>0]
+
+    image = np.zeros(NX*NY)
+    start = 0
+    while start < len(order):
+        # as many clumps as fit in chunksize pixels (at least one)
+        Nfit = np.searchsorted(np.arange(1,len(order)-start+1)*area[order[start:]],chunksize,'right')
+        chunk = order[start:start+max(Nfit,1)]
+        start += len(chunk)
+
+        W , H = wx[chunk].max() , wy[chunk].max()
+        ix = ix0[chunk,None] + np.arange(W)
+        iy = iy0[chunk,None] + np.arange(H)
+        inx = np.arange(W) < wx[chunk,None]
+        iny = np.arange(H) < wy[chunk,None]
+        ix = np.where(inx,ix,0)
+        iy = np.where(iny,iy,0)
+
+        s = sigma[chunk,None]
+        gx = np.where(inx,gaussian_pixel_profile(xgrid[ix],xc[chunk,None],s,dx),0.0)
+        gy = np.where(iny,amplitude[chunk,None]*gaussian_pixel_profile(ygrid[iy],yc[chunk,None],s,dy),0.0)
+
+        image += np.bincount((iy[:,:,None]*NX+ix[:,None,:]).ravel(), \
+                             (gy[:,:,None]*gx[:,None,:]).ravel(),minlength=NX*NY)
+
+    return image.reshape(NY,NX)
+
+# ======================================================================
@@ -0,0 +1,164 @@
+"""
+uv coverage of an array from Earth rotation, without CASA.
+
+Antenna positions are read from the CASA/simobserve configuration files
+(alma.cycle*.cfg, found by name through evillens.antenna_registry), whose columns are the local East, North, Up offsets
+of each antenna (in meters), its diameter and its pad name.  They are
+rotated to equatorial coordinates (X towards the meridian at hour angle
+0, Y towards the East, Z towards the pole) and then projected onto the
+uvw plane of a source at declination dec, for each hour angle.
+
+Baselines are ordered as CASA orders the rows of a measurement set:
+by time, then antenna1, then antenna2, with antenna1 < antenna2, and
+uvw is the position of antenna2 relative to antenna1.
+
+Everything is computed for all antennas and integrations at once, so a
+full multi-hour track of a 50 antenna array takes a fraction of a second.
+"""
+# ======================================================================
+
+import numpy as np
+import evillens as evil
+
+# Latitude of the ALMA array center (radians)
+ALMA_LATITUDE = np.deg2rad(-23.029)
+
+# Earth's rotation rate (radians of hour angle per second of time)
+OMEGA_EARTH = 2*np.pi/86164.0905
+
+# ======================================================================
+
+def read_antenna_config(antennaconfig, path=None):
+    '''
+    Read a simobserve antenna configuration (a file, or the name of one
+    in the antenna registry).
+
+    Returns:
+
+    enu:     [Nantennas,3] array of East, North, Up positions (in meters)
+
+    diam:    antenna diameters (in meters)
+    '''
+    antennaparams = evil.load_antenna_config(antennaconfig,path)
+    return antennaparams[:,:3] , antennaparams[:,3]
+
+# ----------------------------------------------------------------------
+
+def enu_to_xyz(enu,latitude=ALMA_LATITUDE):
+    '''
+    Rotate local East, North, Up antenna positions ([Nantennas,3]) to
+    equatorial X, Y, Z.
+    '''
+    E,N,U = np.asarray(enu,float).T
+    X = -np.sin(latitude)*N + np.cos(latitude)*U
+    Y = E
+    Z =  np.cos(latitude)*N + np.sin(latitude)*U
+    return np.array([X,Y,Z]).T
+
+# ----------------------------------------------------------------------
+
+def baselines(Nantennas):
+    '''
+    antenna1 and antenna2 of every baseline, in measurement set order.
+    '''
+    return np.triu_indices(Nantennas,1)
+
+# ----------------------------------------------------------------------
+
+def earth_rotation_uvw(xyz,dec,hour_angles):
+    '''
+    Project the baselines of an array onto the uvw plane at each hour
+    angle.
+
+    Takes:
+
+    xyz:           [Nantennas,3] equatorial antenna positions (in meters)
+
+    dec:           declination of the source (in radians)
+
+    hour_angles:   hour angle of each integration (in radians)
+
+    Returns:
+
+    u,v,w:         [Nhour_angles,Nbaselines] arrays (in meters)
+
+    ant1,ant2:     antennas of each baseline (length Nbaselines)
+    '''
+    X,Y,Z = np.asarray(xyz,float).T
+    H = np.asarray(hour_angles,float)[:,None]
+    sH , cH = np.sin(H) , np.cos(H)
+    sd , cd = np.sin(dec) , np.cos(dec)
+
+    # uvw of each antenna, [Nhour_angles,Nantennas]
+    ua =  sH*X + cH*Y
+    va = -sd*cH*X + sd*sH*Y + cd*Z
+    wa =  cd*cH*X - cd*sH*Y + sd*Z
+
+    ant1,ant2 = baselines(len(X))
+
+    return ua[:,ant2]-ua[:,ant1] , va[:,ant2]-va[:,ant1] , wa[:,ant2]-wa[:,ant1] , ant1 , ant2
+
+# ----------------------------------------------------------------------
+
+def synthesise_uv_coverage(antennaconfig,dec,hour_angle_range,integration_time, \
+                           chanfreqs=None,latitude=ALMA_LATITUDE,time_start=0.0):
+    '''
+    Synthesise the uv coverage of an observation from the rotation of the
+    Earth, with rows in measurement set order.
+
+    Takes:
+
+    antennaconfig:     simobserve antenna configuration (file or name), or an
+                       [Nantennas,3] array of East, North, Up positions
+                       (in meters)
+
+    dec:               declination of the source (radians)
+
+    hour_angle_range:  [start,end] hour angle of the observation (radians)
+
+    integration_time:  length of one integration (seconds)
+
+    chanfreqs:         channel frequencies (Hz).  If None, u,v,w are
+                       returned in meters.
+
+    latitude:          latitude of the array (radians)
+
+    time_start:        time at the start of the observation (seconds)
+
+    Returns:
+
+    u,v,w:             [Nchan,Nrows] arrays, in wavelengths of each channel
+                       (or length Nrows, in meters, if chanfreqs is None)
+
+    ant1,ant2:         antennas of each row
+
+    time:              time at the middle of the integration of each row
+    '''
+    if isinstance(antennaconfig,np.ndarray):
+        enu = antennaconfig
+    else:
+        enu,diam = read_antenna_config(antennaconfig)
+
+    Ntsteps = int(round((hour_angle_range[1]-hour_angle_range[0])/OMEGA_EARTH/integration_time))
+    if Ntsteps < 1:
+        raise Exception("the hour angle range is shorter than one integration \n")
+    tsteps = (np.arange(Ntsteps)+0.5)*integration_time
+    hour_angles = hour_angle_range[0] + OMEGA_EARTH*tsteps
+
+    u,v,w,ant1,ant2 = earth_rotation_uvw(enu_to_xyz(enu,latitude),dec,hour_angles)
+    Nbaselines = len(ant1)
+
+    u = u.ravel()
+    v = v.ravel()
+    w = w.ravel()
+    time = np.repeat(time_start+tsteps,Nbaselines)
+    ant1 = np.tile(ant1,Ntsteps)
+    ant2 = np.tile(ant2,Ntsteps)
+
+    if chanfreqs is not None:
+        scale = np.atleast_1d(np.asarray(chanfreqs,float))[:,None] / (3.0*10**8)
+        u = u*scale
+        v = v*scale
+        w = w*scale
+
+    return u , v , w , ant1 , ant2 , time
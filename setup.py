@@ -17,4 +17,5 @@ setup(name='EvilLens',
 	  author='Warren Morningstar',
 	  author_email='wmorning@stanford.edu',
 	  packages=['evillens'],
+	  package_data={'evillens': ['antennas/*.cfg']},
       )
\ No newline at end of file
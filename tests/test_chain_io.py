@@ -0,0 +1,69 @@
+'''
+Incremental loads of a live chain directory (evillens.load_chain_files):
+walkers that append rows before the others, are only touched, or are half
+way through writing a row must leave the cache as it was, and once every
+walker has caught up the cache must match a fresh load of the text files.
+
+usage:  python -m pytest tests/test_chain_io.py
+'''
+
+import os
+import shutil
+import tempfile
+import numpy as np
+import evillens as evil
+
+
+def write_rows(filename,rows,mode='a'):
+    with open(filename,mode) as f:
+        for row in rows:
+            f.write(' '.join(['{0:.17g}'.format(x) for x in row])+'\n')
+
+
+def test_incremental_load_with_lagging_walkers():
+    targetdir = tempfile.mkdtemp()+'/'
+    try:
+        rng = np.random.RandomState(1)
+        Nwalkers , Ncolumns = 4 , 3
+        chains = rng.normal(size=[Nwalkers,12,Ncolumns])
+        filenames = [targetdir+'chain_number_{0}'.format(i) for i in range(Nwalkers)]
+        for i in range(Nwalkers):
+            write_rows(filenames[i],chains[i,:5],'w')
+
+        loaded = evil.load_chain_files(targetdir,True,True,1)
+        assert np.array_equal(loaded,chains[:,:5])
+
+        # a walker only touched
+        os.utime(filenames[0],None)
+        loaded = evil.load_chain_files(targetdir,True,True,1)
+        assert np.array_equal(loaded,chains[:,:5])
+
+        # rows appended to some walkers only, and part of a row to another
+        for i in range(2):
+            write_rows(filenames[i],chains[i,5:8])
+        with open(filenames[2],'a') as f:
+            f.write('{0:.17g} '.format(chains[2,5,0]))
+        loaded = evil.load_chain_files(targetdir,True,True,1)
+        assert np.array_equal(loaded,chains[:,:5])
+
+        # the partial row finished, and the last walker one row in
+        with open(filenames[2],'a') as f:
+            f.write(' '.join(['{0:.17g}'.format(x) for x in chains[2,5,1:]])+'\n')
+        write_rows(filenames[3],chains[3,5:6])
+        loaded = evil.load_chain_files(targetdir,True,True,1)
+        assert np.array_equal(loaded,chains[:,:6])
+
+        # every walker caught up
+        write_rows(filenames[2],chains[2,6:12])
+        write_rows(filenames[3],chains[3,6:12])
+        for i in range(2):
+            write_rows(filenames[i],chains[i,8:12])
+        loaded = evil.load_chain_files(targetdir,True,True,1)
+        assert np.array_equal(loaded,chains)
+        assert np.array_equal(loaded,evil.load_chain_files(targetdir,False,False,1))
+    finally:
+        shutil.rmtree(targetdir)
+
+
+if __name__ == '__main__':
+    test_incremental_load_with_lagging_walkers()